@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/bench/bench_app.py
+#
+# WSGI entry point used by run_bench.py. The generated config.py selects the
+# embedded SQLite backend (DB_BACKEND = 'sqlite'), so this is simply the real
+# project app; the module exists to run it under the threaded werkzeug server
+# when gunicorn is not installed.
+#
+#   gunicorn --workers 3 bench_app:app
+#   python3 bench_app.py 127.0.0.1 5099      (werkzeug, threaded)
+
+import sys
+
+from app import app
+
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+    host = sys.argv[1] if len(sys.argv) > 1 else '127.0.0.1'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 5099
+    run_simple(host, port, app, threaded=True)
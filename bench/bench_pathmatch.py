@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/bench/bench_pathmatch.py
+#
+# Compares PathMatcher's old search (file_path LIKE '%title%' LIMIT 200) with
+# the in-memory trigram index in project/templates/path_index.py.
+#
+# A synthetic dr_who_master table is generated in SQLite (no MariaDB needed)
+# and every title is searched both ways. The report shows per-query latency
+# and how often the correct serial was found, with titles written the way
+# operators type them (different case, punctuation, episode numbering).
+#
+#   python3 bench/bench_pathmatch.py --paths 50000 --queries 300
+
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import sys
+import time
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'project', 'templates'))
+
+from path_index import PathIndex  # noqa: E402
+
+WORDS = ('dalek', 'master', 'plan', 'invasion', 'time', 'web', 'fear', 'space', 'war', 'games', 'tomb',
+         'cybermen', 'moon', 'base', 'seeds', 'doom', 'planet', 'spiders', 'city', 'death', 'robots',
+         'sontaran', 'experiment', 'genesis', 'android', 'keeper', 'traken', 'caves', 'androzani', 'the', 'of')
+LETTERS = 'aaabcdeeeefghiiijklmnooopqrsssttuuvwxyz'
+
+
+def make_vocabulary(rnd, size=5000):
+    """Real serial words plus made-up ones, so titles are mostly distinct."""
+    words = set(WORDS)
+    while len(words) < size:
+        words.add(''.join(rnd.choice(LETTERS) for _ in range(rnd.randint(3, 9))))
+    return sorted(words)
+
+
+def make_dataset(n_paths, seed=42):
+    """Return (rows, serials): rows are (id, file_path), serials the clean titles."""
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(rnd)
+    serials = []
+    while len(serials) < max(1, n_paths // 3):
+        words = rnd.sample(vocabulary, rnd.randint(2, 4))
+        serials.append(' '.join(w.capitalize() for w in words))
+    rows = []
+    row_id = 0
+    for number, serial in enumerate(serials, 1):
+        folder = f"/media/video/drwho/{number:03d} - {serial}"
+        for part in range(1, rnd.randint(2, 8)):
+            row_id += 1
+            style = rnd.choice((f"{serial} - Part {part}", f"{serial.replace(' ', '_')}.s{number % 30:02d}e{part:02d}",
+                                f"{number:03d} {serial.lower()} ep{part}"))
+            rows.append((row_id, f"{folder}/{style}.mkv"))
+            if len(rows) >= n_paths:
+                return rows, serials[:number]
+    return rows, serials
+
+
+def mangle(title, rnd):
+    """Write a title the way it tends to appear in newmedia.drwho."""
+    choice = rnd.randint(0, 3)
+    if choice == 0:
+        return title
+    if choice == 1:
+        return title.upper()
+    if choice == 2:
+        words = title.split()
+        return f"{words[0]}'s {' '.join(words[1:])}"
+    return title.replace(' ', '-') + ' (Part 1)'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='LIKE scan vs trigram index for PathMatcher.')
+    parser.add_argument('--paths', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--out', help='write the JSON summary here')
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(7)
+    rows, serials = make_dataset(args.paths)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE dr_who_master (id INTEGER PRIMARY KEY, file_path TEXT)')
+    conn.executemany('INSERT INTO dr_who_master VALUES (?, ?)', rows)
+
+    t0 = time.perf_counter()
+    index = PathIndex()
+    index.add_rows(rows)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    queries = [(serial, mangle(serial, rnd)) for serial in rnd.sample(serials, min(args.queries, len(serials)))]
+    like_ms, index_ms = [], []
+    like_found = index_found = 0
+    for serial, typed in queries:
+        t = time.perf_counter()
+        hits = conn.execute('SELECT id, file_path FROM dr_who_master WHERE file_path LIKE ? LIMIT 200',
+                            (f'%{typed}%',)).fetchall()
+        like_ms.append((time.perf_counter() - t) * 1000)
+        like_found += any(f' - {serial}/' in path for _id, path in hits)
+
+        t = time.perf_counter()
+        hits = index.search(typed, limit=200)
+        index_ms.append((time.perf_counter() - t) * 1000)
+        index_found += any(f' - {serial}/' in h['file_path'] for h in hits[:10])
+
+    summary = {
+        'paths': len(rows),
+        'queries': len(queries),
+        'index_build_ms': round(build_ms, 1),
+        'like': {'median_ms': round(statistics.median(like_ms), 3), 'max_ms': round(max(like_ms), 3),
+                 'found_pct': round(100.0 * like_found / len(queries), 1)},
+        'index': {'median_ms': round(statistics.median(index_ms), 3), 'max_ms': round(max(index_ms), 3),
+                  'found_in_top10_pct': round(100.0 * index_found / len(queries), 1)},
+    }
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
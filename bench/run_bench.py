@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/bench/run_bench.py
+#
+# Reproducible load test for the MainMenu app.
+#
+# Seeds a local SQLite database (bench/seed.py), starts the app against it
+# (gunicorn if installed, otherwise the threaded werkzeug server), then drives
+# /login, /menu, /gallery/, /gallery/<slug>/ and the image/thumbnail routes
+# from N concurrent clients. Per-route p50/p95/p99 latency, throughput and the
+# server's RSS are written as JSON and can be compared against a baseline:
+#
+#   python3 bench/run_bench.py --concurrency 8 --duration 30 --out bench/results/new.json
+#   python3 bench/run_bench.py --baseline bench/results/baseline.json
+#
+# The exit status is 1 when a route regressed by more than --tolerance.
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode, quote
+
+from werkzeug.utils import secure_filename
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+PROJECT_DIR = os.path.join(ROOT, 'project')
+sys.path.insert(0, BENCH_DIR)
+
+import seed  # noqa: E402
+
+CONFIG_TEMPLATE = """# generated by bench/run_bench.py
+DB_BACKEND = 'sqlite'
+SQLITE_PATH = %(db_path)r
+SECRET_KEY = 'bench-secret'
+METRICS_DIR = %(metrics_dir)r
+GALLERY_THUMBS_DIR = %(thumbs_dir)r
+SHARED_CACHE_DIR = %(shared_cache_dir)r
+"""
+
+
+# --- Server management ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def write_config(workdir, db_path):
+    """Write the app's config.py for a run into workdir/cfg and return that directory."""
+    cfg_dir = os.path.join(workdir, 'cfg')
+    os.makedirs(cfg_dir, exist_ok=True)
+    with open(os.path.join(cfg_dir, 'config.py'), 'w') as fh:
+        # thumbnails made during the run go to the work dir, not project/static,
+        # and a fresh shared cache makes sure they are really made
+        fh.write(CONFIG_TEMPLATE % {'db_path': db_path, 'metrics_dir': os.path.join(workdir, 'metrics'),
+                                    'thumbs_dir': os.path.join(workdir, 'thumbs'),
+                                    'shared_cache_dir': os.path.join(workdir, 'shared_cache')})
+    return cfg_dir
+
+
+def start_server(args, workdir, db_path, port):
+    """Start the app against the seeded DB and return the Popen handle."""
+    cfg_dir = write_config(workdir, db_path)
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([cfg_dir, PROJECT_DIR, BENCH_DIR, env.get('PYTHONPATH', '')])
+
+    if args.server == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'bench_app:app']
+    else:
+        cmd = [sys.executable, os.path.join(BENCH_DIR, 'bench_app.py'), '127.0.0.1', str(port)]
+    return subprocess.Popen(cmd, cwd=PROJECT_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'server.log'), 'w'))
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            conn.getresponse().read()
+            conn.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def process_tree_rss_kb(pid):
+    """RSS of pid plus all of its children (gunicorn workers), in kB, from /proc."""
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f'/proc/{p}/status') as fh:
+                for line in fh:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{p}/task/{p}/children') as fh:
+                pending.extend(int(c) for c in fh.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+
+# --- Client side ---
+
+def login(port, username):
+    """POST /login and return the session cookie ('name=value')."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    body = urlencode({'username': username, 'password': seed.BENCH_PASSWORD})
+    conn.request('POST', '/login', body=body, headers={'Content-Type': 'application/x-www-form-urlencoded'})
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    cookie = resp.getheader('Set-Cookie')
+    if resp.status != 302 or not cookie:
+        raise RuntimeError(f'login as {username} failed with status {resp.status}')
+    return cookie.split(';', 1)[0]
+
+
+def build_targets(images_per_gallery):
+    """List of (route label, method, path, body, authenticated) to cycle through."""
+    targets = [
+        ('GET /login', 'GET', '/login', None, False),
+        ('POST /login', 'POST', '/login', None, False),
+        ('GET /menu', 'GET', '/menu', None, True),
+        ('GET /gallery/', 'GET', '/gallery/', None, True),
+    ]
+    for slug in seed.gallery_slugs():
+        targets.append(('GET /gallery/<slug>/', 'GET', f'/gallery/{slug}/', None, True))
+        folder = os.path.join(seed.GALLERY_ROOT, slug)
+        # serve_image runs the name through secure_filename, so names it would
+        # rewrite (e.g. containing spaces) cannot be fetched; leave them out
+        files = sorted(f for f in os.listdir(folder)
+                       if f.lower().endswith(('.jpg', '.jpeg', '.png', '.gif', 'webp'))
+                       and secure_filename(f) == f)
+        for fname in files[:images_per_gallery]:
+            targets.append(('GET /gallery/<slug>/image/<filename>', 'GET',
+                            f'/gallery/{slug}/image/{quote(fname)}', None, True))
+            targets.append(('GET /gallery/thumbs/<filename>', 'GET',
+                            f'/gallery/thumbs/{quote(f"{slug}__{fname}")}', None, True))
+    return targets
+
+
+class Client(threading.Thread):
+    """One simulated user: a keep-alive connection cycling through the targets."""
+
+    def __init__(self, port, cookie, username, targets, offset, deadline, max_requests, results):
+        super().__init__(daemon=True)
+        self.port = port
+        self.cookie = cookie
+        self.login_body = urlencode({'username': username, 'password': seed.BENCH_PASSWORD})
+        self.targets = targets
+        self.offset = offset
+        self.deadline = deadline
+        self.max_requests = max_requests
+        self.results = results  # label -> {'lat': [...], 'errors': n}
+        self.conn = None
+
+    def _request(self, method, path, body, authenticated):
+        headers = {}
+        if authenticated:
+            headers['Cookie'] = self.cookie
+        if method == 'POST':
+            body = self.login_body
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        resp.read()
+        if resp.getheader('Connection', '').lower() == 'close':
+            self.conn.close()
+            self.conn = None
+        return resp.status
+
+    def run(self):
+        i = self.offset
+        done = 0
+        while time.monotonic() < self.deadline and (not self.max_requests or done < self.max_requests):
+            label, method, path, body, authenticated = self.targets[i % len(self.targets)]
+            i += 1
+            done += 1
+            bucket = self.results.setdefault(label, {'lat': [], 'errors': 0})
+            start = time.perf_counter()
+            try:
+                status = self._request(method, path, body, authenticated)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                ok = False
+                if self.conn is not None:
+                    self.conn.close()
+                self.conn = None
+            elapsed = time.perf_counter() - start
+            if ok:
+                bucket['lat'].append(elapsed)
+            else:
+                bucket['errors'] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(per_client, wall):
+    routes = {}
+    all_lat = []
+    errors = 0
+    for results in per_client:
+        for label, bucket in results.items():
+            r = routes.setdefault(label, {'lat': [], 'errors': 0})
+            r['lat'].extend(bucket['lat'])
+            r['errors'] += bucket['errors']
+    summary = {}
+    for label, r in sorted(routes.items()):
+        lat = sorted(r['lat'])
+        all_lat.extend(lat)
+        errors += r['errors']
+        summary[label] = route_stats(lat, r['errors'], wall)
+    return summary, route_stats(sorted(all_lat), errors, wall)
+
+
+def route_stats(lat, errors, wall):
+    ms = lambda v: round(v * 1000, 3) if v is not None else None  # noqa: E731
+    return {
+        'count': len(lat),
+        'errors': errors,
+        'p50_ms': ms(percentile(lat, 50)),
+        'p95_ms': ms(percentile(lat, 95)),
+        'p99_ms': ms(percentile(lat, 99)),
+        'throughput_rps': round(len(lat) / wall, 2) if wall else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table; return the list of regressed route labels."""
+    regressions = []
+    print(f"{'route':45} {'p95 base':>10} {'p95 new':>10} {'rps base':>10} {'rps new':>10}")
+    for label, new in sorted(results['routes'].items()):
+        old = baseline.get('routes', {}).get(label)
+        if not old:
+            print(f'{label:45} {"-":>10} {new["p95_ms"]!s:>10} {"-":>10} {new["throughput_rps"]:>10}')
+            continue
+        flag = ''
+        if old['p95_ms'] and new['p95_ms'] and new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            flag = '  <-- slower'
+        if old['throughput_rps'] and new['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+            flag = '  <-- slower'
+        if flag:
+            regressions.append(label)
+        print(f'{label:45} {old["p95_ms"]!s:>10} {new["p95_ms"]!s:>10} '
+              f'{old["throughput_rps"]:>10} {new["throughput_rps"]:>10}{flag}')
+    return regressions
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='site_starter_bench_')
+    db_path = os.path.join(workdir, 'bench.sqlite3')
+    seed.seed(db_path, users=max(args.users, args.concurrency))
+    port = free_port()
+    server = start_server(args, workdir, db_path, port)
+    try:
+        if not wait_ready(port):
+            raise RuntimeError(f'server did not start, see {workdir}/server.log')
+        targets = build_targets(args.images_per_gallery)
+
+        cookies = [login(port, f'bench{i}') for i in range(args.concurrency)]
+
+        # warm-up pass: generates thumbnails and fills any caches
+        warm = Client(port, cookies[0], 'bench0', targets, 0, time.monotonic() + 600, len(targets), {})
+        warm.run()
+
+        rss_samples = []
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.is_set():
+                rss_samples.append(process_tree_rss_kb(server.pid))
+                stop.wait(0.5)
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        per_client = [{} for _ in range(args.concurrency)]
+        start = time.monotonic()
+        deadline = start + args.duration
+        clients = [Client(port, cookies[i], f'bench{i}', targets, i * 7, deadline, args.requests, per_client[i])
+                   for i in range(args.concurrency)]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+        wall = time.monotonic() - start
+        stop.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    routes, overall = summarize(per_client, wall)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'server': args.server,
+            'workers': args.workers if args.server == 'gunicorn' else 1,
+            'concurrency': args.concurrency,
+            'duration_s': round(wall, 2),
+            'python': platform.python_version(),
+            'host': platform.node(),
+        },
+        'overall': overall,
+        'routes': routes,
+        'rss_kb': {
+            'max': max(rss_samples) if rss_samples else None,
+            'last': rss_samples[-1] if rss_samples else None,
+        },
+    }
+
+
+def main(argv=None):
+    try:
+        import gunicorn  # noqa: F401
+        default_server = 'gunicorn'
+    except ImportError:
+        default_server = 'werkzeug'
+
+    parser = argparse.ArgumentParser(description='Load-test the MainMenu app against a local SQLite DB.')
+    parser.add_argument('--concurrency', type=int, default=4, help='number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--requests', type=int, default=0, help='stop each client after this many requests (0 = no limit)')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'), default=default_server)
+    parser.add_argument('--workers', type=int, default=3, help='gunicorn workers (as in login.service)')
+    parser.add_argument('--users', type=int, default=50, help='generated users rows')
+    parser.add_argument('--images-per-gallery', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join(BENCH_DIR, 'results', 'latest.json'))
+    parser.add_argument('--baseline', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, 'w') as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+    o = results['overall']
+    print(f"{o['count']} requests, {o['errors']} errors, {o['throughput_rps']} req/s, "
+          f"p50 {o['p50_ms']} ms, p95 {o['p95_ms']} ms, p99 {o['p99_ms']} ms, "
+          f"max RSS {results['rss_kb']['max']} kB -> {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
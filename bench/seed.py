@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/bench/seed.py
+#
+# Builds the local benchmark database.
+#
+# The siteslinks rows come from siteslinks.sample.sql; users and galleries
+# are generated (one gallery row per folder under project/static/gallery).
+# Every generated user has the password BENCH_PASSWORD.
+#
+# Usage:
+#   python3 bench/seed.py bench/bench.sqlite3 --users 200
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+from werkzeug.security import generate_password_hash
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_SQL = os.path.join(ROOT, 'siteslinks.sample.sql')
+GALLERY_ROOT = os.path.join(ROOT, 'project', 'static', 'gallery')
+
+BENCH_PASSWORD = 'bench-password'
+
+SCHEMA = """
+CREATE TABLE siteslinks (
+    id INTEGER PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    link VARCHAR(255),
+    level VARCHAR(2),
+    comment TEXT
+);
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(64) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    firstname VARCHAR(64), lastname VARCHAR(64), address VARCHAR(255),
+    city VARCHAR(64), state VARCHAR(32), zipcode VARCHAR(16), birthday VARCHAR(16),
+    email VARCHAR(255), phone1 VARCHAR(32), phone2 VARCHAR(32), comment TEXT,
+    level TINYINT DEFAULT 1
+);
+CREATE TABLE access_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts DATETIME NOT NULL,
+    user_id INTEGER, username VARCHAR(64),
+    event VARCHAR(32) NOT NULL,
+    path VARCHAR(255), detail VARCHAR(255),
+    status SMALLINT, ip VARCHAR(45)
+);
+CREATE TABLE galleries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL,
+    slug VARCHAR(64) NOT NULL UNIQUE,
+    folder VARCHAR(255),
+    description TEXT,
+    public TINYINT DEFAULT 1
+);
+"""
+
+
+def sample_link_inserts(path=SAMPLE_SQL):
+    """Return the INSERT INTO `siteslinks` statements from the sample dump."""
+    with open(path, encoding='utf-8') as fh:
+        dump = fh.read()
+    return re.findall(r"INSERT INTO `siteslinks`.*?\);\s*$", dump, flags=re.S | re.M)
+
+
+def gallery_slugs():
+    """Folders under static/gallery (thumbs excluded), sorted."""
+    if not os.path.isdir(GALLERY_ROOT):
+        return []
+    return sorted(d for d in os.listdir(GALLERY_ROOT)
+                  if d != 'thumbs' and os.path.isdir(os.path.join(GALLERY_ROOT, d)))
+
+
+def seed(path, users=50):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    for stmt in sample_link_inserts():
+        conn.execute(stmt)
+
+    # one hash is enough: hashing is deliberately slow and the value is shared
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    conn.executemany(
+        "INSERT INTO users (username, password_hash, firstname, lastname, email, level) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f'bench{i}', password_hash, 'Bench', f'User{i}', f'bench{i}@example.com', 3 if i == 0 else 1 + i % 2)
+         for i in range(users)])
+
+    conn.executemany(
+        "INSERT INTO galleries (title, slug, folder, description, public) VALUES (?, ?, ?, ?, 1)",
+        [(slug.title(), slug, slug, f'Benchmark gallery {slug}') for slug in gallery_slugs()])
+    conn.commit()
+    conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Seed the local benchmark SQLite database.')
+    parser.add_argument('path', help='SQLite file to (re)create')
+    parser.add_argument('--users', type=int, default=50, help='number of generated users')
+    args = parser.parse_args(argv)
+    seed(args.path, args.users)
+    print(f'seeded {args.path}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/bench/startup_time.py
+#
+# Measures how long a fresh worker process needs before it can serve:
+# importing app.py (which runs create_app()) and answering the first
+# /login and /menu requests. Each run is a new interpreter, like a gunicorn
+# worker started without --preload. Uses the same SQLite setup as
+# run_bench.py, so no MariaDB is needed.
+#
+#   python3 bench/startup_time.py --runs 10
+#   python3 bench/startup_time.py --importtime     (slowest imports, one run)
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import seed  # noqa: E402
+from run_bench import PROJECT_DIR, write_config  # noqa: E402
+
+# Executed in the child interpreter; prints one JSON line with timings in ms
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/login')
+t2 = time.perf_counter()
+client.get('/menu')
+t3 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_login_ms': (t2 - t1) * 1000,
+                  'first_menu_ms': (t3 - t2) * 1000, 'total_ms': (t3 - t0) * 1000,
+                  'pil_loaded': 'PIL' in sys.modules, 'pymysql_loaded': 'pymysql' in sys.modules}))
+"""
+
+
+def make_env(workdir):
+    db_path = os.path.join(workdir, 'bench.sqlite3')
+    seed.seed(db_path, users=5)
+    cfg_dir = write_config(workdir, db_path)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([cfg_dir, PROJECT_DIR, env.get('PYTHONPATH', '')])
+    return env
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure worker start-up time of the MainMenu app.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--importtime', action='store_true', help='show the slowest imports (python -X importtime)')
+    parser.add_argument('--out', help='write the JSON summary here')
+    args = parser.parse_args(argv)
+
+    env = make_env(tempfile.mkdtemp(prefix='site_starter_startup_'))
+
+    if args.importtime:
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                              cwd=PROJECT_DIR, env=env, capture_output=True, text=True)
+        rows = []
+        for line in proc.stderr.splitlines():
+            parts = line.split('|')
+            if len(parts) == 3 and parts[1].strip().isdigit():
+                rows.append((int(parts[1]), parts[2].rstrip()))
+        for cumulative, name in sorted(rows, reverse=True)[:25]:
+            print(f'{cumulative / 1000:8.1f} ms  {name}')
+        return 0
+
+    runs = []
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, '-c', PROBE], cwd=PROJECT_DIR, env=env,
+                              capture_output=True, text=True, check=True)
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    summary = {key: round(statistics.median(r[key] for r in runs), 1)
+               for key in ('import_ms', 'first_login_ms', 'first_menu_ms', 'total_ms')}
+    summary['runs'] = len(runs)
+    summary['pil_loaded'] = runs[-1]['pil_loaded']
+    summary['pymysql_loaded'] = runs[-1]['pymysql_loaded']
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        with open(args.out, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
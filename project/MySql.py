@@ -6,143 +6,697 @@
 # translating the functionality found in the original PHP MyFunctions.php.
 # It adheres to modularity and securely retrieves database credentials from
 # the user-provided 'config.py' file.
+#
+# The actual database driver lives behind a small backend class. 'mysql'
+# (PyMySQL, the default) talks to MariaDB/MySQL; 'sqlite' is an embedded
+# in-process engine for development, CI and benchmark runs. Pick one with
+# DB_BACKEND in config.py. AsyncMySQL offers get_data/put_data as coroutines
+# for the optional ASGI mode (asgi.py).
 
-import pymysql
-import pymysql.cursors
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import re
+import sqlite3
 import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from circuit_breaker import DatabaseUnavailable, db_breaker
 
-# Initialize credential variables as None
+try:
+    import config
+except ImportError:
+    config = None
+
+# Initialize credential variables as None. They are filled in by
+# load_db_config() the first time a MySQL object is created, not at import
+# time, so importing this module stays cheap and never exits the process.
 DB_HOST = None
 DB_USER = None
 DB_PASSWORD = None
 DB_NAME = None
+DB_BACKEND = getattr(config, 'DB_BACKEND', 'mysql')
+SQLITE_PATH = getattr(config, 'SQLITE_PATH', None)
 
-try:
-    import config
+_config_loaded = False
 
-    # Attempt to load from mysql_config dictionary first
-    if hasattr(config, 'mysql_config') and isinstance(config.mysql_config, dict):
-        # Use .get() with a default of None to avoid KeyError if a key is missing
-        DB_HOST = config.mysql_config.get('host')
-        DB_USER = config.mysql_config.get('user')
-        DB_PASSWORD = config.mysql_config.get('password')
-        DB_NAME = config.mysql_config.get('database')
-
-    # If any credential is still None, try to load from individual variables as fallback
-    if DB_HOST is None and hasattr(config, 'SERVER'):
-        DB_HOST = config.SERVER
-    if DB_USER is None and hasattr(config, 'USER'):
-        DB_USER = config.USER
-    if DB_PASSWORD is None and hasattr(config, 'PASSWORD'):
-        DB_PASSWORD = config.PASSWORD
-    if DB_NAME is None and hasattr(config, 'DATABASE'):
-        DB_NAME = config.DATABASE
-
-    # Final validation: Ensure all critical credentials are not None
-    if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
-        raise ValueError("One or more required database credentials (host, user, password, database) are missing or incomplete in config.py.")
 
-except ImportError:
-    print("Error: config.py module not found.", file=sys.stderr)
-    print("Please ensure config.py exists in the same directory or is in your Python path.", file=sys.stderr)
-    sys.exit(1)
-except ValueError as e:
-    # Catch the specific ValueError we raised for missing credentials
-    print(f"Configuration Error: {e}", file=sys.stderr)
-    print("Please check your config.py file to ensure all required database credentials are properly defined.", file=sys.stderr)
-    sys.exit(1)
-except Exception:
-    # Catch any other unexpected errors during config loading, without printing the exception object
-    print("An unexpected error occurred while loading database configuration from config.py.", file=sys.stderr)
-    print("Please verify the syntax and content of your config.py file.", file=sys.stderr)
-    sys.exit(1)
+def load_db_config():
+    """
+    Reads and validates the database settings from config.py (once).
+    Exits the process with a clear message if they are missing or incomplete,
+    which happens at application start-up since create_app() builds the DB.
+    """
+    global DB_HOST, DB_USER, DB_PASSWORD, DB_NAME, _config_loaded
+    if _config_loaded:
+        return
+    try:
+        if config is None:
+            raise ImportError
 
+        # Attempt to load from mysql_config dictionary first
+        if hasattr(config, 'mysql_config') and isinstance(config.mysql_config, dict):
+            # Use .get() with a default of None to avoid KeyError if a key is missing
+            DB_HOST = config.mysql_config.get('host')
+            DB_USER = config.mysql_config.get('user')
+            DB_PASSWORD = config.mysql_config.get('password')
+            DB_NAME = config.mysql_config.get('database')
 
-class MySQL:
+        # If any credential is still None, try to load from individual variables as fallback
+        if DB_HOST is None and hasattr(config, 'SERVER'):
+            DB_HOST = config.SERVER
+        if DB_USER is None and hasattr(config, 'USER'):
+            DB_USER = config.USER
+        if DB_PASSWORD is None and hasattr(config, 'PASSWORD'):
+            DB_PASSWORD = config.PASSWORD
+        if DB_NAME is None and hasattr(config, 'DATABASE'):
+            DB_NAME = config.DATABASE
+
+        # Final validation: Ensure all critical credentials are not None
+        if DB_BACKEND == 'sqlite':
+            if not SQLITE_PATH:
+                raise ValueError("DB_BACKEND is 'sqlite' but SQLITE_PATH is not set in config.py.")
+        elif not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
+            raise ValueError("One or more required database credentials (host, user, password, database) are missing or incomplete in config.py.")
+
+    except ImportError:
+        print("Error: config.py module not found.", file=sys.stderr)
+        print("Please ensure config.py exists in the same directory or is in your Python path.", file=sys.stderr)
+        sys.exit(1)
+    except ValueError as e:
+        # Catch the specific ValueError we raised for missing credentials
+        print(f"Configuration Error: {e}", file=sys.stderr)
+        print("Please check your config.py file to ensure all required database credentials are properly defined.", file=sys.stderr)
+        sys.exit(1)
+    except Exception:
+        # Catch any other unexpected errors during config loading, without printing the exception object
+        print("An unexpected error occurred while loading database configuration from config.py.", file=sys.stderr)
+        print("Please verify the syntax and content of your config.py file.", file=sys.stderr)
+        sys.exit(1)
+    _config_loaded = True
+
+# Slow query log settings (all optional in config.py)
+# SLOW_QUERY_MS: queries taking longer than this are logged to stderr
+# SLOW_QUERY_EXPLAIN: also run EXPLAIN on slow SELECTs and keep the plan
+# SLOW_QUERY_TOP_N: size of the rolling summary shown at /metrics/slow-queries
+SLOW_QUERY_MS = float(getattr(config, 'SLOW_QUERY_MS', 200))
+SLOW_QUERY_EXPLAIN = bool(getattr(config, 'SLOW_QUERY_EXPLAIN', False))
+SLOW_QUERY_TOP_N = int(getattr(config, 'SLOW_QUERY_TOP_N', 20))
+
+# Schema metadata cache: the column and index catalog of the whole database is
+# loaded in one go and reused for SCHEMA_CACHE_TTL seconds (0 = until
+# refresh_schema() is called).
+SCHEMA_CACHE_TTL = float(getattr(config, 'SCHEMA_CACHE_TTL', 300))
+
+# Read replicas (mysql_replicas in config.py, passed in by app.py)
+# DB_READ_ROUTING: 'round_robin' or 'least_latency' across healthy replicas
+# DB_REPLICA_RETRY_SECONDS: how long a failed replica is left out of rotation
+DB_READ_ROUTING = getattr(config, 'DB_READ_ROUTING', 'round_robin')
+DB_REPLICA_RETRY_SECONDS = float(getattr(config, 'DB_REPLICA_RETRY_SECONDS', 30))
+
+# Network timeouts in seconds, so a stalled server fails a query quickly
+# instead of holding a worker until gunicorn kills it. SQLite uses
+# DB_WRITE_TIMEOUT as its busy timeout (how long to wait for a locked file).
+DB_CONNECT_TIMEOUT = float(getattr(config, 'DB_CONNECT_TIMEOUT', 5))
+DB_READ_TIMEOUT = float(getattr(config, 'DB_READ_TIMEOUT', 10))
+DB_WRITE_TIMEOUT = float(getattr(config, 'DB_WRITE_TIMEOUT', 10))
+
+# Connection pool of AsyncMySQL (the ASGI mode, see asgi.py): idle connections
+# kept open and the most that are open at once. Without aiomysql, or with the
+# sqlite backend, DB_ASYNC_POOL_MAX is the number of threads running queries.
+DB_ASYNC_POOL_MIN = int(getattr(config, 'DB_ASYNC_POOL_MIN', 1))
+DB_ASYNC_POOL_MAX = int(getattr(config, 'DB_ASYNC_POOL_MAX', 10))
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query_string):
     """
-    A class to encapsulate MySQL database operations using PyMySQL,
-    providing methods for connection, data retrieval, data insertion/update,
-    and schema information (field names, number of fields).
+    Reduces a query to its shape: literals and placeholders become '?' and
+    whitespace is collapsed, so the same statement with different values is
+    grouped together and no user data ends up in the log.
     """
+    sql = _STRING_LITERAL.sub('?', query_string)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
 
-    def __init__(self, host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME):
-        """
-        Initializes the MySQL connection parameters.
-        Parameters are defaulted to values from config.py for convenience.
-        """
+
+def redact_params(params):
+    """Describes query parameters by type only, never by value."""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [type(v).__name__ for v in params]
+    return [type(params).__name__]
+
+
+class SlowQueryLog:
+    """
+    Rolling summary of slow queries, grouped by normalized SQL.
+    Keeps at most max_entries distinct statements (the ones with the least
+    total time are dropped first) and reports the top N by total time.
+    """
+
+    def __init__(self, top_n=SLOW_QUERY_TOP_N, max_entries=200):
+        self.top_n = top_n
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def record(self, sql, elapsed_ms, rows, params, plan=None):
+        with self.lock:
+            entry = self.entries.get(sql)
+            if entry is None:
+                if len(self.entries) >= self.max_entries:
+                    victim = min(self.entries, key=lambda k: self.entries[k]['total_ms'])
+                    del self.entries[victim]
+                entry = {'sql': sql, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+                self.entries[sql] = entry
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['last_rows'] = rows
+            entry['last_params'] = params
+            entry['last_seen'] = time.time()
+            if plan is not None:
+                entry['plan'] = plan
+
+    def snapshot(self):
+        """Returns the top N entries by total time."""
+        with self.lock:
+            entries = [dict(e) for e in self.entries.values()]
+        entries.sort(key=lambda e: e['total_ms'], reverse=True)
+        return entries[:self.top_n]
+
+
+slow_query_log = SlowQueryLog()
+metrics.register_extra('slow_queries', slow_query_log.snapshot)
+
+
+def slow_query_summary():
+    """
+    Merges the slow query summaries of all gunicorn workers (via the metrics
+    snapshots) into one top N list ordered by total time.
+    """
+    merged = {}
+    for worker_entries in metrics.collect_extra('slow_queries'):
+        for e in worker_entries:
+            m = merged.get(e['sql'])
+            if m is None:
+                merged[e['sql']] = dict(e)
+                continue
+            m['count'] += e['count']
+            m['total_ms'] += e['total_ms']
+            m['max_ms'] = max(m['max_ms'], e['max_ms'])
+            if e.get('last_seen', 0) > m.get('last_seen', 0):
+                for k in ('last_rows', 'last_params', 'last_seen', 'plan'):
+                    if k in e:
+                        m[k] = e[k]
+    entries = sorted(merged.values(), key=lambda e: e['total_ms'], reverse=True)
+    for e in entries:
+        e['avg_ms'] = round(e['total_ms'] / e['count'], 3) if e['count'] else 0.0
+    return {'threshold_ms': SLOW_QUERY_MS, 'queries': entries[:SLOW_QUERY_TOP_N]}
+
+
+# --- Database backends ---
+#
+# A backend knows how to open a connection and how to hand out cursors that
+# accept %s placeholders and return rows as dicts. MySQL below only relies on
+# connect(), is_open(), cursor(), Error, is_outage() and load_schema(), so
+# another engine can be plugged in by adding a class with the same methods to
+# BACKENDS. is_outage(error) tells a server that is down or stalled (which
+# counts against the circuit breaker) from an ordinary failed statement.
+#
+# load_schema(cursor) returns the catalog of the whole database as
+# {table: {'columns': [{'name', 'type', 'nullable', 'key'}, ...],
+#          'indexes': {index_name: {'columns': [...], 'unique': bool}}}}
+# with columns in table order.
+
+
+def _new_table_entry():
+    return {'columns': [], 'indexes': {}}
+
+class PyMySQLBackend:
+    """MariaDB/MySQL through PyMySQL (the default)."""
+
+    name = 'mysql'
+    explain_prefix = "EXPLAIN "
+
+    def __init__(self, host=None, user=None, password=None, database=None):
+        # imported here so processes using the sqlite backend never load pymysql
+        import pymysql
+        import pymysql.cursors
+        self._pymysql = pymysql
+        self.Error = pymysql.Error
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
 
-    def _connect(self):
+    def connect(self):
+        return self._pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            read_timeout=DB_READ_TIMEOUT,
+            write_timeout=DB_WRITE_TIMEOUT,
+            # Ensure cursor returns dictionaries for easier data access by column name
+            cursorclass=self._pymysql.cursors.DictCursor
+        )
+
+    def is_outage(self, error):
+        # client-side codes (2000+: can't connect, server gone away, lost
+        # connection / timeout) and "too many connections"
+        if isinstance(error, self._pymysql.err.InterfaceError):
+            return True
+        code = error.args[0] if error.args and isinstance(error.args[0], int) else 0
+        return isinstance(error, self._pymysql.err.OperationalError) and (code >= 2000 or code == 1040)
+
+    def is_open(self, conn):
+        return conn.open
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def load_schema(self, cursor):
+        tables = {}
+        cursor.execute(
+            "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY"
+            " FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = %s"
+            " ORDER BY TABLE_NAME, ORDINAL_POSITION", (self.database,))
+        for row in cursor.fetchall():
+            tables.setdefault(row['TABLE_NAME'], _new_table_entry())['columns'].append({
+                'name': row['COLUMN_NAME'], 'type': row['COLUMN_TYPE'],
+                'nullable': row['IS_NULLABLE'] == 'YES', 'key': row['COLUMN_KEY'] or ''})
+        cursor.execute(
+            "SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE"
+            " FROM INFORMATION_SCHEMA.STATISTICS WHERE TABLE_SCHEMA = %s"
+            " ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX", (self.database,))
+        for row in cursor.fetchall():
+            index = tables.setdefault(row['TABLE_NAME'], _new_table_entry())['indexes'].setdefault(
+                row['INDEX_NAME'], {'columns': [], 'unique': not int(row['NON_UNIQUE'])})
+            index['columns'].append(row['COLUMN_NAME'])
+        return tables
+
+
+_SQLITE_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def translate_placeholders(query_string):
+    """Translates pymysql-style %s / %(name)s / %% into SQLite's ? / :name / %."""
+    def repl(m):
+        if m.group(1):
+            return ':' + m.group(1)
+        return '?' if m.group(0) == '%s' else '%'
+    return _SQLITE_PLACEHOLDER.sub(repl, query_string)
+
+
+class _SQLiteCursor:
+    """Wraps a sqlite3 cursor so it behaves like a PyMySQL DictCursor."""
+
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, query_string, params=None):
+        return self._cursor.execute(translate_placeholders(query_string), params or ())
+
+    def fetchall(self):
+        cols = [c[0] for c in self._cursor.description or ()]
+        return [dict(zip(cols, row)) for row in self._cursor.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+
+class SQLiteBackend:
+    """Embedded SQLite engine: in-process storage, no network round trips."""
+
+    name = 'sqlite'
+    Error = sqlite3.Error
+    explain_prefix = "EXPLAIN QUERY PLAN "
+
+    def __init__(self, path=None, **_ignored):
+        # extra keyword arguments (host, user, ...) are accepted and ignored so
+        # MySQL(**config.mysql_config) keeps working with this backend
+        self.path = path or SQLITE_PATH
+        self.database = 'main'
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=DB_WRITE_TIMEOUT)
+
+    def is_outage(self, error):
+        message = str(error)
+        return isinstance(error, sqlite3.OperationalError) and (
+            'locked' in message or 'unable to open' in message or 'disk I/O' in message)
+
+    def is_open(self, conn):
+        return conn is not None
+
+    def cursor(self, conn):
+        return _SQLiteCursor(conn)
+
+    def load_schema(self, cursor):
+        tables = {}
+        cursor.execute(
+            "SELECT m.name AS table_name, p.name, p.type, p.\"notnull\" AS not_null, p.pk"
+            " FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p"
+            " WHERE m.type IN ('table', 'view') AND m.name NOT LIKE 'sqlite_%%'"
+            " ORDER BY m.name, p.cid")
+        for row in cursor.fetchall():
+            tables.setdefault(row['table_name'], _new_table_entry())['columns'].append({
+                'name': row['name'], 'type': row['type'],
+                'nullable': not row['not_null'], 'key': 'PRI' if row['pk'] else ''})
+        cursor.execute(
+            "SELECT m.name AS table_name, l.name AS index_name, l.\"unique\" AS is_unique, i.name AS column_name"
+            " FROM sqlite_master AS m JOIN pragma_index_list(m.name) AS l"
+            " JOIN pragma_index_info(l.name) AS i"
+            " WHERE m.type = 'table' ORDER BY m.name, l.name, i.seqno")
+        for row in cursor.fetchall():
+            index = tables.setdefault(row['table_name'], _new_table_entry())['indexes'].setdefault(
+                row['index_name'], {'columns': [], 'unique': bool(row['is_unique'])})
+            index['columns'].append(row['column_name'])
+        return tables
+
+
+BACKENDS = {
+    'mysql': PyMySQLBackend,
+    'sqlite': SQLiteBackend,
+}
+
+
+def make_backend(name=None, **kwargs):
+    """Creates the backend named by `name` (default: DB_BACKEND from config.py)."""
+    name = name or DB_BACKEND
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB_BACKEND '{name}', expected one of: {', '.join(BACKENDS)}")
+    return backend_class(**kwargs)
+
+
+# Every MySQL object, so connections can be dropped in a forked child
+_instances = weakref.WeakSet()
+
+
+def _forget_connections_after_fork():
+    """
+    Runs in a freshly forked child (e.g. a gunicorn worker with --preload):
+    a connection object inherited from the parent shares its socket/file with
+    the parent, so the child must never use it. Start with empty slots.
+    """
+    for instance in list(_instances):
+        instance._reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_connections_after_fork)
+
+
+class _Node:
+    """
+    One database server (the primary or a read replica): its backend, a
+    connection slot per thread, a health flag and a moving average of its
+    query latency used by DB_READ_ROUTING = 'least_latency'.
+    """
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+        self.local = threading.local()
+        self.failed_until = 0.0
+        self.latency = 0.0  # seconds, exponentially weighted; 0 until measured
+
+    @property
+    def connection(self):
+        return getattr(self.local, 'connection', None)
+
+    @connection.setter
+    def connection(self, value):
+        self.local.connection = value
+
+    def healthy(self, now):
+        return now >= self.failed_until
+
+    def mark_failed(self):
+        # skipped by the read router until the retry delay has passed
+        self.failed_until = time.monotonic() + DB_REPLICA_RETRY_SECONDS
+
+    def record_latency(self, elapsed):
+        self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+
+
+class MySQL:
+    """
+    A class to encapsulate database operations, providing methods for
+    connection, data retrieval, data insertion/update, and schema information
+    (field names, number of fields). The driver is chosen by the backend
+    (PyMySQL by default, see DB_BACKEND).
+
+    Reads (get_data) can be spread over read replicas; writes (put_data) and
+    schema loads always go to the primary. After a write, every read on the
+    same thread goes to the primary until begin_request() is called, so a
+    request always sees its own writes even if the replicas lag behind.
+    """
+
+    def __init__(self, host=None, user=None, password=None, database=None, backend=None, replicas=None,
+                 breaker=None):
+        """
+        Initializes the connection parameters. No connection is opened here.
+        Parameters are defaulted to values from config.py for convenience.
+        `backend` may be a backend name ('mysql', 'sqlite') or a backend
+        instance; it defaults to DB_BACKEND from config.py.
+        `replicas` is a list of read replicas, each a backend instance or a
+        dict of connection settings (host, user, password, database, or path
+        for SQLite); settings a replica leaves out are taken from the primary.
+        `breaker` guards the primary; it defaults to the worker-wide
+        circuit_breaker.db_breaker shared with the other DB entry points.
+        """
+        load_db_config()
+        self.host = host if host is not None else DB_HOST
+        self.user = user if user is not None else DB_USER
+        self.password = password if password is not None else DB_PASSWORD
+        self.database = database if database is not None else DB_NAME
+        if backend is None or isinstance(backend, str):
+            backend = make_backend(backend, host=self.host, user=self.user,
+                                   password=self.password, database=self.database)
+        self.backend = backend
+        self.primary = _Node('primary', backend)
+        self.replicas = []
+        for i, replica in enumerate(replicas or ()):
+            if isinstance(replica, dict):
+                settings = dict(host=self.host, user=self.user, password=self.password, database=self.database)
+                settings.update(replica)
+                replica = make_backend(backend.name, **settings)
+            self.replicas.append(_Node(f'replica{i + 1}', replica))
+        self._round_robin = itertools.count()
+        self.breaker = breaker or db_breaker
+        # per-thread state: the read-your-writes flag
+        self._local = threading.local()
+        # schema catalog (see load_schema in the backends), shared by all threads
+        self._schema = None
+        self._schema_loaded_at = 0.0
+        self._schema_lock = threading.Lock()
+        _instances.add(self)
+
+    def _reset_after_fork(self):
+        self._local = threading.local()
+        for node in [self.primary] + self.replicas:
+            node.local = threading.local()
+
+    @property
+    def connection(self):
+        return self.primary.connection
+
+    @connection.setter
+    def connection(self, value):
+        self.primary.connection = value
+
+    def begin_request(self):
+        """
+        Forgets earlier writes on this thread so reads may use the replicas
+        again. app.py calls this before every request.
         """
-        Establishes a connection to the MySQL database using PyMySQL.
+        self._local.wrote = False
+
+    def _read_node(self):
+        """Picks the node for a read: a healthy replica, or the primary."""
+        if not self.replicas or getattr(self._local, 'wrote', False):
+            return self.primary
+        now = time.monotonic()
+        healthy = [node for node in self.replicas if node.healthy(now)]
+        if not healthy:
+            return self.primary
+        if DB_READ_ROUTING == 'least_latency':
+            return min(healthy, key=lambda node: node.latency)
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    def _connect(self, node=None):
+        """
+        Establishes a connection to the database through the backend.
         This is a private helper method, not intended for direct external use.
         Returns:
-            pymysql.connections.Connection: The database connection object.
+            The backend's database connection object.
         Raises:
-            pymysql.Error: If the connection fails.
+            backend.Error: If the connection fails (within DB_CONNECT_TIMEOUT).
         """
-        if self.connection and self.connection.open: # Check if connection is open
-            return self.connection
+        node = node or self.primary
+        if node.connection and node.backend.is_open(node.connection): # Check if connection is open
+            return node.connection
         try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                # Ensure cursor returns dictionaries for easier data access by column name
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            return self.connection
-        except pymysql.Error as e:
-            print(f"Error connecting to MySQL database. Please check credentials and database status: {e}", file=sys.stderr)
-            sys.exit(1) # Exit if critical connection fails
-
-    def _close(self):
+            node.connection = node.backend.connect()
+            return node.connection
+        except node.backend.Error as e:
+            # never exit from a request handler: the caller degrades instead
+            print(f"Error connecting to {node.backend.name} database ({node.name}). Please check credentials and database status: {e}", file=sys.stderr)
+            raise
+
+    def _close(self, node=None):
         """
         Closes the database connection if it is open.
         """
-        if self.connection and self.connection.open:
-            self.connection.close()
-            self.connection = None
+        node = node or self.primary
+        if node.connection and node.backend.is_open(node.connection):
+            try:
+                node.connection.close()
+            except node.backend.Error:
+                pass  # already broken (e.g. after a read timeout)
+        node.connection = None
+
+    def _record_outcome(self, node, error=None):
+        """Feeds the result of a primary call to the circuit breaker."""
+        if node is not self.primary:
+            return
+        if error is not None and node.backend.is_outage(error):
+            self.breaker.record_failure()
+        else:
+            # any answer from the server, even an SQL error, means it is up
+            self.breaker.record_success()
+
+    def _log_slow(self, cursor, query_string, params, elapsed, rows):
+        """
+        Logs a query that exceeded SLOW_QUERY_MS and records it in the rolling
+        summary. If SLOW_QUERY_EXPLAIN is set and a cursor is given, slow
+        SELECTs are EXPLAINed on the same connection and the plan is kept.
+        """
+        sql = normalize_sql(query_string)
+        elapsed_ms = elapsed * 1000
+        redacted = redact_params(params)
+        plan = None
+        if SLOW_QUERY_EXPLAIN and cursor is not None and sql.upper().startswith('SELECT'):
+            try:
+                cursor.execute(self.backend.explain_prefix + query_string, params)
+                plan = [dict(row) for row in cursor.fetchall()]
+            except self.backend.Error as e:
+                print(f"Error running EXPLAIN for slow query: {e}", file=sys.stderr)
+        print(f"Slow query ({elapsed_ms:.1f} ms, {rows} rows, params={redacted}): {sql}", file=sys.stderr)
+        slow_query_log.record(sql, elapsed_ms, rows, redacted, plan)
 
     # Removed the 'query' method as it's typically better to build queries directly
     # with parameters for get_data/put_data.
 
-    def get_data(self, query_string, params=None):
+    def _select(self, node, query_string, params):
+        """
+        Runs a SELECT on one node. Raises the backend's Error on failure, or
+        DatabaseUnavailable if the node is the primary and the breaker is open.
+        """
+        if node is self.primary:
+            self.breaker.check()
+        conn = None
+        outcome = 'ok'
+        start = time.perf_counter()
+        try:
+            conn = self._connect(node)
+            with node.backend.cursor(conn) as cursor:
+                cursor.execute(query_string, params)
+                data = cursor.fetchall()
+                elapsed = time.perf_counter() - start
+                node.record_latency(elapsed)
+                if elapsed * 1000 >= SLOW_QUERY_MS:
+                    self._log_slow(cursor, query_string, params, elapsed, len(data))
+            self._record_outcome(node)
+            return data
+        except node.backend.Error as e:
+            outcome = 'error'
+            self._record_outcome(node, e)
+            raise
+        except BaseException:
+            outcome = 'error'
+            if node is self.primary:
+                self.breaker.abandon()
+            raise
+        finally:
+            if conn:
+                self._close(node)
+            target = 'primary' if node is self.primary else 'replica'
+            metrics.observe('db_query_duration_seconds', time.perf_counter() - start, {'op': 'get_data', 'target': target})
+            metrics.inc('db_queries_total', {'op': 'get_data', 'outcome': outcome, 'target': target})
+
+    def get_data(self, query_string, params=None, raise_errors=False):
         """
         Executes a SELECT query and fetches all results.
         Supports parameterized queries for security.
+        The query runs on a replica when one is configured and healthy (and
+        this thread has not written since begin_request()); if the replica
+        fails it is taken out of rotation and the primary answers instead.
 
         Args:
             query_string (str): The SQL query string to execute (can contain %s placeholders).
             params (tuple, list, or dict, optional): Parameters to bind to the query. Defaults to None.
+            raise_errors (bool, optional): Raise DatabaseUnavailable instead of
+                returning [] when the query fails, so the caller can tell "no
+                rows" from "no database" and serve a degraded response.
 
         Returns:
             list[dict]: A list of dictionaries, where each dictionary represents a row
                         and keys are column names.
         """
-        data = []
-        conn = None
+        node = self._read_node()
+        if node is not self.primary:
+            try:
+                return self._select(node, query_string, params)
+            except node.backend.Error as e:
+                node.mark_failed()
+                metrics.inc('db_replica_fallbacks_total', {'replica': node.name})
+                print(f"Error executing query on {node.name}, falling back to the primary: {e}", file=sys.stderr)
         try:
-            conn = self._connect()
-            with conn.cursor() as cursor:
-                cursor.execute(query_string, params)
-                data = cursor.fetchall()
-        except pymysql.Error as e:
+            return self._select(self.primary, query_string, params)
+        except DatabaseUnavailable:
+            if raise_errors:
+                raise
+            return []
+        except self.backend.Error as e:
             print(f"Error executing query: {e}", file=sys.stderr)
-        finally:
-            if conn:
-                self._close()
-        return data
+            if raise_errors:
+                raise DatabaseUnavailable(str(e)) from e
+            return []
 
     def put_data(self, query_string, params=None):
         """
-        Executes an INSERT, UPDATE, or DELETE query.
+        Executes an INSERT, UPDATE, or DELETE query on the primary.
         Supports parameterized queries for security.
+        Later reads on this thread also go to the primary until the next
+        begin_request(), so they see this write.
 
         Args:
             query_string (str): The SQL query string to execute (can contain %s placeholders).
@@ -153,57 +707,314 @@ class MySQL:
         """
         success = False
         conn = None
+        start = time.perf_counter()
+        self._local.wrote = True
+        if not self.breaker.allow():
+            print("Error executing update/insert/delete query: database unavailable (circuit open)", file=sys.stderr)
+            metrics.inc('db_queries_total', {'op': 'put_data', 'outcome': 'rejected', 'target': 'primary'})
+            return False
         try:
             conn = self._connect()
-            with conn.cursor() as cursor:
+            with self.backend.cursor(conn) as cursor:
                 cursor.execute(query_string, params)
+                rows = cursor.rowcount
             conn.commit()
             success = True
-        except pymysql.Error as e:
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                self._log_slow(None, query_string, params, elapsed, rows)
+            self._record_outcome(self.primary)
+        except self.backend.Error as e:
             print(f"Error executing update/insert/delete query: {e}", file=sys.stderr)
+            self._record_outcome(self.primary, e)
             if conn:
-                conn.rollback()
+                try:
+                    conn.rollback()
+                except self.backend.Error:
+                    pass  # the connection itself is gone
+        except BaseException:
+            self.breaker.abandon()
+            raise
         finally:
             if conn:
                 self._close()
+            metrics.observe('db_query_duration_seconds', time.perf_counter() - start, {'op': 'put_data', 'target': 'primary'})
+            metrics.inc('db_queries_total', {'op': 'put_data', 'outcome': 'ok' if success else 'error', 'target': 'primary'})
         return success
 
+    # --- Schema metadata (cached) ---
+
+    def _schema_expired(self):
+        return SCHEMA_CACHE_TTL > 0 and time.monotonic() - self._schema_loaded_at >= SCHEMA_CACHE_TTL
+
+    def refresh_schema(self):
+        """
+        Reloads the column and index catalog of the whole database in one
+        pass. On failure the previous catalog (if any) is kept.
+        Returns:
+            dict: The catalog, {table: {'columns': [...], 'indexes': {...}}}.
+        """
+        with self._schema_lock:
+            if not self.breaker.allow():
+                return self._schema or {}
+            conn = None
+            start = time.perf_counter()
+            outcome = 'ok'
+            try:
+                conn = self._connect()
+                with self.backend.cursor(conn) as cursor:
+                    self._schema = self.backend.load_schema(cursor)
+                self._schema_loaded_at = time.monotonic()
+                self._record_outcome(self.primary)
+            except self.backend.Error as e:
+                outcome = 'error'
+                self._record_outcome(self.primary, e)
+                print(f"Error loading schema metadata: {e}", file=sys.stderr)
+            except BaseException:
+                self.breaker.abandon()
+                raise
+            finally:
+                if conn:
+                    self._close()
+                metrics.observe('db_query_duration_seconds', time.perf_counter() - start, {'op': 'load_schema', 'target': 'primary'})
+                metrics.inc('db_queries_total', {'op': 'load_schema', 'outcome': outcome, 'target': 'primary'})
+            return self._schema or {}
+
+    def get_schema(self, refresh=False):
+        """
+        Returns the cached catalog, loading it on first use, when it is older
+        than SCHEMA_CACHE_TTL, or when `refresh` is True.
+        """
+        schema = self._schema
+        if refresh or schema is None or self._schema_expired():
+            return self.refresh_schema()
+        return schema
+
+    def get_table_info(self, table):
+        """
+        Returns the catalog entry of `table` ({'columns': [...], 'indexes': {...}}),
+        or None if no such table exists. An unknown name triggers one reload
+        in case the table was created after the catalog was cached.
+        """
+        info = self.get_schema().get(table)
+        # reload at most once a second so a stream of bad names cannot hammer the catalog
+        if info is None and self._schema_loaded_at and time.monotonic() - self._schema_loaded_at >= 1.0:
+            info = self.refresh_schema().get(table)
+        return info
+
+    def has_table(self, table):
+        """
+        True if `table` exists. Use this to validate a table name before it is
+        put into SQL text (table names cannot be passed as query parameters).
+        """
+        return self.get_table_info(table) is not None
+
     def get_field_names(self, table):
         """
         Retrieves the names of all fields (columns) in a given table.
         """
-        field_names = []
-        conn = None
-        try:
-            conn = self._connect()
-            with conn.cursor() as cursor:
-                cursor.execute(f"SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_SCHEMA = '{self.database}' AND TABLE_NAME = '{table}' ORDER BY ORDINAL_POSITION")
-                for row in cursor.fetchall():
-                    field_names.append(row['COLUMN_NAME'])
-        except pymysql.Error as e:
-            print(f"Error getting field names for table '{table}': {e}", file=sys.stderr)
-        finally:
-            if conn:
-                self._close()
-        return field_names
+        info = self.get_table_info(table)
+        if info is None:
+            print(f"Error getting field names: unknown table '{table}'", file=sys.stderr)
+            return []
+        return [column['name'] for column in info['columns']]
 
     def get_num_fields(self, table):
         """
         Retrieves the number of fields (columns) in a given table.
         """
-        num_fields = -1
-        conn = None
+        info = self.get_table_info(table)
+        if info is None:
+            print(f"Error getting number of fields: unknown table '{table}'", file=sys.stderr)
+            return -1
+        return len(info['columns'])
+
+    def get_indexes(self, table):
+        """
+        Retrieves the indexes of a given table as {name: {'columns': [...], 'unique': bool}}.
+        """
+        info = self.get_table_info(table)
+        return dict(info['indexes']) if info is not None else {}
+
+class AsyncMySQL:
+    """
+    The asynchronous counterpart of MySQL for the ASGI mode (asgi.py), with
+    the same get_data/put_data contract as coroutines:
+
+        rows = await adb.get_data("SELECT ... WHERE id = %s", (user_id,))
+        ok = await adb.put_data("UPDATE ...", params)
+
+    With the 'mysql' backend and aiomysql installed, queries run on an
+    aiomysql connection pool (DB_ASYNC_POOL_MIN..DB_ASYNC_POOL_MAX
+    connections) without leaving the event loop; reads then always go to the
+    primary. Otherwise (the sqlite backend, or aiomysql missing) a regular
+    MySQL object runs them on a pool of DB_ASYNC_POOL_MAX threads, with its
+    replica routing. Either way the timeouts, circuit breaker, slow query log
+    and metrics are the same as for MySQL, and a request sees its own writes
+    (the flag lives in a context variable, i.e. per asyncio task).
+    """
+
+    def __init__(self, host=None, user=None, password=None, database=None, backend=None, replicas=None,
+                 breaker=None):
+        self.sync = MySQL(host, user, password, database, backend=backend, replicas=replicas, breaker=breaker)
+        self.backend = self.sync.backend
+        self.breaker = self.sync.breaker
+        self.driver = 'thread'
+        self._aiomysql = None
+        if self.backend.name == 'mysql':
+            try:
+                import aiomysql
+                self._aiomysql = aiomysql
+                self.driver = 'aiomysql'
+            except ImportError:
+                pass
+        self._pool = None
+        self._pool_lock = None
+        self._executor = None
+        self._wrote = contextvars.ContextVar('db_wrote', default=False)
+
+    def begin_request(self):
+        """Lets reads of the current task use the replicas again (see MySQL.begin_request)."""
+        self._wrote.set(False)
+
+    # --- aiomysql ---
+
+    async def _get_pool(self):
+        if self._pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await self._aiomysql.create_pool(
+                        host=self.sync.host, user=self.sync.user, password=self.sync.password,
+                        db=self.sync.database, minsize=DB_ASYNC_POOL_MIN, maxsize=DB_ASYNC_POOL_MAX,
+                        connect_timeout=DB_CONNECT_TIMEOUT, autocommit=True,
+                        cursorclass=self._aiomysql.DictCursor)
+        return self._pool
+
+    async def _execute(self, query_string, params, timeout, fetch):
+        """Runs one statement on a pooled connection; returns (rows or None, rowcount)."""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cursor:
+                    try:
+                        await asyncio.wait_for(cursor.execute(query_string, params), timeout)
+                    except asyncio.TimeoutError:
+                        # reported like PyMySQL's read timeout, so is_outage() counts it
+                        raise self.backend._pymysql.err.OperationalError(
+                            2013, f'Lost connection to MySQL server during query (timed out after {timeout}s)')
+                    rows = await cursor.fetchall() if fetch else None
+                    return rows, cursor.rowcount
+            except BaseException:
+                # never hand a connection with a half-read result back to the pool
+                conn.close()
+                raise
+
+    async def _select(self, query_string, params):
+        self.breaker.check()
+        outcome = 'ok'
+        start = time.perf_counter()
         try:
-            conn = self._connect()
-            with conn.cursor() as cursor:
-                cursor.execute(f"DESCRIBE {table}")
-                num_fields = cursor.rowcount
-        except pymysql.Error as e:
-            print(f"Error getting number of fields for table '{table}': {e}", file=sys.stderr)
+            data, _rowcount = await self._execute(query_string, params, DB_READ_TIMEOUT, True)
+            elapsed = time.perf_counter() - start
+            self.sync.primary.record_latency(elapsed)
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                self.sync._log_slow(None, query_string, params, elapsed, len(data))
+            self.sync._record_outcome(self.sync.primary)
+            return list(data)
+        except self.backend.Error as e:
+            outcome = 'error'
+            self.sync._record_outcome(self.sync.primary, e)
+            raise
+        except BaseException:  # e.g. the request was cancelled
+            outcome = 'error'
+            self.breaker.abandon()
+            raise
         finally:
-            if conn:
-                self._close()
-        return num_fields
+            metrics.observe('db_query_duration_seconds', time.perf_counter() - start, {'op': 'get_data', 'target': 'primary'})
+            metrics.inc('db_queries_total', {'op': 'get_data', 'outcome': outcome, 'target': 'primary'})
+
+    async def _write(self, query_string, params):
+        success = False
+        start = time.perf_counter()
+        if not self.breaker.allow():
+            print("Error executing update/insert/delete query: database unavailable (circuit open)", file=sys.stderr)
+            metrics.inc('db_queries_total', {'op': 'put_data', 'outcome': 'rejected', 'target': 'primary'})
+            return False
+        try:
+            # autocommit pool: the single statement is committed (or not) by the server
+            _rows, rowcount = await self._execute(query_string, params, DB_WRITE_TIMEOUT, False)
+            success = True
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 >= SLOW_QUERY_MS:
+                self.sync._log_slow(None, query_string, params, elapsed, rowcount)
+            self.sync._record_outcome(self.sync.primary)
+        except self.backend.Error as e:
+            print(f"Error executing update/insert/delete query: {e}", file=sys.stderr)
+            self.sync._record_outcome(self.sync.primary, e)
+        except BaseException:  # e.g. the request was cancelled
+            self.breaker.abandon()
+            raise
+        finally:
+            metrics.observe('db_query_duration_seconds', time.perf_counter() - start, {'op': 'put_data', 'target': 'primary'})
+            metrics.inc('db_queries_total', {'op': 'put_data', 'outcome': 'ok' if success else 'error', 'target': 'primary'})
+        return success
+
+    # --- thread pool around MySQL ---
+
+    def _run_sync(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=DB_ASYNC_POOL_MAX, thread_name_prefix='async-db')
+        return asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def _sync_get(self, wrote, query_string, params, raise_errors):
+        # the pool thread takes over the task's read-your-writes flag
+        self.sync._local.wrote = wrote
+        return self.sync.get_data(query_string, params, raise_errors)
+
+    # --- public API ---
+
+    async def get_data(self, query_string, params=None, raise_errors=False):
+        """
+        Executes a SELECT query and returns all rows as a list of dicts, like
+        MySQL.get_data: [] when the query fails, or DatabaseUnavailable with
+        raise_errors=True.
+        """
+        if self._aiomysql is None:
+            return await self._run_sync(self._sync_get, self._wrote.get(), query_string, params, raise_errors)
+        try:
+            return await self._select(query_string, params)
+        except DatabaseUnavailable:
+            if raise_errors:
+                raise
+            return []
+        except self.backend.Error as e:
+            print(f"Error executing query: {e}", file=sys.stderr)
+            if raise_errors:
+                raise DatabaseUnavailable(str(e)) from e
+            return []
+
+    async def put_data(self, query_string, params=None):
+        """
+        Executes an INSERT, UPDATE, or DELETE query on the primary, like
+        MySQL.put_data. Returns True if the query was successful.
+        """
+        self._wrote.set(True)
+        if self._aiomysql is None:
+            return await self._run_sync(self.sync.put_data, query_string, params)
+        return await self._write(query_string, params)
+
+    async def close(self):
+        """Closes the pool (or stops the threads); call on shutdown."""
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
 
 # Global helper functions (add_quotes_double, add_quotes_single)
 # are now largely redundant due to parameterized queries, but kept for direct translation reference.
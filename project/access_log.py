@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/access_log.py
+#
+# Audit log of who accessed what and when (the access_log table).
+#
+# Views call log_event(); the event is appended to an in-memory ring buffer
+# and the request carries on, no database work happens on the request path.
+# A background thread per worker writes the buffer in batches with one
+# multi-row INSERT, when ACCESS_LOG_BATCH events are waiting or every
+# ACCESS_LOG_FLUSH_SECONDS. The buffer holds at most ACCESS_LOG_CAPACITY
+# events; when it is full the oldest are dropped and counted, so a database
+# outage never grows a worker's memory. What is left is written when the
+# worker exits (atexit and gunicorn's worker_exit hook).
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import has_request_context, request, session
+
+import metrics
+
+try:
+    import config
+except ImportError:
+    config = None
+
+ACCESS_LOG_ENABLED = bool(getattr(config, 'ACCESS_LOG_ENABLED', True))
+ACCESS_LOG_CAPACITY = int(getattr(config, 'ACCESS_LOG_CAPACITY', 10000))
+ACCESS_LOG_BATCH = int(getattr(config, 'ACCESS_LOG_BATCH', 200))
+ACCESS_LOG_FLUSH_SECONDS = float(getattr(config, 'ACCESS_LOG_FLUSH_SECONDS', 2.0))
+
+COLUMNS = ('ts', 'user_id', 'username', 'event', 'path', 'detail', 'status', 'ip')
+
+
+class AccessLog:
+    """Bounded ring buffer of events plus the thread that writes them."""
+
+    def __init__(self, db=None, capacity=ACCESS_LOG_CAPACITY, batch_size=ACCESS_LOG_BATCH,
+                 flush_interval=ACCESS_LOG_FLUSH_SECONDS):
+        self.db = db
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._reset()
+
+    def _reset(self):
+        self.buffer = deque()
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def record(self, event, path=None, detail=None, status=None, user_id=None, username=None, ip=None):
+        """Queue one event; O(1) and never touches the database."""
+        row = (datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), user_id, username,
+               event, (path or '')[:255] or None, (detail or '')[:255] or None, status, ip)
+        with self.lock:
+            if len(self.buffer) >= self.capacity:
+                self.buffer.popleft()
+                self.dropped += 1
+                metrics.inc('access_log_dropped_total', {'reason': 'buffer_full'})
+            self.buffer.append(row)
+            pending = len(self.buffer)
+            if self.thread is None and self.db is not None and not self.stopping:
+                self._start()
+        metrics.inc('access_log_events_total', {'event': event})
+        if pending >= self.batch_size:
+            self.wake.set()
+
+    def _start(self):
+        # called with self.lock held; one writer thread per worker process
+        self.thread = threading.Thread(target=self._run, name='access-log-writer', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:  # keep the writer alive whatever happens
+                print(f"Error flushing access log: {e}", file=sys.stderr)
+
+    def _take(self):
+        with self.lock:
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+    def flush(self):
+        """Write everything buffered so far, one multi-row INSERT per batch."""
+        if self.db is None:
+            return 0
+        written = 0
+        with self.flush_lock:
+            while True:
+                rows = self._take()
+                if not rows:
+                    return written
+                placeholders = '(' + ', '.join(['%s'] * len(COLUMNS)) + ')'
+                query = (f"INSERT INTO access_log ({', '.join(COLUMNS)}) VALUES "
+                         + ', '.join([placeholders] * len(rows)))
+                params = [value for row in rows for value in row]
+                start = time.perf_counter()
+                ok = self.db.put_data(query, params)
+                metrics.observe('access_log_flush_duration_seconds', time.perf_counter() - start)
+                if not ok:
+                    # the database is down or rejected the batch; do not retry
+                    # forever, the buffer must stay bounded
+                    with self.lock:
+                        self.dropped += len(rows)
+                    metrics.inc('access_log_dropped_total', {'reason': 'write_failed'}, len(rows))
+                    return written
+                written += len(rows)
+
+    def shutdown(self, timeout=5.0):
+        """Stop the writer thread and flush what is left (worker exit)."""
+        self.stopping = True
+        self.wake.set()
+        thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self.lock:
+            return {'buffered': len(self.buffer), 'dropped': self.dropped, 'capacity': self.capacity}
+
+
+access_log = AccessLog()
+
+
+def log_event(event, detail=None, status=None):
+    """Record `event` for the current request and user (no-op when disabled)."""
+    if not ACCESS_LOG_ENABLED:
+        return
+    if has_request_context():
+        access_log.record(event, path=request.path, detail=detail, status=status,
+                          user_id=session.get('user_id'), username=session.get('username'),
+                          ip=request.remote_addr)
+    else:
+        access_log.record(event, detail=detail, status=status)
+
+
+def init_access_log(app, db):
+    """Give the access log its database; events are written through db.put_data."""
+    access_log.db = db
+
+
+def _reset_after_fork():
+    # events buffered by the parent are the parent's to write
+    access_log._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+atexit.register(access_log.shutdown)
@@ -14,47 +14,95 @@ from MySql import MySQL
 import config
 import menu_view
 import gallery
+import metrics_view
+import profiler
+import assets
 from auth import init_auth, login_required
 from auth_api import auth_api_bp
+from access_log import init_access_log
+from thumb_cache import init_thumb_cache
 import os
 from flask import send_from_directory
 
-app = Flask(__name__)
-app.secret_key = config.SECRET_KEY
-
-# Session configuration for cross-subdomain authentication
-# This allows login.your_domain session to be shared with media.your_domain
-app.config['SESSION_COOKIE_NAME'] = 'your_session'
-app.config['SESSION_COOKIE_DOMAIN'] = '.your_domain'
-app.config['SESSION_COOKIE_PATH'] = '/'
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['SESSION_COOKIE_SECURE'] = False  # Set to False for HTTP, True for HTTPS
-
-db = MySQL(**config.mysql_config)
-# initialize auth blueprint and give it the db instance
-init_auth(app, db)
-# expose DB to blueprints via app.config
-app.config['DB'] = db
-# register menu blueprint
-app.register_blueprint(menu_view.menu_bp)
-# register gallery blueprint
-app.register_blueprint(gallery.gallery_bp)
-# register auth API blueprint for external apps (like mediaplayer)
-app.register_blueprint(auth_api_bp)
+from jinja2 import FileSystemBytecodeCache
 
 # Serve bundled Highslide assets from the project `highslide/` directory.
 # This keeps the original vendor files where they are but makes them
-# available under the URL path `/highslide/...` so templates can load them.
+# available under the URL path `/highslide/...`. Templates normally load the
+# built, compressed copies from /assets/ (see assets.py); this route is the
+# fallback for files that have not been built.
 HS_DIR = os.path.join(os.path.dirname(__file__), 'highslide')
 
+# Compiled templates are cached on disk so new workers skip Jinja compilation.
+# Without JINJA_CACHE_DIR, Jinja uses a per-user directory in /tmp that it
+# creates with mode 0700 and refuses to use if another user owns it.
+JINJA_CACHE_DIR = getattr(config, 'JINJA_CACHE_DIR', None)
+
+
+def create_app():
+    """Build and configure the Flask application.
+
+    Nothing here opens a database connection or a file handle that would be
+    inherited by forked gunicorn workers, so it is safe to run once in the
+    master with --preload (see gunicorn.conf.py); connections are opened
+    lazily per request by MySql.MySQL.
+    """
+    app = Flask(__name__)
+    app.secret_key = config.SECRET_KEY
+
+    # Session configuration for cross-subdomain authentication
+    # This allows login.your_domain session to be shared with media.your_domain
+    app.config['SESSION_COOKIE_NAME'] = 'your_session'
+    app.config['SESSION_COOKIE_DOMAIN'] = '.your_domain'
+    app.config['SESSION_COOKIE_PATH'] = '/'
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['SESSION_COOKIE_SECURE'] = False  # Set to False for HTTP, True for HTTPS
+
+    # must be set before app.jinja_env is first used
+    if JINJA_CACHE_DIR:
+        os.makedirs(JINJA_CACHE_DIR, mode=0o700, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR))
+
+    # request timing / DB / thumbnail instrumentation, exposed on /metrics (level 3)
+    # registered first so its hooks wrap everything else
+    metrics_view.init_metrics(app)
+    # opt-in per-request profiler for level 3 users (?_profile=html or ?_profile=prof)
+    profiler.init_profiler(app)
+
+    # content-hashed, precompressed static/ and highslide/ files under /assets/,
+    # linked from templates with asset_url()
+    assets.init_assets(app)
+
+    # the backend (MariaDB via pymysql, or embedded SQLite) is picked by config.DB_BACKEND;
+    # reads are spread over config.mysql_replicas when any are listed
+    db = MySQL(**getattr(config, 'mysql_config', {}), replicas=getattr(config, 'mysql_replicas', None))
+    # each request starts reading from the replicas again (see MySQL.begin_request)
+    app.before_request(db.begin_request)
+    # initialize auth blueprint and give it the db instance
+    init_auth(app, db)
+    # audit log of logins, menu and gallery views, written in batches in the background
+    init_access_log(app, db)
+    # thumbnails served from memory; each worker pre-warms the most viewed galleries
+    init_thumb_cache(app, db)
+    # expose DB to blueprints via app.config
+    app.config['DB'] = db
+    # register menu blueprint
+    app.register_blueprint(menu_view.menu_bp)
+    # register gallery blueprint
+    app.register_blueprint(gallery.gallery_bp)
+    # register auth API blueprint for external apps (like mediaplayer)
+    app.register_blueprint(auth_api_bp)
+
+    app.add_url_rule('/highslide/<path:filename>', 'highslide_static', highslide_static)
+    app.add_url_rule('/', 'home', home)
+    return app
+
 
-@app.route('/highslide/<path:filename>')
 def highslide_static(filename):
     return send_from_directory(HS_DIR, filename)
 
 # --- User Routes (Unchanged) ---
-@app.route('/')
 def home():
     from flask import session, redirect, url_for
     if session.get('IFLOGED_IN') or session.get('user_id'):
@@ -62,5 +110,9 @@ def home():
     return redirect(url_for('auth.login'))
 
 
+# module-level instance for `gunicorn app:app` and `python3 ./app.py`
+app = create_app()
+
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5056, debug=True)
@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/asgi.py
+#
+# Optional asynchronous serving mode. One process serves hundreds of
+# concurrent clients instead of one per gunicorn sync worker:
+#
+#   uvicorn asgi:application --host 127.0.0.1 --port 5056
+#   GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker gunicorn -c gunicorn.conf.py asgi:application
+#
+# The endpoints that mostly wait are answered on the event loop itself:
+#   - the auth API (/api/auth/status, check, username, verify), polled by the
+#     other apps and by nginx's auth_request; the session cookie is decoded
+#     with the Flask app's own session interface and secret and answered
+#     from it alone, like auth_api.py;
+#   - gallery images and thumbnails, streamed in chunks that are read on a
+#     thread pool (ASGI_IO_THREADS), thumbnails from the in-memory cache.
+# Every other request (login, menu, gallery pages, metrics, ...) goes to the
+# unchanged Flask app on a pool of ASGI_WSGI_THREADS threads, so the password
+# hashing of the login form, making missing thumbnails for a gallery page and
+# template rendering do not block the loop either. Anything the native
+# handlers cannot answer exactly like Flask (missing files, Range requests,
+# other methods) is passed to Flask too.
+#
+# The bridge to Flask is a plain PEP 3333 call built on asgiref's public
+# sync_to_async / async_to_sync, so it does not depend on asgiref internals.
+#
+# Needs asgiref and an ASGI server (uvicorn). None of the native handlers
+# above needs the database. MySql.AsyncMySQL (aiomysql optional) is there for
+# one that would; it is created once per process, and every request starts
+# with begin_request():
+#
+#     adb = AsyncMySQL(**config.mysql_config, replicas=getattr(config, 'mysql_replicas', None))
+#
+#     async def user_count(self, scope, send, match):
+#         adb.begin_request()
+#         rows = await adb.get_data("SELECT COUNT(*) AS n FROM users")
+#         return await self.respond_json(send, {'users': rows[0]['n'] if rows else None})
+#
+# and closed in lifespan.shutdown with `await adb.close()`.
+
+import asyncio
+import json
+import mimetypes
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync, sync_to_async
+from itsdangerous import BadSignature
+from werkzeug.http import http_date, parse_cookie, parse_date
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+import gallery
+import metrics
+import uploads
+from access_log import ACCESS_LOG_ENABLED, access_log
+from thumb_cache import thumb_cache
+
+try:
+    import config
+except ImportError:
+    config = None
+
+ASGI_WSGI_THREADS = int(getattr(config, 'ASGI_WSGI_THREADS', 16))
+ASGI_IO_THREADS = int(getattr(config, 'ASGI_IO_THREADS', 8))
+
+CHUNK_SIZE = 256 * 1024
+# Request bodies larger than this are spooled to a temporary file
+_BODY_IN_MEMORY = 1024 * 1024
+
+
+def _wsgi_environ(scope, body):
+    """The PEP 3333 environ of an ASGI http request, with `body` as wsgi.input."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 0),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = client[0], str(client[1])
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ:
+            value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+        environ[name] = value
+    return environ
+
+
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _not_modified(scope, etag, mtime):
+    if_none_match = _header(scope, b'if-none-match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in if_none_match
+    if_modified_since = parse_date(_header(scope, b'if-modified-since'))
+    return bool(if_modified_since and if_modified_since.timestamp() >= int(mtime))
+
+
+class AsyncApp:
+    """ASGI application: native handlers for the waiting endpoints, Flask for the rest."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        # (path pattern, handler, blueprint, Flask rule used as the metrics route label)
+        self.routes = [
+            (re.compile(r'/api/auth/(status|check|username|verify)'), self.auth_api, 'auth_api', None),
+            (re.compile(r'/gallery/(?P<slug>[^/]+)/image/(?P<filename>.+)'), self.serve_image, 'gallery',
+             '/gallery/<slug>/image/<path:filename>'),
+            (re.compile(r'/gallery/thumbs/(?P<filename>.+)'), self.serve_thumb, 'gallery',
+             '/gallery/thumbs/<path:filename>'),
+        ]
+        self._wsgi_pool = None
+        self._io_pool = None
+
+    # --- executors (created in the serving process, after any fork) ---
+
+    @property
+    def wsgi_pool(self):
+        if self._wsgi_pool is None:
+            self._wsgi_pool = ThreadPoolExecutor(ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+        return self._wsgi_pool
+
+    @property
+    def io_pool(self):
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(ASGI_IO_THREADS, thread_name_prefix='file-io')
+        return self._io_pool
+
+    # --- ASGI entry point ---
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            path = scope['path'][len(scope.get('root_path', '')):] if scope.get('root_path') else scope['path']
+            for pattern, handler, blueprint, rule in self.routes:
+                match = pattern.fullmatch(path)
+                if match:
+                    if await self.run_native(handler, blueprint, rule or path, scope, send, match):
+                        return
+                    break
+        await self.flask(scope, receive, send)
+
+    async def flask(self, scope, receive, send):
+        """Runs the Flask app for this request on the WSGI thread pool."""
+        body = tempfile.SpooledTemporaryFile(max_size=_BODY_IN_MEMORY)
+        with body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return  # the client went away before sending the whole request
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            # thread_sensitive=False: the default would run every request on one shared thread
+            run = sync_to_async(self.run_wsgi, thread_sensitive=False, executor=self.wsgi_pool)
+            await run(_wsgi_environ(scope, body), async_to_sync(send))
+
+    def run_wsgi(self, environ, send):
+        """Calls the Flask app on a WSGI thread; `send` is the ASGI send made synchronous."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return write
+
+        def write(data):
+            if not response.get('started'):
+                send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+                response['started'] = True
+            if data:
+                send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        result = self.flask_app(environ, start_response)
+        try:
+            for chunk in result:
+                write(chunk)
+            write(b'')  # an empty body still needs the response start
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        send({'type': 'http.response.body', 'body': b''})
+
+    async def run_native(self, handler, blueprint, route, scope, send, match):
+        """Runs a native handler with the same request metrics as the Flask hooks."""
+        start = time.perf_counter()
+        metrics.gauge_add('http_requests_in_flight', 1)
+        try:
+            status = await handler(scope, send, match)
+        finally:
+            metrics.gauge_add('http_requests_in_flight', -1)
+        if status is not None:
+            labels = {'route': route, 'method': scope['method'], 'blueprint': blueprint}
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - start, labels)
+            metrics.inc('http_requests_total', {'route': route, 'method': scope['method'], 'status': str(status)})
+        metrics.flush()
+        return status is not None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in (self._wsgi_pool, self._io_pool):
+                    if pool is not None:
+                        pool.shutdown(wait=False)
+                uploads.shutdown()
+                access_log.shutdown()
+                metrics.retire()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- helpers ---
+
+    def session(self, scope):
+        """The Flask session of this request, read-only ({} if none or invalid)."""
+        cookie = _header(scope, b'cookie')
+        if not cookie:
+            return {}
+        value = parse_cookie(cookie).get(self.flask_app.config['SESSION_COOKIE_NAME'])
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        if not value or serializer is None:
+            return {}
+        try:
+            return serializer.loads(value, max_age=int(self.flask_app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+    def log_event(self, scope, session, event, detail=None):
+        if ACCESS_LOG_ENABLED:
+            client = scope.get('client') or (None,)
+            access_log.record(event, path=scope['path'], detail=detail, user_id=session.get('user_id'),
+                              username=session.get('username'), ip=client[0])
+
+    @staticmethod
+    async def respond(send, status, body=b'', headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def respond_json(self, send, data):
+        body = (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+        await self.respond(send, 200, body, [('Content-Type', 'application/json'),
+                                             ('Content-Length', str(len(body))), ('Vary', 'Cookie')])
+        return 200
+
+    async def send_file(self, scope, send, path):
+        """Streams a file like send_from_directory; None if it cannot be opened."""
+        loop = asyncio.get_running_loop()
+        try:
+            fh = await loop.run_in_executor(self.io_pool, open, path, 'rb')
+        except OSError:
+            return None
+        try:
+            st = os.fstat(fh.fileno())
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            headers = [('ETag', etag), ('Last-Modified', http_date(st.st_mtime)), ('Cache-Control', 'no-cache')]
+            if _not_modified(scope, etag, st.st_mtime):
+                await self.respond(send, 304, headers=headers)
+                return 304
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            headers += [('Content-Type', mimetype), ('Content-Length', str(st.st_size)), ('Accept-Ranges', 'bytes')]
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+            if scope['method'] != 'HEAD':
+                while True:
+                    chunk = await loop.run_in_executor(self.io_pool, fh.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+            return 200
+        finally:
+            fh.close()
+
+    # --- native handlers: return the status sent, or None to let Flask answer ---
+
+    async def auth_api(self, scope, send, match):
+        session = self.session(scope)
+        logged_in = bool(session.get('user_id') or session.get('IFLOGED_IN'))
+        endpoint = match.group(1)
+        if endpoint == 'check':
+            return await self.respond_json(send, {'logged_in': logged_in})
+        if endpoint == 'username':
+            return await self.respond_json(send, {'username': session.get('username')})
+        if endpoint == 'status':
+            return await self.respond_json(send, {'logged_in': logged_in, 'username': session.get('username'),
+                                                  'user_id': session.get('user_id'),
+                                                  'level': session.get('level', 0)})
+        # verify: see auth_api.auth_verify
+        try:
+            min_level = int(parse_qs(scope['query_string'].decode('latin-1')).get('min_level', ['1'])[0])
+        except ValueError:
+            min_level = 1
+        try:
+            level = int(session.get('level', 0) or 0) if logged_in else 0
+        except (TypeError, ValueError):
+            level = 0
+        if level >= min_level:
+            status = 204
+        else:
+            status = 401 if not logged_in else 403
+        await self.respond(send, status, headers=[('Content-Length', '0'), ('X-Auth-Level', str(level)),
+                                                  ('X-Auth-User', session.get('username') or ''),
+                                                  ('Cache-Control', 'no-store'), ('Vary', 'Cookie')])
+        return status
+
+    async def serve_image(self, scope, send, match):
+        if _header(scope, b'range'):
+            return None
+        loop = asyncio.get_running_loop()
+        folder = await loop.run_in_executor(self.io_pool, gallery.get_gallery_folder, match.group('slug'))
+        safe = secure_filename(match.group('filename'))
+        if not folder or not safe:
+            return None
+        status = await self.send_file(scope, send, os.path.join(folder, safe))
+        if status is not None:
+            self.log_event(scope, self.session(scope), 'image', detail=f"{match.group('slug')}/{safe}")
+        return status
+
+    async def serve_thumb(self, scope, send, match):
+        if _header(scope, b'range'):
+            return None
+        filename = match.group('filename')
+        path = safe_join(gallery.THUMBS_DIR, filename)
+        if path is None:
+            return None
+        # from memory once warm (see thumb_cache.py); loading or revalidating
+        # an entry reads the disk, so that part runs on the I/O threads
+        loop = asyncio.get_running_loop()
+        entry = thumb_cache.peek(filename) or await loop.run_in_executor(self.io_pool, thumb_cache.get, filename)
+        if entry is None:
+            # too large to cache, or missing: like gallery.serve_thumb, a
+            # missing thumbnail is not made here (Flask answers the 404)
+            return await self.send_file(scope, send, path)
+        etag = f'"{entry.etag}"'
+        headers = [('ETag', etag), ('Last-Modified', http_date(entry.last_modified)), ('Cache-Control', 'no-cache')]
+        if _not_modified(scope, etag, entry.last_modified):
+            await self.respond(send, 304, headers=headers)
+            return 304
+        headers += [('Content-Type', entry.mimetype), ('Content-Length', str(entry.size))]
+        await self.respond(send, 200, b'' if scope['method'] == 'HEAD' else entry.data, headers)
+        return 200
+
+
+def create_asgi_app(flask_app=None):
+    if flask_app is None:
+        from app import app as flask_app
+    return AsyncApp(flask_app)
+
+
+application = create_asgi_app()
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/assets.py
+#
+# Build-and-serve pipeline for the front-end assets in static/ and highslide/.
+#
+#   python3 assets.py            # build (also done at start-up when stale)
+#
+# The build copies every asset to ASSETS_DIR under a content-hashed name
+# (styles.css -> static/styles.3f9c2a1b7d4e.css), rewrites url(...)
+# references inside stylesheets to the hashed names, and writes a gzip and,
+# when the optional brotli package is installed, a brotli copy of every
+# compressible file once. manifest.json maps logical names to the hashed
+# ones. Unhashed copies are kept as well for files that scripts load by name
+# at runtime (Highslide builds its graphics URLs from hs.graphicsDir).
+#
+# /assets/<path> serves the build, picking the .br or .gz copy according to
+# Accept-Encoding. Hashed names never change content, so they are served as
+# immutable for a year; unhashed ones are revalidated. Templates link assets
+# with asset_url('static/styles.css'), which falls back to the plain static
+# routes for anything that has not been built (for example when the
+# highslide/ vendor directory is not installed).
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+
+from flask import Blueprint, abort, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+try:
+    import config
+except ImportError:
+    config = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = getattr(config, 'ASSETS_DIR', None) or os.path.join(BASE_DIR, 'build', 'assets')
+# Rebuild at application start-up when a source file changed since the last build
+ASSETS_AUTO_BUILD = bool(getattr(config, 'ASSETS_AUTO_BUILD', True))
+
+# logical prefix -> (source directory, endpoint serving the unbuilt file, subdirectories to skip)
+SOURCES = {
+    'static': (os.path.join(BASE_DIR, 'static'), 'static', ('gallery',)),
+    'highslide': (os.path.join(BASE_DIR, 'highslide'), 'highslide_static', ()),
+}
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.htm', '.json', '.txt', '.xml', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=300, must-revalidate'
+
+_CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+assets_bp = Blueprint('assets', __name__)
+
+# The manifest of the current build:
+# {'stamp': ..., 'assets': {logical: {'path': hashed, 'encodings': [...]}}}
+_manifest = {'stamp': None, 'assets': {}}
+_hashed = set()  # hashed output paths, served as immutable
+
+
+def _source_files():
+    """Yield (logical name, absolute path) for every source asset."""
+    for prefix, (root, _endpoint, skip) in SOURCES.items():
+        if not os.path.isdir(root):
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [d for d in dirnames if d not in skip]
+            for name in filenames:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, root).replace(os.sep, '/')
+                yield f'{prefix}/{rel}', path
+
+
+def source_stamp():
+    """Cheap fingerprint of the sources: file count plus newest mtime and total size."""
+    count = newest = total = 0
+    for _logical, path in _source_files():
+        st = os.stat(path)
+        count += 1
+        newest = max(newest, st.st_mtime_ns)
+        total += st.st_size
+    return f'{count}:{newest}:{total}'
+
+
+def _hashed_name(logical, data):
+    stem, ext = posixpath.splitext(logical)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path, data):
+    # write-then-rename so a worker never serves a half written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _rewrite_css(logical, data, assets):
+    """Point url(...) references at the hashed names of assets already built."""
+    base = posixpath.dirname(logical)
+
+    def repl(m):
+        ref = m.group(2).strip()
+        if ref.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return m.group(0)
+        path, sep, suffix = ref.partition('?')
+        target = assets.get(posixpath.normpath(posixpath.join(base, path)))
+        if target is None:
+            return m.group(0)
+        rel = posixpath.relpath(target['path'], base)
+        return f'url({m.group(1)}{rel}{sep}{suffix}{m.group(1)})'
+
+    return _CSS_URL.sub(repl, data.decode('utf-8')).encode('utf-8')
+
+
+def build(out_dir=None):
+    """Build every asset into out_dir (default ASSETS_DIR) and return the manifest."""
+    out_dir = out_dir or ASSETS_DIR
+    try:
+        import brotli  # optional: pip3 install Brotli
+    except ImportError:
+        brotli = None
+    for prefix, (root, _endpoint, _skip) in SOURCES.items():
+        if not os.path.isdir(root):
+            print(f'assets: {root} not found, {prefix}/ assets are served unbuilt', file=sys.stderr)
+
+    stamp = source_stamp()
+    files = sorted(_source_files())
+    assets = {}
+    # stylesheets last, so the files they reference already have hashed names
+    for logical, path in sorted(files, key=lambda f: f[0].endswith('.css')):
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if logical.endswith('.css'):
+            data = _rewrite_css(logical, data, assets)
+        hashed = _hashed_name(logical, data)
+        encodings = []
+        _write(os.path.join(out_dir, hashed), data)
+        _write(os.path.join(out_dir, logical), data)
+        if logical.lower().endswith(COMPRESSIBLE):
+            variants = [('gzip', '.gz', lambda d: gzip.compress(d, 9, mtime=0))]
+            if brotli is not None:
+                variants.insert(0, ('br', '.br', lambda d: brotli.compress(d, quality=11)))
+            for encoding, suffix, compress in variants:
+                packed = compress(data)
+                if len(packed) < len(data):
+                    _write(os.path.join(out_dir, hashed + suffix), packed)
+                    _write(os.path.join(out_dir, logical + suffix), packed)
+                    encodings.append(encoding)
+        assets[logical] = {'path': hashed, 'encodings': encodings}
+
+    manifest = {'stamp': stamp, 'assets': assets}
+    _write(os.path.join(out_dir, 'manifest.json'), json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest(out_dir=None):
+    """Read manifest.json from out_dir, or an empty manifest if there is none."""
+    try:
+        with open(os.path.join(out_dir or ASSETS_DIR, 'manifest.json')) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {'stamp': None, 'assets': {}}
+
+
+def _install(manifest):
+    global _manifest, _hashed
+    _manifest = manifest
+    _hashed = {a['path'] for a in manifest['assets'].values()}
+
+
+def asset_url(logical):
+    """
+    URL of a built asset by logical name ('static/styles.css',
+    'highslide/highslide.css'). A name ending in '/' gives the URL of that
+    directory (e.g. 'highslide/graphics/' for hs.graphicsDir). Assets that
+    were not built are linked through their plain static route instead.
+    """
+    assets = _manifest['assets']
+    if logical.endswith('/'):
+        if any(name.startswith(logical) for name in assets):
+            return url_for('assets.serve_asset', filename=logical)
+    else:
+        entry = assets.get(logical)
+        if entry is not None:
+            return url_for('assets.serve_asset', filename=entry['path'])
+    prefix, _sep, rest = logical.partition('/')
+    return url_for(SOURCES[prefix][1], filename=rest)
+
+
+def _accepts(encoding):
+    """True if the client's Accept-Encoding allows `encoding` (q > 0)."""
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _sep, params = part.strip().partition(';')
+        if name.strip().lower() in (encoding, '*'):
+            q = params.strip()
+            try:
+                return not (q.startswith('q=') and float(q[2:] or 0) == 0)
+            except ValueError:
+                return False
+    return False
+
+
+@assets_bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    path = safe_join(ASSETS_DIR, filename)
+    if path is None or filename.endswith(('.gz', '.br')) or filename == 'manifest.json' or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    served, encoding = filename, None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if _accepts(candidate) and os.path.isfile(path + suffix):
+            served, encoding = filename + suffix, candidate
+            break
+    response = send_from_directory(ASSETS_DIR, served, mimetype=mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE if filename in _hashed else REVALIDATE
+    return response
+
+
+def init_assets(app):
+    """Build the assets if they are stale, register /assets/ and the asset_url() template helper."""
+    manifest = load_manifest()
+    if ASSETS_AUTO_BUILD and manifest.get('stamp') != source_stamp():
+        try:
+            manifest = build()
+        except OSError as e:
+            app.logger.warning('Could not build assets into %s (%s), serving them unbuilt', ASSETS_DIR, e)
+    _install(manifest)
+    app.register_blueprint(assets_bp)
+    app.add_template_global(asset_url)
+
+
+if __name__ == '__main__':
+    manifest = build()
+    print(f"built {len(manifest['assets'])} assets into {ASSETS_DIR}", file=sys.stderr)
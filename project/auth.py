@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, session, url_for, flash
+from flask import Blueprint, render_template, request, redirect, session, url_for, flash, abort
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 
@@ -17,6 +17,13 @@ def init_auth(app, database):
     db = database
     app.register_blueprint(auth_bp)
 
+def _log_event(event, **kwargs):
+    # access_log is imported on first use: auth is imported by other modules
+    # for its decorators and must not pull the access log (and metrics) in
+    from access_log import log_event
+    log_event(event, **kwargs)
+
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -27,6 +34,22 @@ def login_required(f):
     return decorated_function
 
 
+def level_required(level):
+    """Restrict a view to logged-in users whose session level is >= level."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                user_level = int(session.get('level', 0) or 0)
+            except Exception:
+                user_level = 0
+            if 'user_id' not in session or user_level < level:
+                abort(403)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
     global db
@@ -47,6 +70,7 @@ def login():
             session['user_id'] = user_data[0]['id']
             session['username'] = user_data[0]['username']
             session['IFLOGED_IN'] = True  # Set legacy flag for backward compatibility
+            _log_event('login')
             # normalize stored level to int when possible
             try:
                 session['level'] = int(user_data[0].get('level') if isinstance(user_data[0], dict) else user_data[0][3])
@@ -59,6 +83,7 @@ def login():
             return redirect("https://login.your_domain/menu")
             
         else:
+            _log_event('login_failed', detail=username)
             flash("Invalid username or password.", "error")
             return render_template('login.html')
             
@@ -102,6 +127,7 @@ def register():
         params = (username, password_hash, firstname, lastname, address, city, state,
                   zipcode, birthday, email, phone1, phone2, comment,level)
         db.put_data(query, params)
+        _log_event('register', detail=username)
         flash("Registration successful! You can now log in.", "success")
         return redirect(url_for('auth.login'))
         
@@ -110,6 +136,7 @@ def register():
 
 @auth_bp.route('/logout')
 def logout():
+    _log_event('logout')
     session.clear()
     flash("You have been logged out.", "success")
     return redirect(url_for('auth.login'))
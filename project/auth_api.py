@@ -6,7 +6,7 @@
 # Authentication API helper module for external applications (like mediaplayer)
 # This provides session-based authentication checking and user information retrieval
 
-from flask import Blueprint, session, jsonify, request
+from flask import Blueprint, session, jsonify, request, current_app
 from functools import wraps
 
 auth_api_bp = Blueprint('auth_api', __name__)
@@ -122,6 +122,40 @@ def auth_username():
     return jsonify({'username': get_username()})
 
 
+@auth_api_bp.route('/api/auth/verify', methods=['GET'])
+def auth_verify():
+    """
+    Sub-request endpoint for the front proxy (nginx auth_request), used to
+    serve the pages written by export_static.py without running a view.
+    Answers with an empty body and the user's details in headers.
+    
+    Usage: GET /api/auth/verify?min_level=N   (N defaults to 1)
+    
+    Response:
+        204 if the user's level is >= N, 401 if not logged in, 403 otherwise
+        X-Auth-Level: 0-3
+        X-Auth-User: username (empty if not logged in)
+    """
+    try:
+        min_level = int(request.args.get('min_level', 1))
+    except ValueError:
+        min_level = 1
+    try:
+        level = int(get_user_level() or 0) if is_logged_in() else 0
+    except (TypeError, ValueError):
+        level = 0
+    if level >= min_level:
+        status = 204
+    else:
+        status = 401 if not is_logged_in() else 403
+    response = current_app.response_class(status=status)
+    response.headers['X-Auth-Level'] = str(level)
+    response.headers['X-Auth-User'] = get_username() or ''
+    # the answer depends on the session cookie; never cache it
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 # Decorator for protecting routes in other applications
 def require_login_api(f):
     """
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/circuit_breaker.py
+#
+# Circuit breaker shared by every database entry point of a worker
+# (MySql.MySQL and the standalone LinkMenuGenerator connection).
+#
+# While the database answers, the breaker is closed and calls go through.
+# After DB_BREAKER_FAILURES consecutive outage errors (connection refused,
+# timeouts, lost connections) it opens: calls fail at once with
+# DatabaseUnavailable instead of each waiting for a timeout, so requests can
+# fall back to a degraded response quickly. After DB_BREAKER_RESET_SECONDS it
+# half-opens and lets exactly one probe call through; success closes it
+# again, failure re-opens it for another period. A probe that ends in an
+# unexpected exception is reported with abandon() and counts as a failure;
+# one that never reports back at all is replaced by a new probe after
+# another DB_BREAKER_RESET_SECONDS, so the breaker cannot stay half-open.
+
+import os
+import threading
+import time
+
+import metrics
+
+try:
+    import config
+except ImportError:
+    config = None
+
+DB_BREAKER_FAILURES = int(getattr(config, 'DB_BREAKER_FAILURES', 5))
+DB_BREAKER_RESET_SECONDS = float(getattr(config, 'DB_BREAKER_RESET_SECONDS', 15))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DatabaseUnavailable(Exception):
+    """Raised instead of calling the database while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker counting consecutive failures."""
+
+    def __init__(self, name, failure_threshold=DB_BREAKER_FAILURES, reset_timeout=DB_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.lock = threading.Lock()
+
+    def _set_state(self, state):
+        # called with the lock held
+        if state != self.state:
+            self.state = state
+            metrics.inc('db_circuit_transitions_total', {'breaker': self.name, 'state': state})
+
+    def allow(self):
+        """True if a call may go to the database now."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and (not self.probing or now - self.probe_started >= self.reset_timeout):
+                # this caller is the probe (or replaces one that never reported back)
+                self.probing = True
+                self.probe_started = now
+                return True
+        metrics.inc('db_circuit_rejections_total', {'breaker': self.name})
+        return False
+
+    def check(self):
+        """Raise DatabaseUnavailable unless a call may go to the database now."""
+        if not self.allow():
+            raise DatabaseUnavailable(f'{self.name} database unavailable (circuit open)')
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def abandon(self):
+        """
+        A call let through by allow() ended without an answer from the
+        database (an unexpected exception, a cancelled task). If it was the
+        half-open probe it counts as a failed one, so the breaker re-opens
+        instead of waiting for a result that will never come.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN and self.probing:
+                self.probing = False
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def snapshot(self):
+        with self.lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+db_breaker = CircuitBreaker('primary')
+
+
+def _reset_after_fork():
+    # a worker starts with a fresh lock; the breaker state itself is kept
+    db_breaker.lock = threading.Lock()
+    db_breaker.probing = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -10,7 +10,142 @@ mysql_config = {
     'database': 'your_database'
 }
 
+# Database backend used by MySql.MySQL:
+#   'mysql'  - MariaDB/MySQL through PyMySQL using mysql_config above (default)
+#   'sqlite' - embedded SQLite file at SQLITE_PATH; no database server needed,
+#              handy for development, CI and benchmark runs
+DB_BACKEND = 'mysql'
+# SQLITE_PATH = '/home/your_user/projects/site_starter/site_starter.sqlite3'
+
+# Optional read replicas. get_data() reads are spread over the healthy ones
+# (DB_READ_ROUTING = 'round_robin' or 'least_latency'); put_data() always
+# writes to mysql_config above, and the rest of a request that wrote reads
+# from there too. Keys left out are taken from mysql_config. A replica that
+# errors is skipped for DB_REPLICA_RETRY_SECONDS and the primary answers.
+# With DB_BACKEND = 'sqlite' a replica is {'path': '/path/to/copy.sqlite3'}.
+# mysql_replicas = [
+#     {'host': 'replica1.your_domain'},
+#     {'host': 'replica2.your_domain'},
+# ]
+DB_READ_ROUTING = 'round_robin'
+DB_REPLICA_RETRY_SECONDS = 30
+
+# Database timeouts (seconds) and circuit breaker. A stalled server fails a
+# query after these timeouts instead of tying up a worker; after
+# DB_BREAKER_FAILURES consecutive connection/timeout errors, calls to the
+# database fail at once and /menu and /gallery/ serve the last links and
+# gallery list they saw. After DB_BREAKER_RESET_SECONDS one probe request is
+# let through; if it succeeds normal operation resumes.
+DB_CONNECT_TIMEOUT = 5
+DB_READ_TIMEOUT = 10
+DB_WRITE_TIMEOUT = 10
+DB_BREAKER_FAILURES = 5
+DB_BREAKER_RESET_SECONDS = 15
+
 # A secret key is required for Flask sessions
 # IMPORTANT: Change this to a random string for production!
 # You can generate one with: python3 -c "import os; print(os.urandom(24).hex())"
 SECRET_KEY = 'change_this_to_a_random_secret_key'
+
+# Directory where each gunicorn worker writes its metrics snapshot so that
+# /metrics can aggregate across workers (defaults to <tmp>/site_starter_metrics)
+# METRICS_DIR = '/run/site_starter/metrics'
+
+# Slow query log (MySql.MySQL): queries slower than SLOW_QUERY_MS are logged
+# to stderr with normalized SQL and redacted parameters. Set
+# SLOW_QUERY_EXPLAIN = True to capture the EXPLAIN plan of slow SELECTs.
+# The top SLOW_QUERY_TOP_N statements are shown at /metrics/slow-queries.
+SLOW_QUERY_MS = 200
+SLOW_QUERY_EXPLAIN = False
+SLOW_QUERY_TOP_N = 20
+
+# MySql.MySQL caches the column/index catalog of the whole database (used by
+# get_field_names, get_num_fields, get_indexes, has_table) for this many
+# seconds; 0 keeps it until db.refresh_schema() is called.
+SCHEMA_CACHE_TTL = 300
+
+# Maximum number of requests per minute (per worker) that level 3 users can
+# profile with ?_profile=html / ?_profile=prof
+PROFILE_PER_MINUTE = 6
+
+# Where compiled Jinja templates are cached so new workers skip compilation.
+# Jinja loads code from here, so it must only be writable by the app's user
+# (default: Jinja's own per-user, owner-checked directory in /tmp)
+# JINJA_CACHE_DIR = '/run/site_starter/jinja'
+
+# Upper bound (bytes, per worker) for the rendered page cache used by /menu
+# and /gallery/<slug>/; least recently used pages are evicted first
+FRAGMENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Thumbnails served from memory (thumb_cache.py): size bound per worker, how
+# often an entry is checked against its file, and how many of the most viewed
+# galleries (access log, last 7 days) each worker pre-loads (0 = none).
+THUMB_CACHE_MAX_BYTES = 32 * 1024 * 1024
+THUMB_CACHE_CHECK_SECONDS = 10
+THUMB_CACHE_WARM_GALLERIES = 5
+# Folder the generated thumbnails are written to (default static/gallery/thumbs)
+# GALLERY_THUMBS_DIR = '/var/cache/site_starter/thumbs'
+
+# Optional async serving mode (asgi.py, run with uvicorn): threads running the
+# Flask routes and threads reading image files.
+# AsyncMySQL keeps DB_ASYNC_POOL_MIN..DB_ASYNC_POOL_MAX aiomysql connections
+# (or runs queries on DB_ASYNC_POOL_MAX threads without aiomysql).
+ASGI_WSGI_THREADS = 16
+ASGI_IO_THREADS = 8
+DB_ASYNC_POOL_MIN = 1
+DB_ASYNC_POOL_MAX = 10
+
+# Cache shared by all gunicorn workers on this host (shared_cache.py): one
+# small file per entry, in memory on /dev/shm by default. Used for the menu
+# links, the gallery list and folder listings; one worker computes a value and
+# the others reuse it. Entries are unpickled, so the directory must be owned
+# by the app's user with mode 0700; otherwise the cache is switched off
+# (default /dev/shm/site_starter_cache-<uid>).
+# SHARED_CACHE_DIR = '/run/site_starter/cache'
+SHARED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+SHARED_CACHE_TTL = 60
+MENU_LINKS_TTL = 30     # seconds before siteslinks is re-read
+GALLERY_LIST_TTL = 30   # seconds before the galleries table is re-read
+
+# Audit log (access_log table, see siteslinks.sample.sql): logins, menu and
+# gallery views and image fetches are buffered in memory and written in
+# batches of ACCESS_LOG_BATCH rows by a background thread, at least every
+# ACCESS_LOG_FLUSH_SECONDS. At most ACCESS_LOG_CAPACITY events are buffered
+# per worker; beyond that the oldest are dropped (counted on /metrics).
+ACCESS_LOG_ENABLED = True
+ACCESS_LOG_CAPACITY = 10000
+ACCESS_LOG_BATCH = 200
+ACCESS_LOG_FLUSH_SECONDS = 2.0
+
+# Photo uploads (POST /gallery/<slug>/upload, see uploads.py): who may upload,
+# the largest file accepted, the longest side of the web copy put into the
+# gallery (0 = keep the original size), background threads per worker and
+# how long job states can be polled. Originals, metadata sidecars, job states
+# and the content-hash index live in UPLOAD_DIR.
+# UPLOAD_DIR = '/home/your_user/projects/site_starter/project/uploads'
+UPLOAD_MIN_LEVEL = 3
+UPLOAD_MAX_FILE_BYTES = 50 * 1024 * 1024
+UPLOAD_MAX_DIMENSION = 2048
+UPLOAD_WORKERS = 2
+UPLOAD_JOB_TTL = 24 * 3600
+
+# Where `python3 export_static.py` writes the pre-rendered menu and gallery
+# pages for the front proxy (see nginx.export.conf.sample)
+# EXPORT_DIR = '/home/your_user/projects/site_starter/project/build/export'
+
+# Built static assets (content-hashed, precompressed; see assets.py). They are
+# rebuilt at start-up when a file in static/ or highslide/ changed, unless
+# ASSETS_AUTO_BUILD is False (then run `python3 assets.py` when deploying).
+# ASSETS_DIR = '/home/your_user/projects/site_starter/project/build/assets'
+ASSETS_AUTO_BUILD = True
+
+# Legacy CGI-style renderers (/drwho, /shopping, ...) are imported once and
+# only reloaded when their source file changes; the file is checked at most
+# every RENDERER_CHECK_INTERVAL seconds.
+RENDERER_CHECK_INTERVAL = 1.0
+# Extra renderers to serve without writing a route, e.g.:
+# LEGACY_RENDERERS = [
+#     {'rule': '/drwho2', 'module': 'list_dr_who', 'function': 'render_drwho'},
+#     # form=True: called with form=request.form and base_action='/recipes'; GET and POST
+#     {'rule': '/recipes', 'module': 'recipes', 'function': 'render_recipes', 'form': True},
+# ]
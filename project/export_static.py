@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/export_static.py
+#
+# Pre-render the pages that only depend on the user level or on folder
+# contents, so the front proxy can serve them from disk:
+#
+#   python3 export_static.py [--out DIR] [--force]
+#
+# Output tree (mirrors the URL paths):
+#   menu/level-<N>/index.html          /menu for user level N (0 = anonymous)
+#   gallery/index.html                 /gallery/
+#   gallery/<slug>/index.html          /gallery/<slug>/
+#   gallery/<slug>/image/<file>        full-size images
+#   gallery/thumbs/<slug>__<file>      thumbnails (created if missing)
+#   assets/...                         the built assets (see assets.py)
+#
+# nginx asks /api/auth/verify (auth_request) for the visitor's level and picks
+# menu/level-$auth_level/index.html; see nginx.export.conf.sample.
+#
+# Re-exports are incremental: every page's inputs (rows, file names, sizes
+# and mtimes, template sources, asset build) are hashed into
+# .export_manifest.json, and only pages whose digest changed are rendered
+# again. Images, thumbnails and assets are hard-linked (or copied) only when
+# their size or mtime changed, and files of removed galleries are deleted.
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+try:
+    import config
+except ImportError:
+    config = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORT_DIR = getattr(config, 'EXPORT_DIR', None) or os.path.join(BASE_DIR, 'build', 'export')
+LEVELS = (0, 1, 2, 3)
+MANIFEST = '.export_manifest.json'
+
+
+def digest(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return f'{st.st_size}:{st.st_mtime_ns}'
+
+
+class Exporter:
+    """Writes pages and files into out_dir, skipping those whose inputs are unchanged."""
+
+    def __init__(self, out_dir, force=False):
+        self.out_dir = out_dir
+        self.force = force
+        try:
+            with open(os.path.join(out_dir, MANIFEST)) as fh:
+                self.old = json.load(fh)
+        except (OSError, ValueError):
+            self.old = {}
+        self.new = {}
+        self.written = 0
+        self.skipped = 0
+
+    def _target(self, rel_path):
+        target = os.path.join(self.out_dir, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return target
+
+    def _unchanged(self, rel_path, key):
+        self.new[rel_path] = key
+        if not self.force and self.old.get(rel_path) == key and os.path.exists(os.path.join(self.out_dir, rel_path)):
+            self.skipped += 1
+            return True
+        self.written += 1
+        return False
+
+    def page(self, rel_path, inputs, render):
+        """Write render() to rel_path unless `inputs` hash the same as last time."""
+        if self._unchanged(rel_path, digest(inputs)):
+            return
+        target = self._target(rel_path)
+        tmp = target + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(render())
+        os.replace(tmp, target)
+
+    def file(self, rel_path, source):
+        """Hard-link (or copy) source to rel_path unless it is unchanged."""
+        if self._unchanged(rel_path, file_stamp(source)):
+            return
+        target = self._target(rel_path)
+        tmp = target + '.tmp'
+        try:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            os.link(source, tmp)
+        except OSError:
+            shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+
+    def tree(self, rel_dir, source_dir):
+        """Mirror every file below source_dir into rel_dir."""
+        for dirpath, _dirnames, filenames in os.walk(source_dir):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, source_dir).replace(os.sep, '/')
+                self.file(f'{rel_dir}/{rel}', path)
+
+    def finish(self):
+        """Delete outputs that are no longer produced and save the manifest."""
+        removed = 0
+        for rel_path in set(self.old) - set(self.new):
+            try:
+                os.unlink(os.path.join(self.out_dir, rel_path))
+                removed += 1
+            except OSError:
+                pass
+        for dirpath, dirnames, filenames in os.walk(self.out_dir, topdown=False):
+            if dirpath != self.out_dir and not dirnames and not filenames:
+                os.rmdir(dirpath)
+        with open(os.path.join(self.out_dir, MANIFEST), 'w') as fh:
+            json.dump(self.new, fh, indent=0, sort_keys=True)
+        return removed
+
+
+def template_sources(app, *names):
+    """Digest of the given templates' sources (layout.html included)."""
+    env = app.jinja_env
+    return digest(*[env.loader.get_source(env, name)[0] for name in ('layout.html',) + names])
+
+
+def export(app, out_dir=EXPORT_DIR, force=False, levels=LEVELS):
+    from flask import render_template
+
+    import assets
+    import gallery
+    from circuit_breaker import DatabaseUnavailable
+    from menu import LinkMenuGenerator
+    from menu_view import links_for_level
+
+    os.makedirs(out_dir, exist_ok=True)
+    exporter = Exporter(out_dir, force)
+    db = app.config.get('DB')
+    asset_stamp = assets.load_manifest().get('stamp')
+
+    with app.test_request_context('/'):
+        try:
+            gen = LinkMenuGenerator(db)
+            gen.fetch_links()
+            galleries = gallery.list_galleries(db)
+        except DatabaseUnavailable as e:
+            print(f'export_static: database unavailable, nothing exported: {e}', file=sys.stderr)
+            return None
+
+        menu_templates = template_sources(app, 'menu.html')
+        for level in levels:
+            links = links_for_level(gen.links, level)
+            exporter.page(f'menu/level-{level}/index.html', ('menu', level, links, menu_templates, asset_stamp),
+                          lambda: render_template('menu.html', links=links, page_title=gen.page_title))
+
+        exporter.page('gallery/index.html',
+                      ('gallery_list', galleries, template_sources(app, 'gallery_list.html'), asset_stamp),
+                      lambda: render_template('gallery_list.html', galleries=galleries))
+
+        grid_templates = template_sources(app, 'gallery_grid.html')
+        slugs = sorted(d for d in os.listdir(gallery.GALLERY_ROOT)
+                       if d != 'thumbs' and os.path.isdir(os.path.join(gallery.GALLERY_ROOT, d)))
+        for slug in slugs:
+            folder = gallery.get_gallery_folder(slug)
+            files = gallery.list_images(slug, folder)  # also makes missing thumbnails
+            stamps = [(f, file_stamp(os.path.join(folder, f))) for f in files]
+            exporter.page(f'gallery/{slug}/index.html', ('gallery', slug, stamps, grid_templates, asset_stamp),
+                          lambda: render_template('gallery_grid.html', **gallery.gallery_context(slug, files)))
+            for fname in files:
+                exporter.file(f'gallery/{slug}/image/{fname}', os.path.join(folder, fname))
+                thumb_name = f'{slug}__{fname}'
+                thumb_path = os.path.join(gallery.THUMBS_DIR, thumb_name)
+                if os.path.exists(thumb_path):
+                    exporter.file(f'gallery/thumbs/{thumb_name}', thumb_path)
+
+    if os.path.isdir(assets.ASSETS_DIR):
+        exporter.tree('assets', assets.ASSETS_DIR)
+
+    removed = exporter.finish()
+    return {'written': exporter.written, 'unchanged': exporter.skipped, 'removed': removed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the menu and gallery pages as static files.')
+    parser.add_argument('--out', default=EXPORT_DIR, help=f'output directory (default {EXPORT_DIR})')
+    parser.add_argument('--force', action='store_true', help='rewrite every page, even unchanged ones')
+    parser.add_argument('--levels', type=int, nargs='+', default=list(LEVELS), help='user levels to export the menu for')
+    args = parser.parse_args(argv)
+
+    from app import app
+    result = export(app, args.out, args.force, tuple(args.levels))
+    if result is None:
+        return 1
+    print(f"exported to {args.out}: {result['written']} written, {result['unchanged']} unchanged, "
+          f"{result['removed']} removed", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/fragment_cache.py
+#
+# In-process cache of rendered HTML pages.
+#
+# Views build a key from everything the page depends on (for example the
+# gallery slug plus the folder's modification time, or the user level plus a
+# version of the link table) and call render_cached(). On a hit the stored
+# HTML is returned without touching Jinja at all. Memory use is bounded by
+# FRAGMENT_CACHE_MAX_BYTES; the least recently used pages are evicted first.
+
+import threading
+from collections import OrderedDict
+
+from flask import render_template, session
+
+import metrics
+
+try:
+    import config
+except ImportError:
+    config = None
+
+FRAGMENT_CACHE_MAX_BYTES = int(getattr(config, 'FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+
+class FragmentCache:
+    """Size-bounded LRU of rendered HTML strings keyed by tuples.
+
+    The first element of every key is a namespace ('gallery', 'menu', ...)
+    so a whole family of pages can be dropped with invalidate(namespace).
+    """
+
+    def __init__(self, max_bytes=FRAGMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            html = self.entries.get(key)
+            if html is None:
+                self.misses += 1
+            else:
+                self.entries.move_to_end(key)
+                self.hits += 1
+        metrics.inc('fragment_cache_total', {'namespace': key[0], 'result': 'miss' if html is None else 'hit'})
+        return html
+
+    def set(self, key, html):
+        cost = len(html)
+        if cost > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = html
+            self.size += cost
+            while self.size > self.max_bytes:
+                _key, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, namespace=None, *prefix):
+        """Drop every entry, or those whose key starts with (namespace, *prefix)."""
+        with self.lock:
+            if namespace is None:
+                self.entries.clear()
+                self.size = 0
+                return
+            start = (namespace,) + prefix
+            for key in [k for k in self.entries if k[:len(start)] == start]:
+                self.size -= len(self.entries.pop(key))
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+fragment_cache = FragmentCache()
+
+
+def render_cached(key, template_name, make_context):
+    """render_template() with the result cached under `key`.
+
+    make_context() is only called on a miss, so any work needed to build the
+    template variables (listing folders, creating thumbnails) is skipped too.
+    Pages are only cached (and served from cache) when no flashed messages
+    are waiting, because layout.html shows them and they are per-user.
+    """
+    if '_flashes' in session:
+        return render_template(template_name, **make_context())
+    html = fragment_cache.get(key)
+    if html is None:
+        html = render_template(template_name, **make_context())
+        fragment_cache.set(key, html)
+    return html
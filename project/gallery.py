@@ -1,21 +1,42 @@
-from flask import Blueprint, render_template, current_app, send_from_directory, abort, url_for
+from flask import Blueprint, render_template, current_app, send_from_directory, abort, url_for, request, jsonify, session
 import os
-from PIL import Image
+import threading
+import time
 from werkzeug.utils import secure_filename
+import metrics
+from fragment_cache import fragment_cache, render_cached
+from circuit_breaker import DatabaseUnavailable
+from shared_cache import shared_cache
+from access_log import log_event
+from thumb_cache import THUMBS_DIR, thumb_cache
+from auth import level_required
+import uploads
+
+try:
+    import config
+except ImportError:
+    config = None
 
 gallery_bp = Blueprint('gallery', __name__, url_prefix='/gallery')
 
 # Config: path to gallery root relative to project
 GALLERY_ROOT = os.path.join(os.path.dirname(__file__), 'static', 'gallery')
-THUMBS_DIR = os.path.join(GALLERY_ROOT, 'thumbs')
+# THUMBS_DIR (GALLERY_ROOT/thumbs unless config.GALLERY_THUMBS_DIR is set) comes from thumb_cache
+
+# Gallery list from the last successful query in this worker, served while
+# the database is unavailable
+_last_good = {}
 
-os.makedirs(THUMBS_DIR, exist_ok=True)
+# Seconds the galleries table is shared between workers before it is re-read.
+# Folder listings are keyed by the folder's mtime, so they only expire to free
+# space (after GALLERY_LISTING_TTL).
+GALLERY_LIST_TTL = float(getattr(config, 'GALLERY_LIST_TTL', 30))
+GALLERY_LISTING_TTL = 3600
 
 def list_galleries(db):
-    # If you want to use the DB table:
-    # return db.get_data("SELECT * FROM galleries WHERE public=1 ORDER BY id ASC")
-    # For now example returns None (we'll wire DB in app)
-    return None
+    """Public galleries from the galleries table (raises DatabaseUnavailable)."""
+    return db.get_data("SELECT id, title, slug, folder, description FROM galleries WHERE public=1 ORDER BY id ASC",
+                       raise_errors=True)
 
 def get_gallery_folder(slug):
     # safe folder path
@@ -24,15 +45,71 @@ def get_gallery_folder(slug):
         return folder
     return None
 
-def make_thumbnail(image_path, thumb_path, size=(240,240)):
+def render_thumbnail(image_path, thumb_path, size=(240,240)):
+    """Write a thumbnail of image_path to thumb_path; raises on failure.
+
+    Uses neither Flask nor the metrics, so asgi.py can run it in a process pool.
+    """
+    # Pillow is only imported (and the thumbs folder only created) the first
+    # time a thumbnail is actually needed, so worker start-up stays cheap
+    from PIL import Image
+    folder, name = os.path.split(thumb_path)
+    os.makedirs(folder, exist_ok=True)
+    # written next to the final name and renamed into place, so serve_thumb
+    # (and the thumbnail cache) never sees a half-written file. The dot prefix
+    # keeps it out of the gallery listings; the extension lets Pillow pick the format.
+    tmp_path = os.path.join(folder, f'.{os.getpid()}-{threading.get_ident()}-{name}')
     try:
         with Image.open(image_path) as im:
             im.thumbnail(size)
-            im.save(thumb_path)
-            return True
+            im.save(tmp_path)
+        os.replace(tmp_path, thumb_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def make_thumbnail(image_path, thumb_path, size=(240,240)):
+    start = time.perf_counter()
+    try:
+        render_thumbnail(image_path, thumb_path, size)
+        thumb_cache.invalidate(os.path.basename(thumb_path))
+        metrics.inc('thumbnails_total', {'outcome': 'ok'})
+        return True
     except Exception as e:
         current_app.logger.exception("thumb failed: %s", e)
+        metrics.inc('thumbnails_total', {'outcome': 'error'})
         return False
+    finally:
+        metrics.observe('thumbnail_duration_seconds', time.perf_counter() - start)
+
+def list_images(slug, folder, failed=None):
+    """Sorted image file names of a gallery folder, creating missing thumbnails.
+
+    The names whose thumbnail could not be made are appended to `failed`.
+    """
+    # list images (filter common image extensions)
+    files = sorted([f for f in os.listdir(folder) if f.lower().endswith(('.jpg','.jpeg','.png','.gif','webp'))])
+    for fname in files:
+        thumb_path = os.path.join(THUMBS_DIR, f"{slug}__{fname}")
+        if not os.path.exists(thumb_path):
+            if not make_thumbnail(os.path.join(folder, fname), thumb_path) and failed is not None:
+                failed.append(fname)
+    return files
+
+def gallery_context(slug, files):
+    """Template variables of gallery_grid.html for the given image files."""
+    thumbs = []
+    for fname in files:
+        thumb_name = f"{slug}__{fname}"
+        thumbs.append({
+            'file': fname,
+            'url': url_for('gallery.serve_image', slug=slug, filename=fname),
+            'thumb_url': url_for('gallery.serve_thumb', filename=thumb_name)
+        })
+    return {'slug': slug, 'images': thumbs, 'title': slug}
 
 @gallery_bp.route('/')
 def index():
@@ -40,7 +117,14 @@ def index():
     db = current_app.config.get('DB')  # we'll set this in app.py after init
     galleries = []
     if db:
-        galleries = db.get_data("SELECT id, title, slug, folder, description FROM galleries WHERE public=1 ORDER BY id ASC")
+        try:
+            galleries = shared_cache.get_or_compute(('gallery', 'list'), lambda: list_galleries(db),
+                                                    ttl=GALLERY_LIST_TTL)
+            _last_good['galleries'] = galleries
+        except DatabaseUnavailable as e:
+            current_app.logger.warning('Gallery list unavailable (%s), serving the last known list', e)
+            galleries = _last_good.get('galleries', [])
+    log_event('gallery_index')
     return render_template('gallery_list.html', galleries=galleries)
 
 @gallery_bp.route('/<slug>/')
@@ -48,22 +132,30 @@ def show_gallery(slug):
     folder = get_gallery_folder(slug)
     if not folder:
         abort(404)
-    # list images (filter common image extensions)
-    files = sorted([f for f in os.listdir(folder) if f.lower().endswith(('.jpg','.jpeg','.png','.gif','webp'))])
-    # build thumb URLs, create thumbnails if missing
-    thumbs = []
-    for fname in files:
-        src = os.path.join(folder, fname)
-        thumb_name = f"{slug}__{fname}"
-        thumb_path = os.path.join(THUMBS_DIR, thumb_name)
-        if not os.path.exists(thumb_path):
-            make_thumbnail(src, thumb_path)
-        thumbs.append({
-            'file': fname,
-            'url': url_for('gallery.serve_image', slug=slug, filename=fname),
-            'thumb_url': url_for('gallery.serve_thumb', filename=thumb_name)
-        })
-    return render_template('gallery_grid.html', slug=slug, images=thumbs, title=slug)
+    log_event('gallery', detail=slug)
+
+    # the folder's mtime changes whenever an image is added, removed or
+    # renamed, so it versions the listing and the rendered page
+    version = os.stat(folder).st_mtime_ns
+
+    failed = []
+
+    def make_context():
+        # one worker lists the folder and makes the missing thumbnails; the
+        # others get the finished listing from the shared cache
+        listing_key = ('gallery', 'listing', slug, version)
+        files = shared_cache.get_or_compute(listing_key, lambda: list_images(slug, folder, failed),
+                                            ttl=GALLERY_LISTING_TTL)
+        if failed:
+            shared_cache.invalidate(*listing_key)
+        return gallery_context(slug, files)
+
+    html = render_cached(('gallery', slug, version), 'gallery_grid.html', make_context)
+    if failed:
+        # a thumbnail could not be made: the next request tries again instead
+        # of getting this listing until the folder changes
+        fragment_cache.invalidate('gallery', slug, version)
+    return html
 
 @gallery_bp.route('/<slug>/image/<path:filename>')
 def serve_image(slug, filename):
@@ -72,8 +164,64 @@ def serve_image(slug, filename):
         abort(404)
     # secure filename, avoid path traversal
     safe = secure_filename(filename)
+    log_event('image', detail=f'{slug}/{safe}')
     return send_from_directory(folder, safe)
 
 @gallery_bp.route('/thumbs/<path:filename>')
 def serve_thumb(filename):
-    return send_from_directory(THUMBS_DIR, filename)
+    # from memory once warm; same headers and conditional answers as send_from_directory
+    entry = thumb_cache.get(filename)
+    if entry is None:
+        return send_from_directory(THUMBS_DIR, filename)
+    response = current_app.response_class(entry.data, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@gallery_bp.route('/<slug>/upload', methods=['POST'])
+@level_required(uploads.UPLOAD_MIN_LEVEL)
+def upload(slug):
+    """Add photos to a gallery (multipart/form-data, any number of files).
+
+    Answers 202 with a job per accepted file before the thumbnails are made:
+        {"jobs": [{"file": ..., "job_id": ..., "status_url": ...}],
+         "rejected": [{"file": ..., "reason": "duplicate" | "bad_type" | "too_large", ...}]}
+    """
+    folder = get_gallery_folder(slug)
+    if not folder or slug == 'thumbs':
+        abort(404)
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        return jsonify({'error': 'expected a multipart/form-data body'}), 400
+    try:
+        # read straight from request.stream; request.files would buffer the body
+        accepted, rejected = uploads.receive_files(request.stream, boundary, slug)
+    except ValueError as e:
+        return jsonify({'error': f'malformed upload: {e}'}), 400
+    jobs = []
+    for incoming in accepted:
+        job_id = uploads.submit(incoming, slug, folder, username=session.get('username'))
+        log_event('upload', detail=f'{slug}/{incoming.name}')
+        jobs.append({'file': incoming.filename, 'job_id': job_id,
+                     'status_url': url_for('gallery.upload_status', job_id=job_id)})
+    if jobs:
+        status = 202
+    elif rejected and all(r['reason'] == 'duplicate' for r in rejected):
+        status = 409
+    else:
+        status = 400
+    return jsonify({'jobs': jobs, 'rejected': rejected}), status
+
+@gallery_bp.route('/upload/jobs/<job_id>')
+@level_required(uploads.UPLOAD_MIN_LEVEL)
+def upload_status(job_id):
+    """State of an upload job: queued, processing, done (with the image URLs) or failed."""
+    job = uploads.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown or expired job'}), 404
+    if job['status'] == 'done':
+        name = job['result']['file']
+        job['image_url'] = url_for('gallery.serve_image', slug=job['gallery'], filename=name)
+        job['thumb_url'] = url_for('gallery.serve_thumb', filename=f"{job['gallery']}__{name}")
+    return jsonify(job)
@@ -0,0 +1,38 @@
+# gunicorn.conf.py
+#
+# Gunicorn settings for the site_starter app (used by login.service):
+#
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The app is loaded once in the master (preload_app) and the workers are
+# forked from it, so starting, restarting or adding workers (kill -TTIN) does
+# not re-import Flask, the blueprints or the templates. This is safe because
+# create_app() opens no connections or files; MySql.py and metrics.py also
+# reset their per-process state in every forked child. A HUP therefore does
+# not load new code; deploy with a restart (or USR2 + QUIT), see README.md.
+#
+# For the async mode (asgi.py) set GUNICORN_WORKER_CLASS to
+# uvicorn_worker.UvicornWorker and load asgi:application; one or two workers
+# are then enough.
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5056')
+# --workers 3: A good starting number of processes
+workers = int(os.environ.get('GUNICORN_WORKERS', '3'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+preload_app = True
+# Let in-flight requests finish on reload/shutdown instead of dropping them
+graceful_timeout = 30
+timeout = 30
+
+
+def worker_exit(server, worker):
+    # finish the queued upload jobs, then write the buffered access log events
+    # and fold this worker's metrics into the retired totals before it goes away
+    import access_log
+    import metrics
+    import uploads
+    uploads.shutdown()
+    access_log.access_log.shutdown()
+    metrics.retire()
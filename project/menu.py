@@ -16,17 +16,22 @@
 #  filename:  menu.py
 #  This program generates an HTML menu of links from a MySQL database.
 
-import pymysql
 import config  # Import MySQL credentials
 import sys      # For error output to browser
+from circuit_breaker import db_breaker
+from MySql import DB_CONNECT_TIMEOUT, DB_READ_TIMEOUT, DB_WRITE_TIMEOUT
 
 class LinkMenuGenerator:
     """
     Generates an HTML menu of links from the siteslinks MySQL table.
     """
 
-    def __init__(self):
-        self.db_config = config.mysql_config  # Get database config
+    def __init__(self, db=None):
+        # Optional MySql.MySQL instance. When given, links are read through it
+        # (and therefore through whichever DB_BACKEND is configured); otherwise
+        # the standalone pymysql connection below is used.
+        self.db = db
+        self.db_config = getattr(config, 'mysql_config', None)  # Get database config
         self.links = []
         # Serve the app's stylesheet from Flask's static endpoint
         # Use an absolute path so the menu works when served at /menu
@@ -34,18 +39,34 @@ class LinkMenuGenerator:
         self.page_title = "Haines Family Home"
 
     def connect_to_db(self):
-        """Connects to the MySQL database."""
+        """Connects to the MySQL database (None if it is down or the circuit is open)."""
+        import pymysql  # only the standalone path needs it; keeps app start-up light
+        if not db_breaker.allow():
+            sys.stderr.write("Error connecting to MySQL: database unavailable (circuit open)\n")
+            return None
         try:
-            connection = pymysql.connect(**self.db_config)
+            connection = pymysql.connect(connect_timeout=DB_CONNECT_TIMEOUT, read_timeout=DB_READ_TIMEOUT,
+                                         write_timeout=DB_WRITE_TIMEOUT, **self.db_config)
             return connection
         except pymysql.MySQLError as e:
             # Don't exit the whole process from a request handler — return None
             # and let the caller handle the failure gracefully.
+            db_breaker.record_failure()
             sys.stderr.write(f"Error connecting to MySQL: {e}\n")
             return None
 
     def fetch_links(self):
-        """Fetches links from the siteslinks table."""
+        """
+        Fetches links from the siteslinks table. Through a MySql.MySQL
+        instance a failure raises circuit_breaker.DatabaseUnavailable, so the
+        caller can fall back to the last links it saw.
+        """
+        if self.db is not None:
+            rows = self.db.get_data("SELECT title, link, comment, level FROM siteslinks", raise_errors=True)
+            self.links = [(r['title'], r['link'], r['comment'], r['level']) for r in rows]
+            return
+
+        import pymysql
         connection = self.connect_to_db()
         if not connection:
             # leave self.links as empty list if DB can't be reached
@@ -58,9 +79,17 @@ class LinkMenuGenerator:
             cursor.execute("SELECT title, link, comment, level FROM siteslinks")
             self.links = cursor.fetchall()
             cursor.close()
+            db_breaker.record_success()
         except pymysql.MySQLError as e:
+            if isinstance(e, pymysql.err.OperationalError):
+                db_breaker.record_failure()
+            else:
+                db_breaker.record_success()  # the server answered
             sys.stderr.write(f"Error fetching links: {e}\n")
             self.links = []
+        except BaseException:
+            db_breaker.abandon()
+            raise
         finally:
             try:
                 connection.close()
@@ -84,7 +113,7 @@ class LinkMenuGenerator:
     <div class="link-container">
 """
 
-        for title, link, comment in self.links:
+        for title, link, comment, *_ in self.links:
             html += f"""
         <a href="{link}" title="{comment}">{title}</a><br>
 """
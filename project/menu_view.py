@@ -1,32 +1,35 @@
 
 from flask import Blueprint, render_template, current_app, url_for, session, Response, request
 from menu import LinkMenuGenerator
+from fragment_cache import render_cached
+from renderers import registry
+from circuit_breaker import DatabaseUnavailable
+from shared_cache import shared_cache
+from access_log import log_event
+import config
 
 menu_bp = Blueprint('menu', __name__)
 
+# Links from the last successful fetch in this worker, served while the
+# database is unavailable so the menu still works during an outage
+_last_good = {}
 
-@menu_bp.route('/menu')
-def show_menu():
-    # Render the menu with robust error handling so DB issues don't cause a 500
-    gen = LinkMenuGenerator()
-    try:
-        gen.fetch_links()
-    except Exception as e:
-        # Log and continue with an empty link list
-        current_app.logger.exception('Error fetching menu links: %s', e)
-        gen.links = []
+# How long the link table is shared between workers before it is re-read
+MENU_LINKS_TTL = float(getattr(config, 'MENU_LINKS_TTL', 30))
+
+
+def _fetch_links(gen):
+    gen.fetch_links()
+    return list(gen.links)
 
-    # Filter links by the currently logged-in user's level.
-    # Default anonymous level is 0 (not logged in). Registered users have
-    # their level stored in session['level'] (set at login).
-    user_level = 0
-    try:
-        user_level = int(session.get('level', 0) or 0)
-    except Exception:
-        user_level = 0
 
+def links_for_level(links, user_level):
+    """
+    (title, link, comment) of the siteslinks rows visible at `user_level`,
+    in table order. Used by /menu and by export_static.py.
+    """
     safe_links = []
-    for item in gen.links or []:
+    for item in links or []:
         try:
             # Extract fields and the link's required level. Support dict rows
             # (some DB wrappers return dict rows) or sequence rows (tuples).
@@ -66,8 +69,44 @@ def show_menu():
             # skip malformed rows but keep processing
             current_app.logger.warning('Skipping malformed menu row: %r, error: %s', item, e)
             continue
+    return safe_links
 
-    return render_template('menu.html', links=safe_links, page_title=gen.page_title)
+
+@menu_bp.route('/menu')
+def show_menu():
+    # Render the menu with robust error handling so DB issues don't cause a 500
+    gen = LinkMenuGenerator(current_app.config.get('DB'))
+    try:
+        # one worker reads siteslinks; the others reuse its result
+        gen.links = shared_cache.get_or_compute(('menu', 'links'), lambda: _fetch_links(gen), ttl=MENU_LINKS_TTL)
+        _last_good['links'] = gen.links
+    except DatabaseUnavailable as e:
+        current_app.logger.warning('Menu links unavailable (%s), serving the last known links', e)
+        gen.links = _last_good.get('links', [])
+    except Exception as e:
+        # Log and continue with an empty link list
+        current_app.logger.exception('Error fetching menu links: %s', e)
+        gen.links = []
+
+    # Filter links by the currently logged-in user's level.
+    # Default anonymous level is 0 (not logged in). Registered users have
+    # their level stored in session['level'] (set at login).
+    user_level = 0
+    try:
+        user_level = int(session.get('level', 0) or 0)
+    except Exception:
+        user_level = 0
+
+    safe_links = links_for_level(gen.links, user_level)
+
+    log_event('menu', detail=f'level {user_level}')
+
+    # The page only depends on the user's level and the link table, so cache it
+    # under both; any change to siteslinks yields a new version key.
+    links_version = hash(tuple(tuple(row.values()) if isinstance(row, dict) else tuple(row)
+                               for row in gen.links or []))
+    return render_cached(('menu', user_level, links_version), 'menu.html',
+                         lambda: {'links': safe_links, 'page_title': gen.page_title})
 
 
 @menu_bp.route('/gm')
@@ -76,40 +115,35 @@ def show_gm():
     return render_template('gm.html')
 
 
+def _form_kwargs(base_action):
+    return lambda: {'form': request.form, 'base_action': base_action}
+
+
+# Legacy CGI-style renderers: imported once, reloaded only when their source
+# file changes (see renderers.py)
+registry.register('drwho', 'list_dr_who', 'render_drwho')
+registry.register('shopping', 'shopping_list', 'render_shoppinglist', kwargs=_form_kwargs('/shopping'))
+
+
+# Further scripts can be exposed from config.py without new route code, e.g.
+# LEGACY_RENDERERS = [{'rule': '/recipes', 'module': 'recipes', 'function': 'render_recipes'}]
+# With 'form': True the renderer is called like render_shoppinglist, with
+# form=request.form and base_action=<rule>, and also accepts POST.
+for _spec in getattr(config, 'LEGACY_RENDERERS', []):
+    _with_form = bool(_spec.get('form'))
+    registry.add_route(menu_bp, _spec['rule'], _spec.get('name', _spec['module']),
+                       _spec['module'], _spec['function'],
+                       kwargs=_form_kwargs(_spec['rule']) if _with_form else None,
+                       methods=_spec.get('methods', ('GET', 'POST') if _with_form else ('GET',)))
+
+
 @menu_bp.route('/drwho')
 def show_drwho():
-    """Run the legacy CGI-style `list_dr_who.py` and return its HTML output.
-
-    We capture stdout from the script (it was written as a CGI) and strip the
-    leading Content-Type header so Flask can return a proper response.
-    """
-    try:
-        # Import the refactored renderer and call it directly
-        import importlib
-        if 'list_dr_who' in globals():
-            importlib.reload(list_dr_who)
-        else:
-            list_dr_who = importlib.import_module('list_dr_who')
-
-        output = list_dr_who.render_drwho()
-        return Response(output, content_type='text/html')
-    except Exception as e:
-        current_app.logger.exception('Error executing list_dr_who.render_drwho: %s', e)
-        return Response(f'<h1>Error</h1><p>{e}</p>', status=500, content_type='text/html')
+    """Serve the Dr Who listing via the refactored list_dr_who renderer."""
+    return registry.respond('drwho')
 
 
 @menu_bp.route('/shopping', methods=['GET', 'POST'])
 def show_shopping():
     """Serve the shopping list via the refactored renderer."""
-    try:
-        import importlib
-        if 'shopping_list' in globals():
-            importlib.reload(shopping_list)
-        else:
-            shopping_list = importlib.import_module('shopping_list')
-
-        output = shopping_list.render_shoppinglist(form=request.form, base_action='/shopping')
-        return Response(output, content_type='text/html')
-    except Exception as e:
-        current_app.logger.exception('Error executing shopping_list.render_shoppinglist: %s', e)
-        return Response(f'<h1>Error</h1><p>{e}</p>', status=500, content_type='text/html')
+    return registry.respond('shopping')
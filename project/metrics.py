@@ -0,0 +1,426 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/metrics.py
+#
+# Lightweight request/DB/thumbnail instrumentation for the MainMenu app.
+#
+# Every gunicorn worker keeps its own counters, gauges and histograms in
+# memory and writes a snapshot to METRICS_DIR (one JSON file per worker
+# process) after requests and from a background thread, at most every
+# METRICS_FLUSH_INTERVAL seconds, so a worker that goes idle still publishes
+# its last numbers. The /metrics endpoint merges all snapshots so the numbers
+# are aggregated across workers, then renders them in the Prometheus text
+# format. When a worker goes away its counters and histograms are folded into
+# one retired.json and its snapshot is deleted, so the totals never go
+# backwards and the directory does not grow with every recycled worker.
+#
+# This module does not import Flask: MySql.py, menu.py and the bench scripts
+# record into it without a web app. The request hooks and the /metrics views
+# are in metrics_view.py.
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: retired snapshots are folded without a lock
+    fcntl = None
+
+try:
+    import config
+except ImportError:
+    config = None
+
+# Default latency buckets (seconds), same spirit as the Prometheus client defaults
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS_DIR = getattr(config, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'site_starter_metrics')
+# Minimum number of seconds between snapshot writes of one worker
+FLUSH_INTERVAL = float(getattr(config, 'METRICS_FLUSH_INTERVAL', 2.0))
+
+# Metric metadata: name -> (type, help text)
+_META = {
+    'http_requests_total': ('counter', 'Total HTTP requests by route, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route and blueprint.'),
+    'http_requests_in_flight': ('gauge', 'HTTP requests currently being processed.'),
+    'db_queries_total': ('counter', 'Database calls made through MySql.MySQL by operation, outcome and target.'),
+    'db_query_duration_seconds': ('histogram', 'Database call latency by operation and target (primary or replica).'),
+    'db_replica_fallbacks_total': ('counter', 'Reads that failed on a replica and were retried on the primary.'),
+    'db_circuit_transitions_total': ('counter', 'Database circuit breaker state changes by new state.'),
+    'db_circuit_rejections_total': ('counter', 'Database calls refused at once because the circuit breaker was open.'),
+    'thumbnails_total': ('counter', 'Thumbnails generated by outcome.'),
+    'thumbnail_duration_seconds': ('histogram', 'Thumbnail generation time.'),
+    'thumb_cache_total': ('counter', 'Thumbnail byte cache lookups by result (hit, miss, reload).'),
+    'thumb_cache_warmed_total': ('counter', 'Thumbnails loaded into the byte cache by pre-warming.'),
+    'thumb_cache_bytes': ('gauge', 'Bytes of thumbnails held in memory by the byte cache.'),
+    'fragment_cache_total': ('counter', 'Rendered page cache lookups by namespace and result.'),
+    'legacy_render_duration_seconds': ('histogram', 'Render time of the legacy CGI-style renderers.'),
+    'shared_cache_total': ('counter', 'Cross-worker shared cache lookups by namespace and result.'),
+    'shared_cache_evictions_total': ('counter', 'Shared cache entries evicted to stay under SHARED_CACHE_MAX_BYTES.'),
+    'shared_cache_errors_total': ('counter', 'Shared cache entries that could not be written.'),
+    'access_log_events_total': ('counter', 'Access log events recorded by event type.'),
+    'access_log_dropped_total': ('counter', 'Access log events lost because the buffer was full or the write failed.'),
+    'access_log_flush_duration_seconds': ('histogram', 'Time to write one batch of access log events.'),
+    'uploads_total': ('counter', 'Uploaded files by outcome (accepted, duplicate, bad_type, too_large).'),
+    'upload_bytes_total': ('counter', 'Bytes of uploaded files received completely.'),
+    'upload_jobs_total': ('counter', 'Upload processing jobs finished by outcome.'),
+    'upload_job_duration_seconds': ('histogram', 'Time to process one upload (metadata, derivative, thumbnail).'),
+    'legacy_renderer_reloads_total': ('counter', 'Reloads of legacy renderer modules after their source changed.'),
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_extras = {}      # name -> callable returning JSON-serializable per-worker data
+_last_flush = 0.0
+_changes = 0          # bumped by every update; snapshots are skipped while it stays put
+_flushed_changes = -1
+_flush_lock = threading.Lock()
+_flusher = None       # the background flush thread, started by the first flush()
+# Part of the snapshot file name, so a reused pid never overwrites the
+# snapshot of an older worker that has not been folded in yet
+_started = time.time_ns()
+_retired = False
+
+_RETIRED = 'retired.json'
+
+
+def _reset_after_fork():
+    """Start a forked worker with empty metrics and a fresh lock.
+
+    With gunicorn --preload the workers are forked from the master; anything
+    the master recorded would otherwise be counted once per worker.
+    """
+    global _lock, _last_flush, _changes, _flushed_changes, _flush_lock, _flusher, _started, _retired
+    _lock = threading.Lock()
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
+    _last_flush = 0.0
+    _changes = 0
+    _flushed_changes = -1
+    _flush_lock = threading.Lock()
+    _flusher = None  # threads do not survive a fork
+    _started = time.time_ns()
+    _retired = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(name, labels):
+    """Build a hashable key from a metric name and a labels dict."""
+    return (name, tuple(sorted((labels or {}).items())))
+
+
+def inc(name, labels=None, value=1):
+    """Increment a counter."""
+    global _changes
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        _changes += 1
+
+
+def gauge_add(name, value, labels=None):
+    """Add (or subtract, with a negative value) to a gauge."""
+    global _changes
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = _gauges.get(key, 0) + value
+        _changes += 1
+
+
+def observe(name, value, labels=None):
+    """Record one observation (in seconds) into a histogram."""
+    global _changes
+    key = _key(name, labels)
+    with _lock:
+        _changes += 1
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = [0] * len(DEFAULT_BUCKETS) + [0.0, 0]
+            _histograms[key] = hist
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                hist[i] += 1
+        hist[-2] += value
+        hist[-1] += 1
+
+
+@contextmanager
+def timer(name, labels=None):
+    """Context manager that observes the elapsed time of its block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, labels)
+
+
+# --- Cross-worker snapshots ---
+
+def register_extra(name, provider):
+    """Include provider() in every worker snapshot under `name`.
+
+    Used for data that is not a plain counter/histogram (e.g. the slow query
+    summary in MySql.py); read it back from all workers with collect_extra().
+    """
+    _extras[name] = provider
+
+
+def _snapshot():
+    global _flushed_changes
+    with _lock:
+        _flushed_changes = _changes
+        snap = {
+            'counters': [[k[0], list(k[1]), v] for k, v in _counters.items()],
+            'gauges': [[k[0], list(k[1]), v] for k, v in _gauges.items()],
+            'histograms': [[k[0], list(k[1]), list(v)] for k, v in _histograms.items()],
+        }
+    snap['extra'] = {name: provider() for name, provider in _extras.items()}
+    return snap
+
+
+def _own_file():
+    return os.path.join(METRICS_DIR, f'{os.getpid()}-{_started}.json')
+
+
+def _write_json(path, data):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)  # atomic, readers never see a partial file
+
+
+def _load(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def flush(force=False):
+    """Write this worker's snapshot to METRICS_DIR.
+
+    Unless forced, at most every FLUSH_INTERVAL seconds and only when
+    something changed; a request never waits for another thread's write.
+    """
+    global _last_flush, _flusher
+    now = time.monotonic()
+    if _retired or (not force and (now - _last_flush < FLUSH_INTERVAL or _changes == _flushed_changes)):
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        if _retired:  # retire() ran while this thread waited
+            return
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+            _flusher.start()
+        _last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(_own_file(), _snapshot())
+    except OSError:
+        # Metrics must never break a request
+        pass
+    finally:
+        _flush_lock.release()
+
+
+def _flush_loop():
+    # publishes what was recorded after the last request of a worker that went idle
+    while not _retired:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+@contextmanager
+def _dir_lock():
+    """Serializes changes to retired.json across workers."""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    with open(os.path.join(METRICS_DIR, 'retired.lock'), 'a+b') as fh:
+        if fcntl is not None:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _snapshot_files():
+    """(live, stale): paths of the snapshots of running workers, and of gone ones.
+
+    A snapshot is stale when its pid no longer runs, or when a newer process
+    got the same pid.
+    """
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return [], []
+    newest, stale = {}, []
+    for fname in names:
+        pid, sep, rest = fname.partition('-')
+        if not sep or not rest.endswith('.json'):
+            continue  # retired.json, files being written
+        try:
+            pid, started = int(pid), int(rest[:-5])
+        except ValueError:
+            continue
+        path = os.path.join(METRICS_DIR, fname)
+        if not _pid_alive(pid):
+            stale.append(path)
+        elif pid in newest:
+            older, newer = sorted([newest[pid], (started, path)])
+            stale.append(older[1])
+            newest[pid] = newer
+        else:
+            newest[pid] = (started, path)
+    return [path for _started, path in newest.values()], stale
+
+
+def _merge(totals, snap, with_gauges=True):
+    """Add one snapshot to totals = (counters, gauges, histograms)."""
+    counters, gauges, histograms = totals
+    for name, labels, value in snap.get('counters', []):
+        key = (name, tuple(tuple(p) for p in labels))
+        counters[key] = counters.get(key, 0) + value
+    if with_gauges:
+        for name, labels, value in snap.get('gauges', []):
+            key = (name, tuple(tuple(p) for p in labels))
+            gauges[key] = gauges.get(key, 0) + value
+    for name, labels, values in snap.get('histograms', []):
+        key = (name, tuple(tuple(p) for p in labels))
+        merged = histograms.get(key)
+        if merged is None:
+            histograms[key] = list(values)
+        else:
+            histograms[key] = [a + b for a, b in zip(merged, values)]
+
+
+def _fold(snaps, paths):
+    """Add the counters and histograms of `snaps` to retired.json, then delete `paths`.
+
+    Gauges describe running workers only and are dropped. Call with
+    _dir_lock() held.
+    """
+    retired = os.path.join(METRICS_DIR, _RETIRED)
+    totals = ({}, {}, {})
+    _merge(totals, _load(retired) or {})
+    for snap in snaps:
+        _merge(totals, snap, with_gauges=False)
+    counters, _gauges, histograms = totals
+    _write_json(retired, {
+        'counters': [[k[0], list(k[1]), v] for k, v in counters.items()],
+        'histograms': [[k[0], list(k[1]), v] for k, v in histograms.items()],
+    })
+    for path in paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def retire():
+    """Fold this worker's totals into retired.json and delete its snapshot.
+
+    Called when a worker exits (gunicorn's worker_exit hook, the ASGI
+    lifespan shutdown); nothing is written for this process afterwards.
+    Workers that die without it are folded in by the next collect().
+    """
+    global _retired
+    if _retired:
+        return
+    _retired = True
+    try:
+        # a flush still writing would put the snapshot back after the fold
+        with _flush_lock, _dir_lock():
+            _fold([_snapshot()], [_own_file()])
+    except OSError:
+        pass
+
+
+def collect_extra(name):
+    """Return the list of `name` extras from the snapshots of all running workers."""
+    flush(force=True)
+    snaps = (_load(path) for path in _snapshot_files()[0])
+    return [snap['extra'][name] for snap in snaps
+            if snap is not None and name in snap.get('extra', {})]
+
+
+def collect():
+    """Merge the snapshots of all workers into one set of metrics.
+
+    Snapshots of workers that are gone are folded into retired.json first;
+    its counters and histograms are part of the totals, gauges are only
+    summed for running workers.
+    """
+    flush(force=True)
+    totals = ({}, {}, {})
+    try:
+        with _dir_lock():
+            live, stale = _snapshot_files()
+            if stale:
+                _fold([snap for snap in map(_load, stale) if snap is not None], stale)
+            _merge(totals, _load(os.path.join(METRICS_DIR, _RETIRED)) or {})
+            for path in live:
+                snap = _load(path)
+                if snap is not None:
+                    _merge(totals, snap)
+    except OSError:
+        pass
+    return totals
+
+
+def _fmt_labels(labels, extra=None):
+    pairs = list(labels) + list(extra or [])
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+
+def render_prometheus():
+    """Render the merged metrics in the Prometheus text exposition format."""
+    counters, gauges, histograms = collect()
+    lines = []
+    seen = set()
+
+    def header(name):
+        if name in seen:
+            return
+        seen.add(name)
+        mtype, help_text = _META.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {mtype}')
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name)
+        lines.append(f'{name}{_fmt_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        header(name)
+        lines.append(f'{name}{_fmt_labels(labels)} {value}')
+    for (name, labels), values in sorted(histograms.items()):
+        header(name)
+        for bound, count in zip(DEFAULT_BUCKETS, values):
+            lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", bound)])} {count}')
+        lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", "+Inf")])} {values[-1]}')
+        lines.append(f'{name}_sum{_fmt_labels(labels)} {values[-2]}')
+        lines.append(f'{name}_count{_fmt_labels(labels)} {values[-1]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/metrics_view.py
+#
+# Flask side of metrics.py: the request timing hooks and the level 3
+# /metrics and /metrics/slow-queries views.
+
+import time
+
+from flask import Blueprint, Response, request, g, jsonify
+
+from auth import level_required
+from metrics import flush, gauge_add, inc, observe, render_prometheus
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _route_labels():
+    rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+    return {'route': rule, 'method': request.method, 'blueprint': request.blueprint or ''}
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_in_flight = True
+    gauge_add('http_requests_in_flight', 1)
+
+
+def _after_request(response):
+    start = g.get('_metrics_start')
+    if start is not None:
+        labels = _route_labels()
+        observe('http_request_duration_seconds', time.perf_counter() - start, labels)
+        inc('http_requests_total', {'route': labels['route'], 'method': labels['method'],
+                                    'status': str(response.status_code)})
+    return response
+
+
+def _teardown_request(exc):
+    if g.get('_metrics_in_flight'):
+        g._metrics_in_flight = False
+        gauge_add('http_requests_in_flight', -1)
+    flush()
+
+
+@metrics_bp.route('/metrics')
+@level_required(3)
+def show_metrics():
+    """Prometheus scrape endpoint (level 3 users only)."""
+    return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@metrics_bp.route('/metrics/slow-queries')
+@level_required(3)
+def show_slow_queries():
+    """Rolling top-N slow query summary across all workers (level 3 only)."""
+    from MySql import slow_query_summary
+    return jsonify(slow_query_summary())
+
+
+def init_metrics(app):
+    """Register the timing hooks and the /metrics endpoint on the app.
+
+    Call this first in app.py so the hooks wrap every other before_request
+    handler and the measured latency covers the whole request.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.register_blueprint(metrics_bp)
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/profiler.py
+#
+# Opt-in per-request profiler for admins.
+#
+# A level 3 user can add ?_profile=html (or the header "X-Profile: html") to
+# any URL and that single request runs under cProfile. Instead of the normal
+# page the response is an HTML summary of where the time went; use
+# ?_profile=prof to download the raw stats instead (open them with
+# `python3 -m pstats file.prof` or snakeviz). At most PROFILE_PER_MINUTE
+# requests are profiled per minute per worker.
+
+import cProfile
+import html
+import io
+import marshal
+import pstats
+import threading
+import time
+from collections import deque
+
+from flask import request, session, g, Response
+
+try:
+    import config
+except ImportError:
+    config = None
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'X-Profile'
+PROFILE_PER_MINUTE = int(getattr(config, 'PROFILE_PER_MINUTE', 6))
+# Number of functions listed in the HTML summary
+PROFILE_TOP = 40
+
+_lock = threading.Lock()
+_recent = deque()  # start times of recently profiled requests
+
+
+def _requested_mode():
+    """Return 'html' or 'prof' if profiling was asked for, else None."""
+    value = request.args.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+    if not value:
+        return None
+    return 'prof' if value.lower() in ('prof', 'download', 'pstats') else 'html'
+
+
+def _is_admin():
+    try:
+        return 'user_id' in session and int(session.get('level', 0) or 0) >= 3
+    except Exception:
+        return False
+
+
+def _take_slot():
+    """Rate limit: allow PROFILE_PER_MINUTE profiled requests per 60 seconds."""
+    now = time.monotonic()
+    with _lock:
+        while _recent and now - _recent[0] > 60:
+            _recent.popleft()
+        if len(_recent) >= PROFILE_PER_MINUTE:
+            return False
+        _recent.append(now)
+        return True
+
+
+def _before_request():
+    mode = _requested_mode()
+    if mode is None or not _is_admin() or not _take_slot():
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is already active in this thread
+        return
+    g._profiler = profiler
+    g._profile_mode = mode
+    g._profile_start = time.perf_counter()
+
+
+def _after_request(response):
+    profiler = g.pop('_profiler', None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    elapsed = time.perf_counter() - g.pop('_profile_start')
+    name = (request.endpoint or 'unmatched').replace('.', '_')
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+
+    if g.pop('_profile_mode') == 'prof':
+        profiler.create_stats()
+        return Response(marshal.dumps(profiler.stats), mimetype='application/octet-stream',
+                        headers={'Content-Disposition': f'attachment; filename=profile-{name}-{stamp}.prof'})
+    return Response(_render_html(profiler, elapsed, response.status_code), content_type='text/html')
+
+
+def _render_html(profiler, elapsed, status_code):
+    """Build a self-contained HTML summary with a bar per function."""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, lineno, funcname), (cc, nc, tt, ct, _callers) in stats.stats.items():
+        rows.append((ct, tt, nc, f'{funcname} ({filename}:{lineno})'))
+    rows.sort(reverse=True)
+    total = max(stats.total_tt, 1e-9)
+
+    out = io.StringIO()
+    out.write('<!DOCTYPE html><html><head><meta charset="UTF-8"><title>Profile</title><style>'
+              'body{font-family:monospace;font-size:13px}td{padding:1px 6px;white-space:nowrap}'
+              '.bar{background:#e8743b;height:12px}</style></head><body>')
+    out.write(f'<h2>{html.escape(request.method)} {html.escape(request.path)} &rarr; {status_code}</h2>')
+    out.write(f'<p>Wall time {elapsed * 1000:.1f} ms, profiled CPU time {stats.total_tt * 1000:.1f} ms, '
+              f'{stats.total_calls} calls. Top {PROFILE_TOP} functions by cumulative time.</p>')
+    out.write('<table><tr><th>cumulative</th><th></th><th>own</th><th>calls</th><th>function</th></tr>')
+    for ct, tt, nc, label in rows[:PROFILE_TOP]:
+        width = int(300 * min(ct / total, 1.0))
+        out.write(f'<tr><td>{ct * 1000:.2f} ms</td><td><div class="bar" style="width:{width}px"></div></td>'
+                  f'<td>{tt * 1000:.2f} ms</td><td>{nc}</td><td>{html.escape(label)}</td></tr>')
+    out.write('</table></body></html>')
+    return out.getvalue()
+
+
+def init_profiler(app):
+    """Register the profiling hooks on the app.
+
+    Call this right after metrics_view.init_metrics(app) so the profile covers
+    every other hook as well as the view itself.
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/renderers.py
+#
+# Registry for the legacy CGI-style renderers (list_dr_who.render_drwho,
+# shopping_list.render_shoppinglist, ...).
+#
+# Each renderer module is imported once and kept. Before a render the source
+# file's mtime is checked (at most every RENDERER_CHECK_INTERVAL seconds) and
+# the module is reloaded only when the file actually changed, so editing a
+# script still takes effect without a restart. Reloads are serialized per
+# module, and every render is timed into the metrics.
+
+import importlib
+import os
+import threading
+import time
+
+from flask import Response, current_app
+
+import metrics
+
+try:
+    import config
+except ImportError:
+    config = None
+
+RENDERER_CHECK_INTERVAL = float(getattr(config, 'RENDERER_CHECK_INTERVAL', 1.0))
+
+
+class LegacyRenderer:
+    """One registered renderer: module + function + how to build its kwargs."""
+
+    def __init__(self, name, module_name, func_name, kwargs=None):
+        self.name = name
+        self.module_name = module_name
+        self.func_name = func_name
+        self.kwargs = kwargs  # callable returning a dict, evaluated per request
+        self.module = None
+        self.mtime = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def _source_mtime(self, module):
+        try:
+            return os.stat(module.__file__).st_mtime_ns
+        except (OSError, TypeError, AttributeError):
+            return None
+
+    def get_module(self):
+        """Return the module, importing it once and reloading it if its file changed."""
+        now = time.monotonic()
+        module = self.module
+        if module is not None and now - self.checked < RENDERER_CHECK_INTERVAL:
+            return module
+        with self.lock:
+            if self.module is None:
+                self.module = importlib.import_module(self.module_name)
+                self.mtime = self._source_mtime(self.module)
+            elif now - self.checked >= RENDERER_CHECK_INTERVAL:
+                mtime = self._source_mtime(self.module)
+                if mtime is not None and mtime != self.mtime:
+                    self.module = importlib.reload(self.module)
+                    self.mtime = mtime
+                    metrics.inc('legacy_renderer_reloads_total', {'renderer': self.name})
+            self.checked = now
+            return self.module
+
+    def render(self):
+        module = self.get_module()
+        kwargs = self.kwargs() if self.kwargs else {}
+        with metrics.timer('legacy_render_duration_seconds', {'renderer': self.name}):
+            return getattr(module, self.func_name)(**kwargs)
+
+
+class RendererRegistry:
+    """Named LegacyRenderer objects plus a helper to expose them as routes."""
+
+    def __init__(self):
+        self.renderers = {}
+
+    def register(self, name, module_name, func_name, kwargs=None):
+        self.renderers[name] = LegacyRenderer(name, module_name, func_name, kwargs)
+        return self.renderers[name]
+
+    def respond(self, name):
+        """Render `name` and wrap the HTML in a response (500 page on errors)."""
+        renderer = self.renderers[name]
+        try:
+            return Response(renderer.render(), content_type='text/html')
+        except Exception as e:
+            current_app.logger.exception('Error executing %s.%s: %s', renderer.module_name, renderer.func_name, e)
+            return Response(f'<h1>Error</h1><p>{e}</p>', status=500, content_type='text/html')
+
+    def add_route(self, blueprint, rule, name, module_name, func_name, kwargs=None, methods=('GET',)):
+        """Register a renderer and serve it at `rule` on `blueprint` in one call."""
+        self.register(name, module_name, func_name, kwargs)
+        blueprint.add_url_rule(rule, f'legacy_{name}', lambda: self.respond(name), methods=list(methods))
+
+
+registry = RendererRegistry()
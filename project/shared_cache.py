@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/shared_cache.py
+#
+# Host-local cache shared by all gunicorn workers.
+#
+# Every entry is one small file in SHARED_CACHE_DIR (by default on /dev/shm,
+# i.e. in memory) holding its expiry time followed by the pickled value, so what one
+# worker computes is a hit for the others. Writes go to a temporary file
+# that is renamed into place, so readers never see half an entry.
+#
+# Entries are unpickled, so the directory must be private: the default is
+# per user (site_starter_cache-<uid>), and before first use the directory is
+# checked to be a real directory owned by this user with no group or other
+# permissions. If it is not, the cache is disabled (every lookup computes)
+# and an error is printed, rather than loading files someone else planted.
+#
+# get_or_compute() collapses concurrent computes of the same key: threads of
+# one worker wait on a lock and other workers wait on an flock()ed lock file,
+# then re-read the entry the first one wrote. Total size is kept under
+# SHARED_CACHE_MAX_BYTES by dropping expired entries and then the least
+# recently used ones. Hits and misses are counted in the metrics.
+
+import hashlib
+import os
+import pickle
+import re
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: only computes within one worker are collapsed
+    fcntl = None
+
+try:
+    import config
+except ImportError:
+    config = None
+
+_DEFAULT_DIR = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                            f'site_starter_cache-{os.getuid()}' if hasattr(os, 'getuid') else 'site_starter_cache')
+SHARED_CACHE_DIR = getattr(config, 'SHARED_CACHE_DIR', None) or _DEFAULT_DIR
+SHARED_CACHE_MAX_BYTES = int(getattr(config, 'SHARED_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+SHARED_CACHE_TTL = float(getattr(config, 'SHARED_CACHE_TTL', 60))
+
+_LOCK_STRIPES = 64          # lock files / thread locks shared by all keys
+_EVICT_EVERY = 5.0          # seconds between size checks of one worker
+_SAFE_NAMESPACE = re.compile(r'[^0-9A-Za-z_]')
+_HEADER = struct.Struct('<d')  # expiry as a unix time, 0 = never
+
+
+class SharedCache:
+    """File-per-key cache with TTLs, LRU size bound and collapsed computes.
+
+    Keys are tuples whose first element is a namespace ('menu', 'gallery',
+    ...); invalidate(namespace) drops a whole family of entries.
+    """
+
+    def __init__(self, directory=SHARED_CACHE_DIR, max_bytes=SHARED_CACHE_MAX_BYTES, default_ttl=SHARED_CACHE_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._ready = None  # None: not checked yet, then True / False
+        self._last_evict = 0.0
+        self._reset_locks()
+
+    def _reset_locks(self):
+        self._thread_locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def _ensure_dir(self):
+        """True if the directory exists and only this user can write to it."""
+        if self._ready is None:
+            try:
+                os.makedirs(self.directory, mode=0o700, exist_ok=True)
+                st = os.lstat(self.directory)
+                private = (stat.S_ISDIR(st.st_mode) and not st.st_mode & 0o077
+                           and (not hasattr(os, 'getuid') or st.st_uid == os.getuid()))
+                if private:
+                    os.makedirs(os.path.join(self.directory, 'locks'), mode=0o700, exist_ok=True)
+                self._ready = private
+                problem = 'it must be a directory owned by this user with mode 0700'
+            except OSError as e:
+                self._ready = False
+                problem = e
+            if not self._ready:
+                print(f"Shared cache disabled, cannot use {self.directory}: {problem}", file=sys.stderr)
+        return self._ready
+
+    def _name(self, key):
+        namespace = _SAFE_NAMESPACE.sub('_', str(key[0]))
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return f'{namespace}.{digest}'
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._name(key))
+
+    def _count(self, key, result):
+        if result == 'hit':
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc('shared_cache_total', {'namespace': str(key[0]), 'result': result})
+
+    def _read(self, path):
+        """Return (found, value) for an entry file, deleting it if expired."""
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+        except OSError:
+            return False, None
+        if len(data) < _HEADER.size:
+            return False, None
+        (expires,) = _HEADER.unpack_from(data)
+        if expires and expires < time.time():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return False, None
+        try:
+            value = pickle.loads(data[_HEADER.size:])
+        except (pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+            return False, None
+        try:
+            os.utime(path)  # mtime doubles as "last used" for LRU eviction
+        except OSError:
+            pass
+        return True, value
+
+    def get(self, key, default=None):
+        if not self._ensure_dir():
+            self._count(key, 'miss')
+            return default
+        found, value = self._read(self._path(key))
+        self._count(key, 'hit' if found else 'miss')
+        return value if found else default
+
+    def set(self, key, value, ttl=None):
+        """Store `value` for `ttl` seconds (default_ttl if None, 0 = no expiry)."""
+        if not self._ensure_dir():
+            return
+        ttl = self.default_ttl if ttl is None else ttl
+        data = _HEADER.pack(time.time() + ttl if ttl else 0) + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'wb') as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            metrics.inc('shared_cache_errors_total', {'namespace': str(key[0])})
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        if time.monotonic() - self._last_evict >= _EVICT_EVERY:
+            self._last_evict = time.monotonic()
+            self.evict()
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """
+        Return the cached value for `key`, or call compute() once (across all
+        threads and workers on this host), store and return its result.
+        Exceptions from compute() propagate and nothing is stored.
+        """
+        if not self._ensure_dir():
+            self._count(key, 'miss')
+            return compute()
+        path = self._path(key)
+        found, value = self._read(path)
+        if found:
+            self._count(key, 'hit')
+            return value
+        stripe = int(self._name(key)[-8:], 16) % _LOCK_STRIPES
+        with self._thread_locks[stripe]:
+            lock_fh = None
+            if fcntl is not None:
+                lock_fh = open(os.path.join(self.directory, 'locks', f'{stripe:02d}'), 'a+b')
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                # someone else may have computed it while we waited
+                found, value = self._read(path)
+                if found:
+                    self._count(key, 'hit')
+                    return value
+                self._count(key, 'miss')
+                value = compute()
+                self.set(key, value, ttl)
+                return value
+            finally:
+                if lock_fh is not None:
+                    fcntl.flock(lock_fh, fcntl.LOCK_UN)
+                    lock_fh.close()
+
+    def invalidate(self, namespace=None, *key_rest):
+        """Drop one entry (namespace plus the rest of its key), a namespace, or everything."""
+        if namespace is not None and key_rest:
+            names = [self._name((namespace,) + key_rest)]
+        else:
+            prefix = None if namespace is None else _SAFE_NAMESPACE.sub('_', str(namespace)) + '.'
+            try:
+                names = [n for n in os.listdir(self.directory)
+                         if not n.endswith('.tmp') and n != 'locks' and (prefix is None or n.startswith(prefix))]
+            except FileNotFoundError:
+                return
+        for name in names:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def evict(self):
+        """Delete expired entries, then the least recently used until under max_bytes."""
+        now = time.time()
+        entries = []
+        total = 0
+        try:
+            scan = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return
+        for entry in scan:
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            try:
+                st = entry.stat()
+                with open(entry.path, 'rb') as fh:
+                    (expires,) = _HEADER.unpack(fh.read(_HEADER.size))
+            except (OSError, struct.error):
+                continue
+            if expires and expires < now:
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _mtime, size, path = entries.pop(0)
+            try:
+                os.unlink(path)
+                total -= size
+                metrics.inc('shared_cache_evictions_total')
+            except OSError:
+                pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'directory': self.directory,
+                'max_bytes': self.max_bytes}
+
+
+shared_cache = SharedCache()
+
+
+def _reset_after_fork():
+    # fresh per-worker counters and locks; the entries themselves are shared
+    shared_cache.hits = 0
+    shared_cache.misses = 0
+    shared_cache._reset_locks()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
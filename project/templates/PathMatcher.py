@@ -3,14 +3,24 @@
 Standalone PathMatcher GUI (no web server).
 
 Usage:
-  python3 templates/PathMatcher.py
+  python3 templates/PathMatcher.py [--queue pathmatcher_queue.json]
 
 This opens a simple tkinter GUI that:
  - Loads titles from newmedia.drwho (id, title, episodes)
- - For each title you can search newmedia.dr_who_master.file_path with a LIKE %title% query
- - Results show as selectable checkboxes; selecting one fills the filepath input
+ - For each title you can search newmedia.dr_who_master.file_path; all paths are
+   loaded once into an in-memory trigram index (path_index.py) that returns
+   ranked fuzzy matches, and is refreshed incrementally by id on later searches
+ - Searches run as you type in the Search box (debounced), recent results are
+   kept in a small LRU, and results show in a list that stays fast with
+   thousands of rows; selecting one fills the filepath input
  - Edit/compose episodes in the episodes box and press Add to update newmedia.drwho.episodes for that title
  - After adding, the app advances to the next title
+ - With --queue, only the titles left ambiguous by the headless bulk matcher
+   (templates/path_automatch.py) are loaded
+
+All database work happens on ONE background thread with ONE long-lived
+connection; the GUI only queues requests to it, and a search that has been
+superseded by a newer one is dropped before it runs.
 
 Prerequisites: pymysql and a config.py containing DB_CONFIG dict for pymysql.connect
 
@@ -18,9 +28,13 @@ If DB_CONFIG is not found, the app will stop and print an instruction message.
 
 """
 
-import sys
 import os
+import json
+import argparse
+import queue
 import threading
+import time
+from collections import OrderedDict
 try:
     import tkinter as tk
     from tkinter import ttk, messagebox
@@ -34,12 +48,21 @@ except Exception:
     print('pymysql is required. Install with: pip3 install pymysql')
     raise
 
+from path_index import PathIndex, normalize
+
 # load DB config
 try:
     from config import DB_CONFIG
 except Exception:
     DB_CONFIG = None
 
+SEARCH_DEBOUNCE_MS = 250      # wait this long after the last keystroke
+RECENT_SEARCHES = 32          # size of the LRU of recent search results
+SEARCH_LIMIT = 2000           # rows returned per search
+INDEX_REFRESH_SECONDS = 30    # how often a search may look for new paths
+
+_SUPERSEDED = object()
+
 
 def get_db_connection():
     """Establishes and returns a database connection."""
@@ -54,9 +77,91 @@ def get_db_connection():
         raise
 
 
+class DbWorker(threading.Thread):
+    """
+    The only thread that touches the database. Requests are queued by the GUI
+    and answered through app.after() so callbacks run on the Tk thread.
+    """
+
+    def __init__(self, app):
+        super().__init__(daemon=True)
+        self.app = app
+        self.requests = queue.Queue()
+        self.conn = None
+        self.path_index = PathIndex()
+        self.index_checked = 0.0
+        self.latest_search = 0  # generation number of the newest search request
+
+    def submit(self, kind, *args, callback=None, on_error=None):
+        self.requests.put((kind, args, callback, on_error))
+
+    def search(self, query, callback, on_error=None):
+        self.latest_search += 1
+        self.submit('search', self.latest_search, query, callback=callback, on_error=on_error)
+
+    def stop(self):
+        self.submit('stop')
+
+    def _connection(self):
+        if self.conn is None:
+            self.conn = get_db_connection()
+        else:
+            self.conn.ping(reconnect=True)
+        return self.conn
+
+    def run(self):
+        while True:
+            kind, args, callback, on_error = self.requests.get()
+            if kind == 'stop':
+                break
+            try:
+                result = getattr(self, '_do_' + kind)(*args)
+            except Exception as e:
+                # drop the connection; the next request reconnects
+                try:
+                    if self.conn is not None:
+                        self.conn.close()
+                except Exception:
+                    pass
+                self.conn = None
+                if on_error is not None:
+                    self.app.after(0, on_error, e)
+                continue
+            if result is not _SUPERSEDED and callback is not None:
+                self.app.after(0, callback, result)
+        if self.conn is not None:
+            self.conn.close()
+
+    def _do_load_titles(self):
+        with self._connection().cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute('SELECT id, title, episodes FROM newmedia.drwho ORDER BY id ASC')
+            return cur.fetchall()
+
+    def _do_search(self, generation, query):
+        if generation != self.latest_search:
+            return _SUPERSEDED  # the user kept typing; a newer search is queued
+        added = 0
+        now = time.monotonic()
+        if len(self.path_index) == 0:
+            added = self.path_index.load(self._connection())
+            self.index_checked = now
+        elif now - self.index_checked >= INDEX_REFRESH_SECONDS:
+            added = self.path_index.refresh(self._connection())
+            self.index_checked = now
+        return query, self.path_index.search(query, limit=SEARCH_LIMIT), added
+
+    def _do_save(self, drwho_id, episodes_text):
+        conn = self._connection()
+        with conn.cursor() as cur:
+            cur.execute('UPDATE newmedia.drwho SET episodes=%s WHERE id=%s', (episodes_text, drwho_id))
+        conn.commit()
+        return drwho_id
+
+
 class PathMatcherApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, queue_file=None):
         super().__init__()
+        self.queue_file = queue_file
         self.title('PathMatcher')
         self.geometry('900x640')
 
@@ -64,9 +169,14 @@ class PathMatcherApp(tk.Tk):
         self.titles = []  # list of dicts: id,title,episodes
         self.index = -1
         self.search_results = []  # current search rows
-        self.check_vars = []
+        self.recent = OrderedDict()  # normalized query -> rows (LRU)
+        self.pending_search = None  # after() id of the debounced search
+
+        self.worker = DbWorker(self)
+        self.worker.start()
 
         self.create_widgets()
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
 
     def create_widgets(self):
         frm = ttk.Frame(self, padding=10)
@@ -91,27 +201,39 @@ class PathMatcherApp(tk.Tk):
         self.title_entry = ttk.Entry(frm, textvariable=self.title_var, state='readonly')
         self.title_entry.pack(fill='x')
 
-        # filepath + search
+        # search-as-you-type box (starts with the title)
+        search_row = ttk.Frame(frm)
+        search_row.pack(fill='x', pady=(8,0))
+        ttk.Label(search_row, text='Search:').pack(side='left')
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(search_row, textvariable=self.search_var)
+        self.search_entry.pack(side='left', fill='x', expand=True, padx=(8,0))
+        self.search_entry.bind('<KeyRelease>', self.schedule_search)
+        self.search_entry.bind('<Return>', lambda e: self.do_search())
+        self.search_btn = ttk.Button(search_row, text='Search', command=self.do_search)
+        self.search_btn.pack(side='left', padx=(8,0))
+
+        # filepath
         row = ttk.Frame(frm)
         row.pack(fill='x', pady=(8,0))
+        ttk.Label(row, text='Filepath:').pack(side='left')
         self.filepath_var = tk.StringVar()
         self.filepath_entry = ttk.Entry(row, textvariable=self.filepath_var)
-        self.filepath_entry.pack(side='left', fill='x', expand=True)
-        self.search_btn = ttk.Button(row, text='Search', command=self.do_search)
-        self.search_btn.pack(side='left', padx=(8,0))
+        self.filepath_entry.pack(side='left', fill='x', expand=True, padx=(8,0))
 
-        # results list (scrollable)
+        # results list: a Listbox only draws the visible rows, so thousands of
+        # results cost one insert call instead of one widget per row
         results_lbl = ttk.Label(frm, text='Search results (select to use as filepath)')
         results_lbl.pack(anchor='w', pady=(8,0))
 
-        self.results_canvas = tk.Canvas(frm, height=220)
-        self.results_frame = ttk.Frame(self.results_canvas)
-        self.scrollbar = ttk.Scrollbar(frm, orient='vertical', command=self.results_canvas.yview)
-        self.results_canvas.configure(yscrollcommand=self.scrollbar.set)
+        results = ttk.Frame(frm)
+        results.pack(fill='x')
+        self.results_list = tk.Listbox(results, height=12, activestyle='none', exportselection=False)
+        self.scrollbar = ttk.Scrollbar(results, orient='vertical', command=self.results_list.yview)
+        self.results_list.configure(yscrollcommand=self.scrollbar.set)
         self.scrollbar.pack(side='right', fill='y')
-        self.results_canvas.pack(fill='x')
-        self.results_canvas.create_window((0,0), window=self.results_frame, anchor='nw')
-        self.results_frame.bind('<Configure>', lambda e: self.results_canvas.configure(scrollregion=self.results_canvas.bbox('all')))
+        self.results_list.pack(side='left', fill='x', expand=True)
+        self.results_list.bind('<<ListboxSelect>>', self.on_result_selected)
 
         # episodes box
         ep_lbl = ttk.Label(frm, text='Episodes (will be saved into newmedia.drwho.episodes)')
@@ -130,18 +252,30 @@ class PathMatcherApp(tk.Tk):
     def set_status(self, text):
         self.status_lbl.config(text='Status: '+text)
 
+    def on_close(self):
+        self.worker.stop()
+        self.destroy()
+
     def load_titles(self):
         self.set_status('loading titles...')
-        try:
-            conn = get_db_connection()
-            with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                cur.execute('SELECT id, title, episodes FROM newmedia.drwho ORDER BY id ASC')
-                rows = cur.fetchall()
-            conn.close()
-        except Exception as e:
-            messagebox.showerror('DB error', str(e))
-            self.set_status('error loading titles')
-            return
+        self.worker.submit('load_titles', callback=self._titles_loaded, on_error=self._titles_error)
+
+    def _titles_error(self, e):
+        messagebox.showerror('DB error', str(e))
+        self.set_status('error loading titles')
+
+    def _titles_loaded(self, rows):
+        if self.queue_file:
+            # keep only the titles the bulk matcher could not decide, in queue order
+            try:
+                with open(self.queue_file) as fh:
+                    queued = [item['id'] for item in json.load(fh)]
+            except Exception as e:
+                messagebox.showerror('Queue error', str(e))
+                self.set_status('error loading queue')
+                return
+            by_id = {r['id']: r for r in rows}
+            rows = [by_id[i] for i in queued if i in by_id]
         self.titles = rows
         if not self.titles:
             messagebox.showinfo('Info', 'No titles found in newmedia.drwho')
@@ -149,22 +283,24 @@ class PathMatcherApp(tk.Tk):
             return
         self.index = 0
         self.show_current()
-        self.set_status('titles loaded')
 
     def show_current(self):
         if self.index<0 or self.index>=len(self.titles):
             self.title_var.set('')
+            self.search_var.set('')
             self.episodes_text.delete('1.0', 'end')
             self.filepath_var.set('')
             self.set_status('out of range')
             return
         row = self.titles[self.index]
         self.title_var.set(row.get('title') or '')
+        self.search_var.set(row.get('title') or '')
         self.episodes_text.delete('1.0', 'end')
         self.episodes_text.insert('1.0', row.get('episodes') or '')
         self.filepath_var.set('')
         self.clear_results()
         self.set_status(f'showing {self.index+1}/{len(self.titles)}')
+        self.do_search()
 
     def prev_title(self):
         if self.index>0:
@@ -177,77 +313,77 @@ class PathMatcherApp(tk.Tk):
             self.show_current()
 
     def clear_results(self):
-        for child in self.results_frame.winfo_children():
-            child.destroy()
-        self.check_vars = []
+        self.results_list.delete(0, 'end')
         self.search_results = []
 
+    def schedule_search(self, event=None):
+        """Debounce: only search once typing pauses for SEARCH_DEBOUNCE_MS."""
+        if self.pending_search is not None:
+            self.after_cancel(self.pending_search)
+        self.pending_search = self.after(SEARCH_DEBOUNCE_MS, self.do_search)
+
     def do_search(self):
-        title = self.title_var.get()
-        if not title:
-            messagebox.showinfo('Info','No title to search')
+        self.pending_search = None
+        query = self.search_var.get().strip() or self.title_var.get()
+        if not query:
+            return
+        key = normalize(query)
+        cached = self.recent.get(key)
+        if cached is not None:
+            self.recent.move_to_end(key)
+            self.search_results = cached
+            self.populate_results()
             return
         self.set_status('searching...')
-        threading.Thread(target=self._search_thread, args=(title,), daemon=True).start()
-
-    def _search_thread(self, title):
-        try:
-            conn = get_db_connection()
-            with conn.cursor(pymysql.cursors.DictCursor) as cur:
-                pattern = f"%{title}%"
-                cur.execute('SELECT id, file_path FROM newmedia.dr_who_master WHERE file_path LIKE %s LIMIT 200', (pattern,))
-                rows = cur.fetchall()
-            conn.close()
-        except Exception as e:
-            self.after(0, lambda: (messagebox.showerror('DB error', str(e)), self.set_status('search error')))
+        self.worker.search(query, callback=self._search_done,
+                           on_error=lambda e: (messagebox.showerror('DB error', str(e)), self.set_status('search error')))
+
+    def _search_done(self, result):
+        query, rows, added = result
+        if added and len(self.recent):
+            # new paths arrived; older cached results may be incomplete
+            self.recent.clear()
+        self.recent[normalize(query)] = rows
+        while len(self.recent) > RECENT_SEARCHES:
+            self.recent.popitem(last=False)
+        # ignore answers for a query the user has already changed
+        if normalize(self.search_var.get().strip() or self.title_var.get()) != normalize(query):
             return
         self.search_results = rows
-        self.after(0, self.populate_results)
+        self.populate_results()
 
     def populate_results(self):
-        self.clear_results()
+        self.clear_results_list_only()
         if not self.search_results:
-            lbl = ttk.Label(self.results_frame, text='(no results)')
-            lbl.pack(anchor='w')
+            self.results_list.insert('end', '(no results)')
             self.set_status('no results')
             return
-        for i, r in enumerate(self.search_results):
-            var = tk.IntVar(value=0)
-            cb = ttk.Checkbutton(self.results_frame, variable=var, text=r.get('file_path'))
-            # when selected, unselect others and set filepath
-            def make_cmd(v=var, path=r.get('file_path')):
-                def cmd():
-                    if v.get():
-                        # uncheck others
-                        for vv in self.check_vars:
-                            if vv is not v:
-                                vv.set(0)
-                        self.filepath_var.set(path)
-                    else:
-                        self.filepath_var.set('')
-                return cmd
-            cb.config(command=make_cmd())
-            cb.pack(anchor='w', fill='x')
-            self.check_vars.append(var)
+        self.results_list.insert('end', *[f"{r.get('file_path')}  [{r.get('score')}]" for r in self.search_results])
         self.set_status(f'found {len(self.search_results)} results')
 
+    def clear_results_list_only(self):
+        self.results_list.delete(0, 'end')
+
+    def on_result_selected(self, event=None):
+        selection = self.results_list.curselection()
+        if not selection or selection[0] >= len(self.search_results):
+            return
+        self.filepath_var.set(self.search_results[selection[0]].get('file_path'))
+
     def add_and_advance(self):
         if self.index<0 or self.index>=len(self.titles):
             return
         drwho_id = self.titles[self.index]['id']
         episodes_text = self.episodes_text.get('1.0', 'end').strip()
-        try:
-            conn = get_db_connection()
-            with conn.cursor() as cur:
-                cur.execute('UPDATE newmedia.drwho SET episodes=%s WHERE id=%s', (episodes_text, drwho_id))
-                conn.commit()
-            conn.close()
-        except Exception as e:
-            messagebox.showerror('DB error', str(e))
-            self.set_status('save error')
-            return
+        self.set_status('saving...')
+        self.worker.submit('save', drwho_id, episodes_text, callback=self._saved,
+                           on_error=lambda e: (messagebox.showerror('DB error', str(e)), self.set_status('save error')))
+
+    def _saved(self, drwho_id):
         self.set_status('saved')
-        # advance index
+        # advance index (only if the user is still on the title that was saved)
+        if self.index < 0 or self.titles[self.index]['id'] != drwho_id:
+            return
         if self.index < len(self.titles)-1:
             self.index += 1
             self.show_current()
@@ -257,7 +393,10 @@ class PathMatcherApp(tk.Tk):
 
 
 if __name__ == '__main__':
-    app = PathMatcherApp()
+    parser = argparse.ArgumentParser(description='PathMatcher GUI')
+    parser.add_argument('--queue', help='review queue written by templates/path_automatch.py')
+    args = parser.parse_args()
+    app = PathMatcherApp(queue_file=args.queue)
     try:
         app.mainloop()
     except Exception as e:
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Headless bulk auto-match for PathMatcher (no GUI, no tkinter needed).
+
+Usage:
+  python3 templates/path_automatch.py [--threshold 0.85] [--margin 0.1] [--dry-run]
+
+This:
+ - Loads every title from newmedia.drwho (by default only those whose
+   episodes are still empty; --overwrite includes all)
+ - Builds the trigram index over newmedia.dr_who_master.file_path once
+ - Scores every title against every path in parallel across all CPU cores
+ - Auto-accepts a title when its best-matching folder scores at least
+   --threshold and beats the next folder by --margin; the accepted episodes
+   are that folder's matching file paths, one per line
+ - Writes all accepted titles in ONE transaction
+ - Writes the remaining (ambiguous) titles and their candidates to a queue
+   file, which the GUI opens with: python3 templates/PathMatcher.py --queue FILE
+
+Prerequisites: pymysql and a config.py containing DB_CONFIG dict for pymysql.connect
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+try:
+    import pymysql
+except Exception:
+    print('pymysql is required. Install with: pip3 install pymysql')
+    raise
+
+from path_index import PathIndex
+
+# load DB config
+try:
+    from config import DB_CONFIG
+except Exception:
+    DB_CONFIG = None
+
+DEFAULT_QUEUE = 'pathmatcher_queue.json'
+
+# Set in the parent before the worker pool forks, so every worker shares the
+# (read-only) index through copy-on-write memory instead of pickling it
+_INDEX = None
+_ARGS = None
+
+
+def get_db_connection():
+    """Establishes and returns a database connection."""
+    if DB_CONFIG is None:
+        raise RuntimeError('DB_CONFIG not found in config.py (see templates/PathMatcher.py for an example).')
+    return pymysql.connect(**DB_CONFIG)
+
+
+def folder_of(path):
+    return os.path.dirname(path.replace('\\', '/'))
+
+
+def score_title(row):
+    """Worker: match one title. Returns (row, decision, episodes, candidates)."""
+    hits = _INDEX.search(row['title'] or '', limit=_ARGS.candidates)
+    # group hits by folder: one folder is one serial
+    folders = {}
+    for h in hits:
+        folders.setdefault(folder_of(h['file_path']), []).append(h)
+    ranked = sorted(folders.items(), key=lambda kv: -max(h['score'] for h in kv[1]))
+    candidates = [h['file_path'] for h in hits[:20]]
+    if not ranked:
+        return row, 'ambiguous', None, candidates
+    best_score = max(h['score'] for h in ranked[0][1])
+    runner_up = max(h['score'] for h in ranked[1][1]) if len(ranked) > 1 else 0.0
+    if best_score >= _ARGS.threshold and best_score - runner_up >= _ARGS.margin:
+        episodes = sorted(h['file_path'] for h in ranked[0][1] if h['score'] >= _ARGS.threshold)
+        return row, 'accepted', '\n'.join(episodes), candidates
+    return row, 'ambiguous', None, candidates
+
+
+def score_all(titles, processes):
+    """Score every title, in parallel when fork is available."""
+    if processes > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(processes) as pool:
+            return pool.map(score_title, titles, chunksize=max(1, len(titles) // (processes * 8)))
+    return [score_title(t) for t in titles]
+
+
+def main(argv=None):
+    global _INDEX, _ARGS
+    parser = argparse.ArgumentParser(description='Bulk auto-match newmedia.drwho titles to dr_who_master paths.')
+    parser.add_argument('--threshold', type=float, default=0.85, help='minimum score to auto-accept')
+    parser.add_argument('--margin', type=float, default=0.10, help='required lead over the next best folder')
+    parser.add_argument('--candidates', type=int, default=200, help='matches considered per title')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--overwrite', action='store_true', help='also re-match titles that already have episodes')
+    parser.add_argument('--queue', default=DEFAULT_QUEUE, help='where to write the ambiguous titles')
+    parser.add_argument('--dry-run', action='store_true', help='report only, do not write to the database')
+    _ARGS = args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        with conn.cursor(pymysql.cursors.DictCursor) as cur:
+            cur.execute('SELECT id, title, episodes FROM newmedia.drwho ORDER BY id ASC')
+            titles = [r for r in cur.fetchall() if args.overwrite or not (r.get('episodes') or '').strip()]
+        _INDEX = PathIndex()
+        _INDEX.load(conn)
+        print(f'{len(titles)} titles, {len(_INDEX)} paths indexed in {time.perf_counter() - t0:.1f}s', file=sys.stderr)
+
+        t1 = time.perf_counter()
+        results = score_all(titles, args.processes)
+        print(f'scored in {time.perf_counter() - t1:.1f}s using {args.processes} processes', file=sys.stderr)
+
+        accepted = [(episodes, row['id']) for row, decision, episodes, _c in results if decision == 'accepted']
+        queue = [{'id': row['id'], 'title': row['title'], 'candidates': candidates}
+                 for row, decision, _e, candidates in results if decision != 'accepted']
+
+        if accepted and not args.dry_run:
+            # all accepted titles in one transaction
+            try:
+                with conn.cursor() as cur:
+                    cur.executemany('UPDATE newmedia.drwho SET episodes=%s WHERE id=%s', accepted)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+    with open(args.queue, 'w') as fh:
+        json.dump(queue, fh, indent=1)
+    print(f'accepted {len(accepted)}{" (dry run, nothing written)" if args.dry_run else ""}, '
+          f'{len(queue)} left for review in {args.queue}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+In-memory fuzzy index over newmedia.dr_who_master.file_path for PathMatcher.
+
+All paths are loaded once and broken into character trigrams of a normalized
+form (lower case, punctuation and episode numbering removed). A search looks
+up the trigrams of the query in the inverted index and ranks the candidate
+paths by how much of the query they contain, so near matches such as
+"Dalek's Master Plan" vs "daleks_master_plan" are found in milliseconds
+without a LIKE '%...%' table scan.
+
+New rows are picked up with refresh(), which only fetches ids above the
+highest id seen so far.
+"""
+
+import re
+from collections import defaultdict
+
+# Episode numbering that should not influence matching: s01e02, 1x02,
+# "episode 3", "ep3", "part 4", and bare leading track numbers like "001 - "
+_EPISODE = re.compile(r"\b(?:s\d{1,2}\s*e\d{1,3}|\d{1,2}x\d{1,3}|ep(?:isode)?\s*\d+|part\s*\d+)\b")
+_LEADING_NUMBER = re.compile(r"^\s*\d{1,4}(?=\s)")
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_APOSTROPHE = re.compile(r"['’`]")
+_EXTENSION = re.compile(r"\.[0-9a-z]{2,4}$")
+
+
+def normalize(text):
+    """Lower-case, drop extension, apostrophes, punctuation and episode numbering."""
+    text = (text or '').lower()
+    text = _EXTENSION.sub('', text)
+    text = _APOSTROPHE.sub('', text)
+    text = _NON_ALNUM.sub(' ', text)
+    text = _EPISODE.sub(' ', text)
+    text = _LEADING_NUMBER.sub(' ', text)
+    return ' '.join(text.split())
+
+
+def trigrams(text):
+    """Character trigrams of each word, padded so short words still count."""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class PathIndex:
+    """Trigram inverted index over (id, file_path) rows."""
+
+    def __init__(self, table='newmedia.dr_who_master'):
+        self.table = table
+        self._reset()
+
+    def _reset(self):
+        self.paths = {}                   # id -> original file_path
+        self.grams = {}                   # id -> trigram set
+        self.postings = defaultdict(set)  # trigram -> ids
+        self.max_id = 0
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, row_id, path):
+        if row_id in self.paths:
+            self.remove(row_id)
+        # only the folder and file name carry the title; the leading
+        # directories are the same for every row and would just add noise.
+        # Each part is normalized on its own so a file name's track number
+        # is still leading.
+        parts = path.replace('\\', '/').split('/')[-2:]
+        grams = trigrams(' '.join(normalize(part) for part in parts))
+        self.paths[row_id] = path
+        self.grams[row_id] = grams
+        for g in grams:
+            self.postings[g].add(row_id)
+        self.max_id = max(self.max_id, row_id)
+
+    def remove(self, row_id):
+        for g in self.grams.pop(row_id, ()):
+            ids = self.postings.get(g)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self.postings[g]
+        self.paths.pop(row_id, None)
+
+    def add_rows(self, rows):
+        """Add rows shaped like {'id': ..., 'file_path': ...} or (id, file_path)."""
+        count = 0
+        for row in rows:
+            if isinstance(row, dict):
+                self.add(row['id'], row['file_path'])
+            else:
+                self.add(row[0], row[1])
+            count += 1
+        return count
+
+    def load(self, conn):
+        """(Re)load every path from the database."""
+        self._reset()
+        return self.refresh(conn)
+
+    def refresh(self, conn):
+        """Fetch only rows with an id above the highest one already indexed."""
+        with conn.cursor() as cur:
+            cur.execute(f'SELECT id, file_path FROM {self.table} WHERE id > %s ORDER BY id ASC', (self.max_id,))
+            return self.add_rows(cur.fetchall())
+
+    def search(self, query, limit=200, min_score=0.3):
+        """
+        Return up to `limit` rows {'id', 'file_path', 'score'} ranked by score.
+
+        The score is mostly the share of the query's trigrams found in the path
+        (so a short title inside a long path still scores high), with a small
+        Dice-similarity term so tighter matches rank first.
+        """
+        qgrams = trigrams(normalize(query))
+        if not qgrams:
+            return []
+        # Candidates come from the query's selective trigrams only; grams that
+        # occur in a large share of all paths ("the", " pa") would pull in
+        # most of the table. If every gram is common, use the rarest few.
+        common = max(50, len(self.paths) // 20)
+        postings = sorted((self.postings[g] for g in qgrams if g in self.postings), key=len)
+        selective = [ids for ids in postings if len(ids) <= common] or postings[:3]
+        candidates = set().union(*selective) if selective else set()
+
+        needed = len(qgrams) * min_score
+        qlen = len(qgrams)
+        scored = []
+        for row_id in candidates:
+            shared = len(qgrams & self.grams[row_id])
+            if shared < needed:
+                continue
+            containment = shared / qlen
+            dice = 2.0 * shared / (qlen + len(self.grams[row_id]))
+            scored.append((0.8 * containment + 0.2 * dice, row_id))
+        scored.sort(key=lambda t: (-t[0], t[1]))
+        return [{'id': row_id, 'file_path': self.paths[row_id], 'score': round(score, 3)}
+                for score, row_id in scored[:limit]]
@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/thumb_cache.py
+#
+# In-process cache of thumbnail bytes for /gallery/thumbs/<file>.
+#
+# A gallery page pulls dozens of ~10 KB thumbnails, and send_from_directory
+# does a path join, a stat and an open for each of them. Here every
+# thumbnail is read once and kept as an immutable bytes object. Its ETag,
+# Last-Modified, length and mimetype are computed at the same time, so a
+# warm request is answered from memory without touching the filesystem. The
+# same bytes object backs every response (WSGI servers such as gunicorn only
+# accept bytes, not memoryview), so nothing is copied per request.
+#
+# Entries are re-stat()ed at most every THUMB_CACHE_CHECK_SECONDS and
+# reloaded if the file changed. The worker that writes a thumbnail drops its
+# entry at once. Memory use is bounded by THUMB_CACHE_MAX_BYTES, with the
+# least recently used thumbnails evicted first. Each worker pre-warms the
+# thumbnails of the THUMB_CACHE_WARM_GALLERIES most viewed galleries (from
+# the access log) in the background after its first request. Hits, misses
+# and reloads are counted in the metrics.
+
+import mimetypes
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.security import safe_join
+
+import metrics
+
+try:
+    import config
+except ImportError:
+    config = None
+
+THUMB_CACHE_MAX_BYTES = int(getattr(config, 'THUMB_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+THUMB_CACHE_CHECK_SECONDS = float(getattr(config, 'THUMB_CACHE_CHECK_SECONDS', 10))
+THUMB_CACHE_WARM_GALLERIES = int(getattr(config, 'THUMB_CACHE_WARM_GALLERIES', 5))
+# Where the generated thumbnails are written (gallery.THUMBS_DIR)
+THUMBS_DIR = (getattr(config, 'GALLERY_THUMBS_DIR', None)
+              or os.path.join(os.path.dirname(__file__), 'static', 'gallery', 'thumbs'))
+
+# Files larger than this are not thumbnails; they are served from disk
+_MAX_ENTRY_BYTES = 1024 * 1024
+# How far back the access log is searched for the most viewed galleries
+_WARM_DAYS = 7
+
+
+class ThumbEntry:
+    """One cached thumbnail and the headers that go with it."""
+
+    __slots__ = ('data', 'etag', 'mimetype', 'last_modified', 'mtime_ns', 'size', 'checked_at')
+
+    def __init__(self, data, st, mimetype, checked_at):
+        self.data = data
+        # same format as the native handlers in asgi.py
+        self.etag = f'{st.st_mtime_ns:x}-{st.st_size:x}'
+        self.mimetype = mimetype
+        self.last_modified = st.st_mtime
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.checked_at = checked_at
+
+
+class ThumbCache:
+    """Size-bounded LRU of thumbnail files keyed by their name in `directory`."""
+
+    def __init__(self, directory, max_bytes=THUMB_CACHE_MAX_BYTES, check_interval=THUMB_CACHE_CHECK_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._reset()
+
+    def _reset(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def _count(self, result):
+        if result == 'hit':
+            self.hits += 1
+        else:
+            self.misses += 1
+        metrics.inc('thumb_cache_total', {'result': result})
+
+    def peek(self, name):
+        """The entry if it is cached and was checked recently; never touches the disk."""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or time.monotonic() - entry.checked_at >= self.check_interval:
+                return None
+            self.entries.move_to_end(name)
+        self._count('hit')
+        return entry
+
+    def get(self, name):
+        """
+        The entry for thumbnail `name`, loaded or revalidated as needed.
+        None if the file does not exist or is too large to cache; the caller
+        then serves it from disk (or answers 404) as before.
+        """
+        entry = self.peek(name)
+        if entry is not None:
+            return entry
+        path = safe_join(self.directory, name)
+        if path is None:
+            return None
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(name)
+        if entry is not None:
+            try:
+                st = os.stat(path)
+            except OSError:
+                self.invalidate(name)
+                self._count('miss')
+                return None
+            if (st.st_mtime_ns, st.st_size) == (entry.mtime_ns, entry.size):
+                entry.checked_at = now
+                self._count('hit')
+                return entry
+        reloaded = entry is not None
+        entry = self._load(name, path, now)
+        self._count('reload' if reloaded and entry is not None else 'miss')
+        return entry
+
+    def _load(self, name, path, now):
+        try:
+            with open(path, 'rb') as fh:
+                st = os.fstat(fh.fileno())
+                if st.st_size > _MAX_ENTRY_BYTES:
+                    return None
+                data = fh.read()
+        except OSError:
+            self.invalidate(name)
+            return None
+        entry = ThumbEntry(data, st, mimetypes.guess_type(name)[0] or 'application/octet-stream', now)
+        self._store(name, entry)
+        return entry
+
+    def _store(self, name, entry):
+        with self.lock:
+            old = self.entries.pop(name, None)
+            change = len(entry.data) - (len(old.data) if old is not None else 0)
+            self.entries[name] = entry
+            self.size += change
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _name, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted.data)
+                change -= len(evicted.data)
+        metrics.gauge_add('thumb_cache_bytes', change)
+
+    def invalidate(self, name=None):
+        """Drop one thumbnail (after it was rewritten), or all of them."""
+        with self.lock:
+            if name is None:
+                change = -self.size
+                self.entries.clear()
+                self.size = 0
+            else:
+                old = self.entries.pop(name, None)
+                change = -len(old.data) if old is not None else 0
+                self.size += change
+        if change:
+            metrics.gauge_add('thumb_cache_bytes', change)
+
+    def warm(self, slugs):
+        """Load the thumbnails of the given galleries, until the cache is full."""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            return 0
+        wanted = [name for slug in slugs for name in names if name.startswith(f'{slug}__')]
+        loaded = 0
+        for name in wanted:
+            if name in self.entries:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if self.size + os.path.getsize(path) > self.max_bytes:
+                    break  # never evict to make room for a guess
+            except OSError:
+                continue
+            if self._load(name, path, time.monotonic()) is not None:
+                loaded += 1
+        metrics.inc('thumb_cache_warmed_total', value=loaded)
+        return loaded
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses,
+                    'hit_ratio': round(self.hits / lookups, 4) if lookups else None}
+
+
+thumb_cache = ThumbCache(THUMBS_DIR)
+
+
+def hottest_galleries(db, limit=THUMB_CACHE_WARM_GALLERIES):
+    """Slugs of the most viewed galleries over the last days, from the access log."""
+    since = (datetime.now(timezone.utc) - timedelta(days=_WARM_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+    rows = db.get_data("SELECT detail, COUNT(*) AS views FROM access_log"
+                       " WHERE event = %s AND ts >= %s AND detail IS NOT NULL"
+                       " GROUP BY detail ORDER BY views DESC LIMIT %s", ('gallery', since, int(limit)))
+    return [row['detail'] for row in rows]
+
+
+def warm_hottest(db, limit=THUMB_CACHE_WARM_GALLERIES):
+    try:
+        slugs = hottest_galleries(db, limit) if db is not None else []
+        loaded = thumb_cache.warm(slugs)
+        if loaded:
+            print(f"thumb_cache: pre-warmed {loaded} thumbnails of {', '.join(slugs)}", file=sys.stderr)
+    except Exception as e:  # warming is an optimization; never let it break a worker
+        print(f"Error pre-warming the thumbnail cache: {e}", file=sys.stderr)
+
+
+_warm_started = False
+
+
+def init_thumb_cache(app, db):
+    """Pre-warm each worker's cache in the background, after its first request."""
+    if THUMB_CACHE_WARM_GALLERIES <= 0:
+        return
+
+    def start_warming():
+        global _warm_started
+        if not _warm_started:
+            _warm_started = True
+            threading.Thread(target=warm_hottest, args=(db,), name='thumb-cache-warm', daemon=True).start()
+
+    app.before_request(start_warming)
+
+
+def _reset_after_fork():
+    # entries loaded in the master are fine to keep, but not its lock
+    global _warm_started
+    thumb_cache.lock = threading.Lock()
+    _warm_started = False
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
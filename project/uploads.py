@@ -0,0 +1,573 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# filename: /home/your_user/projects/site_starter/project/uploads.py
+#
+# Photo uploads for the gallery (POST /gallery/<slug>/upload, see gallery.py).
+#
+# The multipart body is parsed as it arrives (werkzeug's MultipartDecoder on
+# request.stream), so every file goes to disk in UPLOAD_CHUNK_SIZE chunks and
+# is never held in memory. A SHA-256 is computed while it streams. Three
+# kinds of file are rejected early:
+#   - a wrong extension, before any byte is written;
+#   - a file larger than UPLOAD_MAX_FILE_BYTES, as soon as it gets there;
+#   - content that is already in a gallery, as soon as its last chunk is in.
+#     The job checks again after refreshing the hash index. That catches
+#     images copied into a gallery by hand, and every upload that arrived
+#     before the index was first built.
+#
+# Each accepted file becomes a job on a small thread pool per worker
+# (UPLOAD_WORKERS), and the request returns at once with the job ids. A job:
+#   1. reads the EXIF metadata (camera, date taken, ...) into a JSON sidecar,
+#   2. makes the web derivative: rotated upright and scaled down to at most
+#      UPLOAD_MAX_DIMENSION pixels. The untouched original is kept.
+#   3. makes the thumbnail, and
+#   4. moves the derivative into the gallery folder. This comes last, so a
+#      gallery page never lists an image whose thumbnail is still missing.
+# Job states are JSON files in UPLOAD_DIR/jobs, so any worker can answer
+# GET /gallery/upload/jobs/<job_id>. They are removed UPLOAD_JOB_TTL seconds
+# after their last change.
+#
+# UPLOAD_DIR holds:
+#   tmp/          files being received and processed
+#   jobs/         one <job_id>.json per upload job
+#   originals/    the untouched originals
+#   metadata/     the JSON sidecars
+#   hashes.json   the content-hash index of every gallery image (HashIndex)
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+import metrics
+from fragment_cache import fragment_cache
+from thumb_cache import thumb_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: the hash index is only locked within one worker
+    fcntl = None
+
+try:
+    import config
+except ImportError:
+    config = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_DIR = getattr(config, 'UPLOAD_DIR', None) or os.path.join(BASE_DIR, 'uploads')
+UPLOAD_MIN_LEVEL = int(getattr(config, 'UPLOAD_MIN_LEVEL', 3))
+UPLOAD_MAX_FILE_BYTES = int(getattr(config, 'UPLOAD_MAX_FILE_BYTES', 50 * 1024 * 1024))
+UPLOAD_MAX_DIMENSION = int(getattr(config, 'UPLOAD_MAX_DIMENSION', 2048))
+UPLOAD_WORKERS = int(getattr(config, 'UPLOAD_WORKERS', 2))
+UPLOAD_JOB_TTL = float(getattr(config, 'UPLOAD_JOB_TTL', 24 * 3600))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Most bytes the multipart parser buffers: a chunk plus what it still has to
+# search for the next boundary, or one form field (larger ones get a 413)
+_PARSER_BUFFER = 16 * UPLOAD_CHUNK_SIZE
+JOBS_DIR = os.path.join(UPLOAD_DIR, 'jobs')
+# Expired job files are looked for at most this often per worker
+_JOB_PRUNE_SECONDS = 600
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# EXIF tags copied into the metadata sidecar (base IFD and Exif sub-IFD)
+_EXIF_IFD = 0x8769
+_EXIF_TAGS = {0x010F: 'make', 0x0110: 'model', 0x0112: 'orientation', 0x0132: 'datetime',
+              0x9003: 'datetime_original', 0x829A: 'exposure_time', 0x829D: 'f_number',
+              0x8827: 'iso', 0x920A: 'focal_length', 0xA434: 'lens_model'}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(UPLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashIndex:
+    """Content hashes of every gallery image, kept in a JSON file.
+
+    'files' maps 'slug/file' to [mtime_ns, size, sha256, sha256 of the upload
+    it was made from]. 'claims' maps the sha256 of an upload still being
+    processed to [job_id, 'slug/file']. refresh() brings 'files' in line with
+    the gallery folders. It runs from the upload jobs, never on a request:
+    it re-hashes only the files whose (mtime, size) changed, so files copied
+    in by hand are found too. Changes are serialized across threads and
+    workers with flock()ed lock files.
+    """
+
+    # claim() answer while the index has never been built
+    NOT_READY = object()
+
+    def __init__(self, path, gallery_root):
+        self.path = path
+        self.gallery_root = gallery_root
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as fh:
+                index = json.load(fh)
+        except (OSError, ValueError):
+            index = None
+        if not isinstance(index, dict) or 'files' not in index:
+            # missing, or a sha256 -> label dict from before 'files' existed
+            return {'built': False, 'files': {}, 'claims': {}}
+        return index
+
+    def _scan(self):
+        """{'slug/file': (mtime_ns, size, path)} of the images in the gallery folders."""
+        found = {}
+        for slug in sorted(os.listdir(self.gallery_root)):
+            folder = os.path.join(self.gallery_root, slug)
+            if slug == 'thumbs' or not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(folder, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    found[f'{slug}/{name}'] = (st.st_mtime_ns, st.st_size, path)
+        return found
+
+    def _change(self, change):
+        """Runs change(index) -> (result, dirty) under the lock; saves the index if dirty."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.lock, open(self.path + '.lock', 'a+b') as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            index = self._read()
+            result, dirty = change(index)
+            if dirty:
+                tmp = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp, 'w') as fh:
+                    json.dump(index, fh)
+                os.replace(tmp, self.path)
+            return result
+
+    def refresh(self):
+        """Hashes new and changed gallery images and forgets deleted ones.
+
+        Hashing happens outside the index lock, so uploads are never held up
+        by it; concurrent refreshes wait for each other and then find little
+        left to do.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self.refresh_lock, open(self.path + '.refresh', 'a+b') as lock_fh:
+            if fcntl is not None:
+                fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            known = self._read()['files']
+            current = self._scan()
+            fresh = {}
+            for label, (mtime_ns, size, path) in current.items():
+                entry = known.get(label)
+                if entry is not None and entry[:2] == [mtime_ns, size]:
+                    continue
+                try:
+                    fresh[label] = [mtime_ns, size, file_sha256(path), None]
+                except OSError:
+                    continue
+            gone = [label for label in known if label not in current]
+
+            def change(index):
+                files = index['files']
+                for label in gone:
+                    files.pop(label, None)
+                for label, entry in fresh.items():
+                    if files.get(label, [None, None])[:2] != entry[:2]:  # else set() was quicker
+                        files[label] = entry
+                dirty = bool(gone or fresh or not index['built'])
+                index['built'] = True
+                return len(fresh), dirty
+            hashed = self._change(change)
+        metrics.inc('upload_hashed_files_total', value=hashed)
+        return hashed
+
+    def claim(self, sha256, label, owner):
+        """Records the hash for job `owner`'s upload.
+
+        Returns the 'slug/file' already holding that content, None if the
+        content is new, or NOT_READY if the index has not been built yet.
+        """
+        def change(index):
+            if not index['built']:
+                return self.NOT_READY, False
+            for known, entry in index['files'].items():
+                if sha256 in entry[2:]:
+                    return known, False
+            claim = index['claims'].get(sha256)
+            if claim is not None:
+                return (None if claim[0] == owner else claim[1]), False
+            index['claims'][sha256] = [owner, label]
+            return None, True
+        return self._change(change)
+
+    def set(self, label, path, sha256, upload_sha256, owner):
+        """Records the image job `owner` put into a gallery, in place of its claim."""
+        st = os.stat(path)
+
+        def change(index):
+            if index['claims'].get(upload_sha256, [None])[0] == owner:
+                del index['claims'][upload_sha256]
+            index['files'][label] = [st.st_mtime_ns, st.st_size, sha256, upload_sha256]
+            return None, True
+        self._change(change)
+
+    def release(self, sha256, owner):
+        """Forgets job `owner`'s claim when its file never made it into a gallery."""
+        def change(index):
+            if index['claims'].get(sha256, [None])[0] != owner:
+                return None, False
+            del index['claims'][sha256]
+            return None, True
+        self._change(change)
+
+
+_index = None
+
+
+def hash_index():
+    global _index
+    if _index is None:
+        import gallery
+        _index = HashIndex(os.path.join(UPLOAD_DIR, 'hashes.json'), gallery.GALLERY_ROOT)
+    return _index
+
+
+# --- receiving ---
+
+class Incoming:
+    """One file part being written to UPLOAD_DIR/tmp while it is hashed."""
+
+    def __init__(self, filename, name):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename  # as sent by the client
+        self.name = name          # secure_filename() of it
+        self.path = os.path.join(UPLOAD_DIR, 'tmp', self.job_id + os.path.splitext(name)[1].lower())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fh = open(self.path, 'wb')
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.fh.write(data)
+        self.sha256.update(data)
+        self.size += len(data)
+
+    def close(self):
+        if not self.fh.closed:
+            self.fh.close()
+
+    def discard(self):
+        self.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def _reject(rejected, filename, reason, **details):
+    metrics.inc('uploads_total', {'outcome': reason})
+    rejected.append(dict({'file': filename, 'reason': reason}, **details))
+
+
+def receive_files(stream, boundary, slug):
+    """
+    Streams the file parts of a multipart/form-data body to disk.
+    Returns (accepted, rejected): Incoming objects whose hash was new and is
+    now claimed for this gallery, and {'file', 'reason', ...} dicts. Raises
+    ValueError if the body is malformed or cut short; files received so far
+    are then deleted.
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=_PARSER_BUFFER)
+    accepted, rejected = [], []
+    current = None  # the Incoming of the file part being received, if it is wanted
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                decoder.receive_data(chunk or None)  # None: the body has ended
+            elif isinstance(event, File):
+                name = secure_filename(event.filename or '')
+                if not name or not name.lower().endswith(IMAGE_EXTENSIONS):
+                    _reject(rejected, event.filename, 'bad_type')
+                else:
+                    current = Incoming(event.filename, name)
+            elif isinstance(event, Data):
+                if current is None:
+                    continue  # a form field, or a file part already rejected
+                current.write(event.data)
+                if current.size > UPLOAD_MAX_FILE_BYTES:
+                    current.discard()
+                    _reject(rejected, current.filename, 'too_large', max_bytes=UPLOAD_MAX_FILE_BYTES)
+                    current = None
+                elif not event.more_data:
+                    current.close()
+                    _finish(current, slug, accepted, rejected)
+                    current = None
+            elif isinstance(event, Epilogue):
+                return accepted, rejected
+            else:
+                current = None  # a plain form field
+    except BaseException:
+        if current is not None:
+            current.discard()
+        for incoming in accepted:
+            hash_index().release(incoming.sha256.hexdigest(), incoming.job_id)
+            incoming.discard()
+        raise
+
+
+def _finish(incoming, slug, accepted, rejected):
+    metrics.inc('upload_bytes_total', value=incoming.size)
+    existing = hash_index().claim(incoming.sha256.hexdigest(), f'{slug}/{incoming.name}', incoming.job_id)
+    if existing is HashIndex.NOT_READY:
+        existing = None  # the job checks it once the index is built
+    if existing is not None:
+        incoming.discard()
+        _reject(rejected, incoming.filename, 'duplicate', existing=existing)
+        return
+    metrics.inc('uploads_total', {'outcome': 'accepted'})
+    accepted.append(incoming)
+
+
+# --- background jobs ---
+
+_executor = None
+_executor_lock = threading.Lock()
+_jobs_pruned_at = 0.0
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, job_id + '.json')
+
+
+def get_job(job_id):
+    """The job's state dict, or None if it is unknown or expired."""
+    if not _JOB_ID.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as fh:
+            job = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if time.time() - job.get('updated_at', 0) > UPLOAD_JOB_TTL:
+        return None
+    return job
+
+
+def _set_job(job, **changes):
+    job.update(changes, updated_at=time.time())
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    # replaced in one step, so a poll never reads a half-written state
+    path = _job_path(job['id'])
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(job, fh)
+    os.replace(tmp, path)
+
+
+def prune_jobs(now=None):
+    """Deletes the job files (and stray temp files) older than UPLOAD_JOB_TTL."""
+    now = time.time() if now is None else now
+    removed = 0
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return 0
+    for name in names:
+        path = os.path.join(JOBS_DIR, name)
+        try:
+            if now - os.stat(path).st_mtime > UPLOAD_JOB_TTL:
+                os.unlink(path)
+                removed += 1
+        except OSError:
+            pass  # another worker got there first
+    return removed
+
+
+def submit(incoming, slug, folder, username=None):
+    """Queues the processing of a received file and returns its job id."""
+    global _executor, _jobs_pruned_at
+    job = {'id': incoming.job_id, 'gallery': slug, 'file': incoming.filename, 'size': incoming.size,
+           'sha256': incoming.sha256.hexdigest(), 'uploaded_by': username, 'status': 'queued',
+           'error': None, 'result': None, 'submitted_at': time.time()}
+    _set_job(job)
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(UPLOAD_WORKERS, thread_name_prefix='upload')
+        _executor.submit(process, job, incoming.path, incoming.name, folder)
+        if time.time() - _jobs_pruned_at > _JOB_PRUNE_SECONDS:
+            _jobs_pruned_at = time.time()
+            _executor.submit(prune_jobs)
+    return job['id']
+
+
+def image_metadata(im):
+    """Size, format and the interesting EXIF tags of an open Pillow image."""
+    meta = {'width': im.width, 'height': im.height, 'format': im.format, 'mode': im.mode}
+    try:
+        exif = im.getexif()
+        tags = dict(exif)
+        tags.update(exif.get_ifd(_EXIF_IFD))
+    except Exception:
+        tags = {}
+    for tag, key in _EXIF_TAGS.items():
+        value = tags.get(tag)
+        if value is None:
+            continue
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', 'replace').strip('\x00 ')
+        elif not isinstance(value, (int, str)):
+            value = str(value)
+        meta[key] = value
+    return meta
+
+
+def make_derivative(im, staged, meta):
+    """Writes the upright, scaled-down web copy next to `staged`; returns its path,
+    or `staged` itself when the upload can be served as it is."""
+    from PIL import ImageOps
+    too_big = UPLOAD_MAX_DIMENSION and max(im.size) > UPLOAD_MAX_DIMENSION
+    rotated = meta.get('orientation') not in (None, 1)
+    if im.format == 'GIF' or not (too_big or rotated):
+        return staged  # animated GIFs would lose their frames
+    root, ext = os.path.splitext(staged)
+    derivative = f'{root}.web{ext}'
+    web = ImageOps.exif_transpose(im)
+    if too_big:
+        web.thumbnail((UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION))
+    options = {'quality': 90} if im.format == 'JPEG' else {}
+    web.save(derivative, format=im.format, **options)
+    return derivative
+
+
+def _free_name(folder, name):
+    root, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while os.path.exists(os.path.join(folder, candidate)):
+        candidate = f'{root}-{n}{ext}'
+        n += 1
+    return candidate
+
+
+def _place(source, folder, name, slug, thumb_path):
+    """Moves `source` into the gallery folder without overwriting an image
+    added meanwhile; renames the thumbnail if the name had to change."""
+    import gallery
+    while True:
+        target = os.path.join(folder, name)
+        try:
+            os.link(source, target)  # fails if the name was taken since _free_name
+            os.unlink(source)
+            return name
+        except FileExistsError:
+            name = _free_name(folder, name)
+            new_thumb = os.path.join(gallery.THUMBS_DIR, f'{slug}__{name}')
+            os.replace(thumb_path, new_thumb)
+            thumb_path = new_thumb
+        except OSError:
+            # no hard links here (other filesystem); the small race is acceptable
+            shutil.move(source, target)
+            return name
+
+
+def process(job, staged, name, folder):
+    """Runs one upload job: metadata, derivative, thumbnail, then into the gallery."""
+    import gallery
+    from PIL import Image
+    slug = job['gallery']
+    start = time.perf_counter()
+    derivative = thumb_path = None
+    placed = False
+    _set_job(job, status='processing')
+    try:
+        # finds what the check on arrival could not: images copied into the
+        # gallery by hand since the last refresh, or any image while the
+        # index had not been built yet
+        index = hash_index()
+        index.refresh()
+        existing = index.claim(job['sha256'], f'{slug}/{name}', job['id'])
+        if existing is not None:
+            os.unlink(staged)
+            _set_job(job, status='failed', error='duplicate', existing=existing)
+            metrics.inc('upload_jobs_total', {'outcome': 'duplicate'})
+            return
+        with Image.open(staged) as im:
+            meta = image_metadata(im)
+            derivative = make_derivative(im, staged, meta)
+        name = _free_name(folder, name)
+        thumb_path = os.path.join(gallery.THUMBS_DIR, f'{slug}__{name}')
+        gallery.render_thumbnail(derivative, thumb_path)
+        name = _place(derivative, folder, name, slug, thumb_path)
+        placed = True
+        thumb_cache.invalidate(f'{slug}__{name}')
+        if derivative != staged:
+            original = os.path.join(UPLOAD_DIR, 'originals', slug, name)
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            os.replace(staged, original)
+        meta.update(sha256=job['sha256'], original_filename=job['file'], size=job['size'],
+                    uploaded_by=job['uploaded_by'], uploaded_at=job['submitted_at'],
+                    derivative=derivative != staged)
+        sidecar = os.path.join(UPLOAD_DIR, 'metadata', slug, name + '.json')
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        with open(sidecar, 'w') as fh:
+            json.dump(meta, fh, indent=1, sort_keys=True)
+        image = os.path.join(folder, name)
+        index.set(f'{slug}/{name}', image, job['sha256'] if derivative == staged else file_sha256(image),
+                  job['sha256'], job['id'])
+        # other workers see the new folder mtime; this one can free the old pages now
+        fragment_cache.invalidate('gallery', slug)
+        _set_job(job, status='done', result={'file': name, 'metadata': meta})
+        metrics.inc('upload_jobs_total', {'outcome': 'ok'})
+    except Exception as e:
+        print(f"Error processing upload {job['id']} ({slug}/{job['file']}): {e}", file=sys.stderr)
+        if not placed:
+            for path in (staged, derivative, thumb_path):
+                if path:
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+            hash_index().release(job['sha256'], job['id'])
+        _set_job(job, status='failed', error=str(e))
+        metrics.inc('upload_jobs_total', {'outcome': 'error'})
+    finally:
+        metrics.observe('upload_job_duration_seconds', time.perf_counter() - start)
+
+
+def shutdown(wait=True):
+    """Finishes the queued jobs (worker exit)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _reset_after_fork():
+    # the parent's pool threads (and any lock they held) do not exist in the child
+    global _executor, _executor_lock, _index
+    _executor = None
+    _executor_lock = threading.Lock()
+    _index = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
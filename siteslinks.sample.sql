@@ -51,6 +51,24 @@ INSERT INTO `siteslinks` (`id`, `title`, `link`, `level`, `comment`) VALUES
 (7, 'File Browser', 'http://files.your_domain', '3', 'File Browser (Admin Only)'),
 (8, 'Admin Panel', 'https://admin.your_domain/', '3', 'Admin Panel (Admin Only)');
 
+--
+-- Table structure for table `access_log`
+-- Audit log written in batches by project/access_log.py
+--
+DROP TABLE IF EXISTS `access_log`;
+
+CREATE TABLE `access_log` (
+  `id` bigint(20) NOT NULL,
+  `ts` datetime NOT NULL,
+  `user_id` int(11) DEFAULT NULL,
+  `username` varchar(64) DEFAULT NULL,
+  `event` varchar(32) NOT NULL,
+  `path` varchar(255) DEFAULT NULL,
+  `detail` varchar(255) DEFAULT NULL,
+  `status` smallint(6) DEFAULT NULL,
+  `ip` varchar(45) DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
 --
 -- Indexes for dumped tables
 --
@@ -61,6 +79,14 @@ INSERT INTO `siteslinks` (`id`, `title`, `link`, `level`, `comment`) VALUES
 ALTER TABLE `siteslinks`
   ADD PRIMARY KEY (`id`);
 
+--
+-- Indexes for table `access_log`
+--
+ALTER TABLE `access_log`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `ts` (`ts`),
+  ADD KEY `user_ts` (`user_id`,`ts`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -70,6 +96,12 @@ ALTER TABLE `siteslinks`
 --
 ALTER TABLE `siteslinks`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=9;
+
+--
+-- AUTO_INCREMENT for table `access_log`
+--
+ALTER TABLE `access_log`
+  MODIFY `id` bigint(20) NOT NULL AUTO_INCREMENT;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;